@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+
+import torch
+
+
+class BatchPrefetcher:
+    """
+    Background assembly of replay batches ahead of the learner.
+
+    A worker thread samples the replay buffer and concatenates the sampled
+    experiences into contiguous batch tensors, in pinned memory when the
+    frames live on the CPU and the learner on CUDA, so next() only issues
+    non-blocking copies to the device. Batches are sampled up to depth
+    updates ahead, so they may miss the newest few experiences.
+
+    Args:
+        memory (ReplayBuffer): The replay buffer (or CompressedReplayBuffer).
+        batch_size (int): Number of experiences per batch.
+        device (torch.device): Device of the learner.
+        depth (int): Number of batches assembled ahead.
+
+    Attributes:
+        wait_time (float): Seconds next() waited for a batch in the current episode.
+        updates (int): Number of batches handed out in the current episode.
+    """
+
+    def __init__(self, memory, batch_size, device, depth=2):
+        self.memory = memory
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.wait_time = 0.0
+        self.updates = 0
+        self._pin = self.device.type == "cuda"
+        self._ready = queue.Queue(maxsize=depth)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def next(self):
+        """
+        Take the next batch, copied to the learner's device without blocking.
+
+        Returns:
+            tuple or None: State, action, reward, next state and done batches,
+                None while the replay buffer holds less than a batch.
+        """
+        if self._ready.empty() and self.memory.size() < self.batch_size:
+            return None
+        wait_start = time.perf_counter()
+        batch = self._ready.get()
+        self.wait_time += time.perf_counter() - wait_start
+        self.updates += 1
+        return tuple(tensor.to(self.device, non_blocking=True) for tensor in batch)
+
+    def episode_summary(self, learner_time):
+        """
+        Summarize how the learner's time split between waiting for data and computing, and reset the counters.
+
+        Args:
+            learner_time (float): Seconds spent in the learner step during the episode.
+
+        Returns:
+            str: Updates, wait and compute time per update and the waiting share.
+        """
+        updates = max(self.updates, 1)
+        compute_time = max(learner_time - self.wait_time, 0.0)
+        text = (
+            f"Learner: {self.updates} updates, waited {self.wait_time / updates * 1000:.2f} ms and computed "
+            f"{compute_time / updates * 1000:.2f} ms per update "
+            f"({self.wait_time / max(learner_time, 1e-9) * 100:.1f}% waiting on data)"
+        )
+        self.wait_time = 0.0
+        self.updates = 0
+        return text
+
+    def _run(self):
+        while True:
+            if self.memory.size() < self.batch_size:
+                time.sleep(0.005)
+                continue
+            states, actions, rewards, next_states, dones = zip(*self.memory.sample(self.batch_size))
+            self._ready.put(
+                (
+                    self._stack(states),
+                    torch.tensor(actions, dtype=torch.int64),
+                    torch.tensor(rewards, dtype=torch.float32),
+                    self._stack(next_states),
+                    torch.tensor(dones, dtype=torch.bool),
+                )
+            )
+
+    def _stack(self, frames):
+        # concatenate straight into pinned memory, avoiding a second host copy
+        if not self._pin or frames[0].is_cuda:
+            return torch.cat(frames)
+        out = torch.empty((len(frames),) + tuple(frames[0].shape[1:]), dtype=frames[0].dtype, pin_memory=True)
+        return torch.cat(frames, out=out)
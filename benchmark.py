@@ -0,0 +1,510 @@
+import argparse
+import fnmatch
+import json
+import math
+import os
+import platform
+import statistics
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from learner import ReplayBuffer, optimize_model
+from model import NUM_ACTIONS, DuelingDDQN, create_networks
+from profiler import PhaseProfiler
+
+
+"""
+Simulated backend
+"""
+
+
+class SimulatedImage:
+    """
+    Camera image with the raw BGRA bytes of a frame, as passed to sensor callbacks.
+
+    Args:
+        frame (np.ndarray): BGRA frame (H, W, 4), exposed as a flat uint8 buffer like carla.Image.raw_data.
+    """
+
+    def __init__(self, frame):
+        self.raw_data = memoryview(frame.reshape(-1))
+
+
+class SimulatedActor:
+    """
+    Vehicle moving with simple kinematics on a straight multi-lane road along the x axis.
+
+    Args:
+        actor_id (int): Actor id.
+        x (float): Initial x position in meters.
+        y (float): Initial y position in meters.
+        speed (float): Initial speed in m/s.
+    """
+
+    def __init__(self, actor_id, x, y, speed):
+        import carla
+
+        self._carla = carla
+        self.id = actor_id
+        self.type_id = "vehicle.tesla.model3"
+        self.is_alive = True
+        self.x = x
+        self.y = y
+        self.yaw = 0.0
+        self.speed = speed
+        self.throttle = 0.0
+        self.steer = 0.0
+
+    def apply_control(self, control):
+        self.throttle = control.throttle
+        self.steer = control.steer
+
+    def advance(self, dt):
+        self.speed = max(0.0, self.speed + (4.0 * self.throttle - 0.05 * self.speed) * dt)
+        self.yaw = max(-30.0, min(30.0, 0.9 * self.yaw + 40.0 * self.steer * dt))
+        self.x += self.speed * math.cos(math.radians(self.yaw)) * dt
+        # lateral drift is bounded so long benchmarks stay on the road
+        self.y = max(-1.5, min(5.0, self.y + self.speed * math.sin(math.radians(self.yaw)) * dt))
+
+    def get_location(self):
+        return self._carla.Location(x=self.x, y=self.y, z=0.0)
+
+    def get_transform(self):
+        return self._carla.Transform(self.get_location(), self._carla.Rotation(pitch=0.0, yaw=self.yaw, roll=0.0))
+
+    def get_velocity(self):
+        radians = math.radians(self.yaw)
+        return self._carla.Vector3D(self.speed * math.cos(radians), self.speed * math.sin(radians), 0.0)
+
+
+class SimulatedActorList(list):
+    """
+    List of actors with the filter() of carla.ActorList.
+    """
+
+    def filter(self, pattern):
+        return SimulatedActorList(actor for actor in self if fnmatch.fnmatch(actor.type_id, pattern))
+
+
+class SimulatedWaypoint:
+    """
+    Lane center waypoint with the attributes the reward functions read.
+    """
+
+    def __init__(self, transform, lane_width, marking_type):
+        self.transform = transform
+        self.lane_width = lane_width
+        self.left_lane_marking = SimpleNamespace(type=marking_type)
+        self.right_lane_marking = SimpleNamespace(type=marking_type)
+
+
+class SimulatedMap:
+    """
+    Straight road along the x axis with lanes centered at y = 0, 3.5, ...
+
+    Args:
+        lanes (int): Number of lanes.
+        lane_width (float): Lane width in meters.
+    """
+
+    def __init__(self, lanes=2, lane_width=3.5):
+        import carla
+
+        self._carla = carla
+        self.name = "Simulated"
+        self.lanes = lanes
+        self.lane_width = lane_width
+
+    def get_waypoint(self, location, project_to_road=True, lane_type=None):
+        lane = min(max(int(round(location.y / self.lane_width)), 0), self.lanes - 1)
+        transform = self._carla.Transform(
+            self._carla.Location(x=location.x, y=lane * self.lane_width, z=0.0), self._carla.Rotation(yaw=0.0)
+        )
+        return SimulatedWaypoint(transform, self.lane_width, self._carla.LaneMarkingType.Broken)
+
+
+class SimulatedWorld:
+    """
+    Synchronous world: every tick advances the vehicles and delivers a camera frame to the sensor callback.
+
+    Args:
+        width (int): Camera image width.
+        height (int): Camera image height.
+        npcs (int): Number of NPC vehicles ahead of the ego vehicle.
+        delta (float): Fixed simulation step in seconds.
+        seed (int): Seed of the frame contents and NPC placement.
+    """
+
+    def __init__(self, width=640, height=480, npcs=10, delta=0.05, seed=0):
+        generator = np.random.default_rng(seed)
+        self.delta = delta
+        self.ego = SimulatedActor(1, 0.0, 0.0, 5.0)
+        self.npcs = [
+            SimulatedActor(100 + i, 15.0 + 12.0 * i, 3.5 * (i % 2), float(generator.uniform(2.0, 6.0)))
+            for i in range(npcs)
+        ]
+        # a few prerendered frames, cycled so decoding does not hit the same memory every tick
+        self.frames = [generator.integers(0, 256, (height, width, 4), dtype=np.uint8) for _ in range(4)]
+        self.camera_callback = None
+        self.frame = 0
+
+    def tick(self):
+        for actor in [self.ego] + self.npcs:
+            actor.advance(self.delta)
+        self.frame += 1
+        if self.camera_callback is not None:
+            self.camera_callback(SimulatedImage(self.frames[self.frame % len(self.frames)]))
+        return self.frame
+
+    def get_actors(self):
+        return SimulatedActorList([self.ego] + self.npcs)
+
+    def get_settings(self):
+        return SimpleNamespace(fixed_delta_seconds=self.delta, synchronous_mode=True)
+
+
+class SimulatedTraffic:
+    """
+    Stand-in for TrafficLOD that only ticks the world.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.npcs = world.npcs
+
+    def tick(self, ego):
+        tick_start = time.perf_counter()
+        self.world.tick()
+        return time.perf_counter() - tick_start
+
+
+def simulated_environment(reward_function=5, width=640, height=480, npcs=10):
+    """
+    Build an Environment on the simulated backend, without a CARLA server.
+
+    The constructor, which connects to the simulator and spawns actors, is
+    skipped; the attributes step() and the reward functions use are set up
+    directly. The carla Python package is still needed for its data types.
+
+    Args:
+        reward_function (int): Reward function used by step().
+        width (int): Camera image width.
+        height (int): Camera image height.
+        npcs (int): Number of NPC vehicles.
+
+    Returns:
+        Environment: The environment, with a first camera frame.
+    """
+    from carla_lane_keeping_d3qn import Environment
+
+    world = SimulatedWorld(width, height, npcs)
+    env = Environment.__new__(Environment)
+    env.world = world
+    env.map = SimulatedMap()
+    env.vehicle = world.ego
+    env.traffic = SimulatedTraffic(world)
+    env.sensor_config = {"image_size_x": width, "image_size_y": height, "fov": 90}
+    env.rf = reward_function
+    env.lanes = None
+    env.snapshots = None
+    env.profiler = PhaseProfiler(enabled=False)
+    env.collision_detected = False
+    env.overtook = False
+    env.steps = 0
+    env.distance = 0
+    env.prev_xy = np.zeros(2)
+    env.throttle = env.steer = 0.0
+    env.image = None
+    world.camera_callback = env.process_image
+    world.tick()
+    return env
+
+
+"""
+Benchmarks
+"""
+
+
+def measure(function, repeats, warmup=3, synchronize=False, min_sample=0.002):
+    """
+    Time repeated calls of a function.
+
+    Calls faster than min_sample are timed in loops of several calls, so that
+    timer resolution and scheduling noise do not dominate microsecond timings.
+
+    Args:
+        function (callable): The benchmarked call.
+        repeats (int): Number of timed samples.
+        warmup (int): Number of untimed calls before.
+        synchronize (bool): Wait for CUDA kernels after every sample.
+        min_sample (float): Minimum duration of one sample in seconds.
+
+    Returns:
+        dict: Median, p90 and mean milliseconds per call, calls per second, the number of samples
+            and the calls per sample.
+    """
+    for _ in range(warmup):
+        function()
+    if synchronize:
+        torch.cuda.synchronize()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        if synchronize:
+            torch.cuda.synchronize()
+        if time.perf_counter() - start >= min_sample:
+            break
+        number *= 10
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        if synchronize:
+            torch.cuda.synchronize()
+        times.append((time.perf_counter() - start) / number)
+    median = statistics.median(times)
+    return {
+        "median_ms": median * 1000,
+        "p90_ms": float(np.percentile(times, 90)) * 1000,
+        "mean_ms": statistics.fmean(times) * 1000,
+        "per_second": 1.0 / median if median > 0 else float("inf"),
+        "runs": repeats,
+        "calls_per_run": number,
+    }
+
+
+def selected(name, selection):
+    """
+    Check whether a benchmark is part of a selection.
+
+    Args:
+        name (str): Benchmark name.
+        selection (str or None): Comma separated parts of names, None for all benchmarks.
+
+    Returns:
+        bool: True if no selection is given or the name contains one of its parts.
+    """
+    return not selection or any(part in name for part in selection.split(","))
+
+
+def model_benchmarks(device, selection=None, batch_sizes=(1, 32), resolutions=((480, 640), (240, 320))):
+    """
+    Benchmark DuelingDDQN inference and a forward/backward/optimizer step.
+
+    Yields:
+        tuple: Benchmark name and a callable running it once, for the selected benchmarks only.
+    """
+    for height, width in resolutions:
+        names = {
+            batch_size: [f"model.{kind}[b{batch_size},{width}x{height}]" for kind in ("forward", "train_step")]
+            for batch_size in batch_sizes
+        }
+        if not any(selected(name, selection) for batch_names in names.values() for name in batch_names):
+            continue
+        network = DuelingDDQN(NUM_ACTIONS, image_dim=(height, width)).to(device)
+        optimizer = torch.optim.Adam(network.parameters(), lr=1e-5)
+        for batch_size in batch_sizes:
+            forward_name, train_step_name = names[batch_size]
+            if not (selected(forward_name, selection) or selected(train_step_name, selection)):
+                continue
+            states = torch.randint(0, 256, (batch_size, 3, height, width), dtype=torch.uint8, device=device)
+
+            def forward(network=network, states=states):
+                with torch.no_grad():
+                    network(states)
+
+            def train_step(network=network, optimizer=optimizer, states=states):
+                loss = network(states).mean()
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+            if selected(forward_name, selection):
+                yield forward_name, forward
+            if selected(train_step_name, selection):
+                yield train_step_name, train_step
+
+
+def replay_benchmarks(selection=None, capacities=(1000, 10000, 100000), batch_size=32):
+    """
+    Benchmark ReplayBuffer.store and sample on a full buffer.
+
+    Yields:
+        tuple: Benchmark name and a callable running it once, for the selected benchmarks only.
+    """
+    frame = torch.zeros((1, 480, 640, 3), dtype=torch.uint8)  # shared, only references are stored
+    for capacity in capacities:
+        if not any(selected(f"replay.{kind}[{capacity}]", selection) for kind in ("store", "sample")):
+            continue
+        buffer = ReplayBuffer(capacity)
+        for i in range(capacity):
+            buffer.store((frame, i % NUM_ACTIONS, 0.0, frame, False))
+        if selected(f"replay.store[{capacity}]", selection):
+            yield f"replay.store[{capacity}]", lambda buffer=buffer: buffer.store((frame, 0, 0.0, frame, False))
+        if selected(f"replay.sample[{capacity}]", selection):
+            yield f"replay.sample[{capacity}]", lambda buffer=buffer: buffer.sample(batch_size)
+
+
+def optimize_benchmarks(device, selection=None, batch_size=32, fill=1000):
+    """
+    Benchmark optimize_model end-to-end: sampling, batching, copying to the device and the update.
+
+    Yields:
+        tuple: Benchmark name and a callable running it once, for the selected benchmarks only.
+    """
+    if not selected(f"optimize_model[b{batch_size}]", selection):
+        return
+    network, target_network, optimizer = create_networks(device)
+    generator = np.random.default_rng(0)
+    frames = [torch.from_numpy(generator.integers(0, 256, (1, 480, 640, 3), dtype=np.uint8)) for _ in range(64)]
+    buffer = ReplayBuffer(10000)
+    for i in range(fill):
+        buffer.store((frames[i % 64], i % NUM_ACTIONS, float(generator.normal()), frames[(i + 1) % 64], False))
+    yield f"optimize_model[b{batch_size}]", lambda: optimize_model(
+        buffer, batch_size, 0.99, network, target_network, optimizer
+    )
+
+
+def environment_benchmarks(selection=None, reward_functions=(1, 5)):
+    """
+    Benchmark camera frame decoding and Environment.step on the simulated backend.
+
+    Yields:
+        tuple: Benchmark name and a callable running it once, for the selected benchmarks only.
+    """
+    if selected("env.process_image[640x480]", selection):
+        env = simulated_environment()
+        image = SimulatedImage(env.world.frames[0])
+        yield "env.process_image[640x480]", lambda: env.process_image(image)
+    for reward_function in reward_functions:
+        if not selected(f"env.step[reward {reward_function}]", selection):
+            continue
+        env = simulated_environment(reward_function)
+        action = (0.5, 0.0)
+        yield f"env.step[reward {reward_function}]", lambda env=env: env.step(action)
+
+
+def run_benchmarks(selection=None, repeats=50):
+    """
+    Run the benchmark suite.
+
+    Args:
+        selection (str, optional): Only run benchmarks whose name contains this text.
+        repeats (int): Timed calls per benchmark (a fifth of it for the model train steps).
+
+    Returns:
+        dict: "meta" (environment description), "results" (name to timings) and "skipped" (name to reason).
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    synchronize = device.type == "cuda"
+    # suites only set up the selected benchmarks, so a filtered run never pays for (or fails on) the others
+    suites = [
+        ("model", lambda: model_benchmarks(device, selection)),
+        ("replay", lambda: replay_benchmarks(selection)),
+        ("optimize", lambda: optimize_benchmarks(device, selection)),
+        ("env", lambda: environment_benchmarks(selection)),
+    ]
+    results = {}
+    skipped = {}
+    for suite, benchmarks in suites:
+        try:
+            for name, function in benchmarks():
+                count = max(5, repeats // 5) if "train_step" in name or "optimize" in name else repeats
+                results[name] = measure(function, count, synchronize=synchronize)
+                print(f"{name:<40}{results[name]['median_ms']:>10.4f} ms{results[name]['per_second']:>12.1f}/s")
+        except ImportError as error:
+            # the environment suite needs the carla and OpenCV packages (not a running server)
+            skipped[suite] = str(error)
+            print(f"{suite} benchmarks skipped: {error}")
+    meta = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "device": torch.cuda.get_device_name(0) if device.type == "cuda" else platform.processor() or platform.machine(),
+        "threads": torch.get_num_threads(),
+        "repeats": repeats,
+        "filter": selection,
+    }
+    return {"meta": meta, "results": results, "skipped": skipped}
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compare benchmark results against a baseline.
+
+    Args:
+        results (dict): Results of run_benchmarks.
+        baseline (dict): Baseline results in the same format.
+        threshold (float): Allowed relative slowdown of the median time before a benchmark fails.
+
+    Baseline benchmarks missing from the results fail the comparison (e.g. a
+    suite skipped for a missing package), unless the results were filtered
+    to exclude them.
+
+    Returns:
+        tuple: Report lines and whether all baseline benchmarks ran and passed.
+    """
+    selection = results["meta"].get("filter")
+    lines = [f"{'benchmark':<40}{'baseline ms':>12}{'current ms':>12}{'change':>9}  result"]
+    passed = True
+    for name, current in results["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            lines.append(f"{name:<40}{'-':>12}{current['median_ms']:>12.4f}{'':>9}  new")
+            continue
+        change = current["median_ms"] / max(reference["median_ms"], 1e-9) - 1
+        if change > threshold:
+            result = "FAIL"
+            passed = False
+        else:
+            result = "faster" if change < -threshold else "ok"
+        lines.append(
+            f"{name:<40}{reference['median_ms']:>12.4f}{current['median_ms']:>12.4f}{change * 100:>8.1f}%  {result}"
+        )
+    for name in baseline["results"]:
+        if name not in results["results"]:
+            if not selected(name, selection):
+                result = "filtered"
+            else:
+                result = "MISSING"
+                passed = False
+            lines.append(f"{name:<40}{baseline['results'][name]['median_ms']:>12.4f}{'-':>12}{'':>9}  {result}")
+    return lines, passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the training hot paths without a CARLA server")
+    parser.add_argument("--output", type=str, nargs=1, help="JSON file the results are written to", required=False)
+    parser.add_argument("--baseline", type=str, nargs=1, help="JSON results to compare against", required=False)
+    parser.add_argument(
+        "--threshold",
+        type=str,
+        nargs=1,
+        help="Allowed relative slowdown of the median before a benchmark fails (default 0.1)",
+        required=False,
+    )
+    parser.add_argument(
+        "--filter", type=str, nargs=1, help="Only run benchmarks containing one of these comma separated names", required=False
+    )
+    parser.add_argument("--repeats", type=str, nargs=1, help="Timed calls per benchmark (default 50)", required=False)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.filter[0] if args.filter else None, int(args.repeats[0]) if args.repeats else 50)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output[0])), exist_ok=True)
+        with open(args.output[0], "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output[0]}")
+    if args.baseline:
+        with open(args.baseline[0], "r") as file:
+            baseline = json.load(file)
+        lines, passed = compare(results, baseline, float(args.threshold[0]) if args.threshold else 0.1)
+        print("\n".join(lines))
+        print("PASS" if passed else "FAIL")
+        raise SystemExit(0 if passed else 1)
@@ -1,21 +1,39 @@
-import argparse
-from collections import deque, namedtuple
+from cli import build_parser
+
+if __name__ == "__main__":
+    # parsed before the heavy imports below, so --help and usage errors return immediately
+    args = build_parser().parse_args()
+
 import random
 import numpy as np
 import carla
 import time
 from copy import deepcopy
 import torch
-import torch.nn as nn
-import torch.nn.functional as F
-import matplotlib.pyplot as plt
 import math
-import cv2
-import sys
-from PIL import Image
-import csv
 import os
 
+from batch_prefetcher import BatchPrefetcher
+from checkpoint import CheckpointWriter, load_checkpoint, save_checkpoint
+from compressed_replay import CompressedReplayBuffer
+from expert import LaneFollowingExpert, load_warm_start, save_warm_start, steps_to_reward, warm_start
+from feature_cache import MIN_HIT_RATE, TargetFeatureCache, expected_hit_rate
+from hud_display import HUDDisplay
+from lane_raster import LaneRaster
+from learner import ReplayBuffer, optimize_model, update_network
+from memory_budget import MemoryMonitor
+from metrics_store import MetricsRecorder
+from model import NUM_ACTIONS, DuelingDDQN, create_networks
+from offline_dataset import DatasetWriter, OfflineDataset
+from profiler import PhaseProfiler, format_profile
+from scenario_pool import ScenarioPool
+from simulator import DEFAULT_MAP, get_client, get_world_data, load_world
+from snapshots import SnapshotLibrary, restore_snapshot
+from telemetry import TrainingTelemetry
+from traffic_lod import TrafficLOD
+from trajectory import TrajectoryRecorder, replay_trajectory
+from video_recorder import EpisodeVideoRecorder
+
 
 """
 Global Variable List
@@ -25,347 +43,16 @@ start_time = 0
 num_ep = 0
 reward_num = 0
 
-"""
-Replay buffer class
-"""
-NUM_ACTIONS = 45
-
-
-# Carla Client attribute
-client = carla.Client("localhost", 2000)
-client.set_timeout(5.0)  # Set a timeout in seconds for client connection
-print("Client established")
-
-
-class DuelingDDQN(nn.Module):
-    """
-    Dueling Double Deep Q-Network (DDQN) model for reinforcement learning.
-
-    This neural network model predicts Q-values for each action given a state.
-
-    Args:
-        action_dim (int): Dimensionality of the action space.
-        image_dim (tuple): Dimensions of the input image (height, width).
-
-    Attributes:
-        conv1 (nn.Conv2d): First convolutional layer.
-        pool1 (nn.MaxPool2d): First max pooling layer.
-        conv2 (nn.Conv2d): Second convolutional layer.
-        pool2 (nn.MaxPool2d): Second max pooling layer.
-        conv3 (nn.Conv2d): Third convolutional layer.
-        pool3 (nn.MaxPool2d): Third max pooling layer.
-        flatten_size (int): Size of the flattened output of the final convolutional layer.
-        fc1 (nn.Linear): Fully connected layer.
-        value_stream (nn.Linear): Linear layer for the value stream.
-        advantage_stream (nn.Linear): Linear layer for the advantage stream.
-    """
-    
-    def __init__(self, action_dim, image_dim=(480, 640)):
-        super(DuelingDDQN, self).__init__()
-        # Convolutional and pooling layers
-        self.conv1 = nn.Conv2d(3, 32, kernel_size=8, stride=4)
-        self.pool1 = nn.MaxPool2d(kernel_size=2, stride=2)
-        self.conv2 = nn.Conv2d(32, 64, kernel_size=4, stride=2)
-        self.pool2 = nn.MaxPool2d(kernel_size=2, stride=2)
-        self.conv3 = nn.Conv2d(64, 64, kernel_size=3, stride=1)
-        self.pool3 = nn.MaxPool2d(kernel_size=2, stride=2)
-
-        # Flatten the output of the final convolutional layer
-        self.flatten_size = self._get_conv_output((3, image_dim[0], image_dim[1]))
-
-        # Fully connected layers
-        self.fc1 = nn.Linear(self.flatten_size, 512)
-
-        # State Value stream
-        self.value_stream = nn.Linear(512, 1)
-
-        # Advantage stream
-        self.advantage_stream = nn.Linear(512, action_dim)
-
-    def _get_conv_output(self, shape):
-        """
-        Compute the size of the flattened output of the final convolutional layer.
-
-        Args:
-            shape (tuple): Shape of the input tensor (channels, height, width).
-
-        Returns:
-            int: Size of the flattened output.
-        """
-        with torch.no_grad():
-            input = torch.zeros(1, *shape)
-            output = self.conv1(input)
-            output = self.pool1(output)
-            output = self.conv2(output)
-            output = self.pool2(output)
-            output = self.conv3(output)
-            output = self.pool3(output)
-            return int(np.prod(output.size()))
-
-    def forward(self, state):
-        """
-        Forward pass of the neural network.
-
-        Args:
-            state (torch.Tensor): Input state tensor.
-
-        Returns:
-            torch.Tensor: Predicted Q-values for each action.
-        """
-        # Convert state to float and scale if necessary
-        state = state.float() / 255.0  # Scale images to [0, 1]
-
-        x = F.relu(self.pool1(self.conv1(state)))
-        x = F.relu(self.pool2(self.conv2(x)))
-        x = F.relu(self.pool3(self.conv3(x)))
-
-        # Flatten and pass through fully connected layer
-        x = x.reshape(x.size(0), -1)
-        x = F.relu(self.fc1(x))
-
-        # Value and advantage streams
-        value = self.value_stream(x)
-        advantage = self.advantage_stream(x)
-
-        # Combine to get Q-values
-
-        q_values = value + advantage - advantage.mean(dim=1, keepdim=True)
-        #      print(f'Shapes of network, Value{value.shape}, advantage{advantage.shape}, q_values{q_values.shape}')
-        return q_values
+# list of ideal spawn indexes (Town04) for NPCs in the overtaking scenarios
+IDEAL_SPAWNS = [37, 39, 40, 366, 367, 365, 263, 33, 35, 36, 312, 313, 314, 315, 49, 50, 51, 52, 45, 46, 47, 48, 41, 42, 43, 44, 278, 279, 280, 281 ]
 
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-network = DuelingDDQN(NUM_ACTIONS).to(device)
-target_network = deepcopy(network)
-
-optimizer = torch.optim.Adam(network.parameters(), lr=1e-5)
-loss_fn = nn.SmoothL1Loss()  # huber loss
-
-
-class ReplayBuffer:
-    """
-    Replay buffer for experience replay in reinforcement learning.
-
-    This buffer stores experiences and provides methods for storing,
-    sampling, and retrieving experiences for training.
-
-    Args:
-        capacity (int): Maximum capacity of the replay buffer.
-
-    Attributes:
-        buffer (deque): Deque containing the stored experiences.
-    """
-    
-    def __init__(self, capacity):
-        """
-        Initialize the replay buffer with a given capacity.
-
-        Args:
-            capacity (int): Maximum capacity of the replay buffer.
-        """
-        self.buffer = deque(maxlen=capacity)
-
-    def store(self, experience):
-        """
-        Store a new experience in the replay buffer.
-
-        Args:
-            experience: The experience to be stored in the buffer.
-        """
-        self.buffer.append(experience)
-
-    def sample(self, batch_size):
-        """
-        Sample a batch of experiences from the replay buffer.
-
-        Args:
-            batch_size (int): Number of experiences to sample.
-
-        Returns:
-            list: A list containing the sampled experiences.
-        """
-        return random.sample(self.buffer, batch_size)
-
-    def size(self):
-        """
-        Get the current size of the replay buffer.
-
-        Returns:
-            int: The current number of experiences stored in the buffer.
-        """    
-        return len(self.buffer)
-
-
-class HUD:
-    """
-    Heads-Up Display (HUD) for visualizing information on camera images.
-
-    This class manages the HUD elements such as speed, throttle, steer,
-    heading, location, collision, and nearby vehicles, and provides methods
-    for updating and rendering these elements on camera images.
-
-    Args:
-        width (int): Width of the camera image.
-        height (int): Height of the camera image.
-
-    Attributes:
-        dim (tuple): Dimension of the camera image (width, height).
-        font: Font used for rendering text on the HUD.
-        font_scale (float): Scale factor for adjusting font size.
-        font_color (tuple): Color of the text rendered on the HUD.
-        line_height (int): Height of each line of text.
-        x_offset (int): Horizontal offset for positioning HUD elements.
-        y_offset (int): Vertical offset for positioning HUD elements.
-        speed (float): Current speed of the vehicle.
-        throttle (float): Current throttle value.
-        steer (float): Current steering angle.
-        heading (str): Current heading of the vehicle.
-        location (str): Current location of the vehicle.
-        collision (list): List of collision information.
-        nearby_vehicles (list): List of nearby vehicles.
-    """
-    
-    def __init__(self, width, height):
-        self.dim = (width, height)
-        self.font = cv2.FONT_HERSHEY_SIMPLEX
-        self.font_scale = 0.5
-        self.font_color = (255, 255, 255)
-        self.line_height = 20
-        self.x_offset = 10
-        self.y_offset = 20
-        self.speed = 0
-        self.throttle = 0
-        self.steer = 0
-        self.heading = ""
-        self.location = ""
-        self.collision = []
-        self.nearby_vehicles = []
-
-    def update(
-        self, speed, throttle, steer, heading, location, collision, nearby_vehicles
-    ):
-        """
-        Update the HUD with new information.
-
-        Args:
-            speed (float): Current speed of the vehicle.
-            throttle (float): Current throttle value.
-            steer (float): Current steering angle.
-            heading (str): Current heading of the vehicle.
-            location (str): Current location of the vehicle.
-            collision (list): List of collision information.
-            nearby_vehicles (list): List of nearby vehicles.
-        """
-        self.speed = speed
-        self.throttle = throttle
-        self.steer = steer
-        self.heading = heading
-        self.location = location
-        self.collision = collision
-        self.nearby_vehicles = nearby_vehicles
-
-    def tick(self, camera_image):
-        """
-        Render HUD elements on the camera image and return the image.
-
-        Args:
-            camera_image: The camera image on which HUD elements are rendered.
-
-        Returns:
-            np.array: The camera image with HUD elements rendered.
-        """
-        # Create a blank HUD image
-        hud_image = np.zeros((self.dim[1], self.dim[0], 3), dtype=np.uint8)
-
-        # Add HUD elements
-        cv2.putText(
-            hud_image,
-            f"Speed: {self.speed:.2f} m/s",
-            (10, 40),
-            self.font,
-            self.font_scale,
-            self.font_color,
-            1,
-        )
-        cv2.putText(
-            hud_image,
-            f"Throttle: {self.throttle:.2f}",
-            (10, 60),
-            self.font,
-            self.font_scale,
-            self.font_color,
-            1,
-        )
-        cv2.putText(
-            hud_image,
-            f"Steer: {self.steer:.2f}",
-            (10, 80),
-            self.font,
-            self.font_scale,
-            self.font_color,
-            1,
-        )
-        cv2.putText(
-            hud_image,
-            f"Heading: {self.heading}",
-            (10, 100),
-            self.font,
-            self.font_scale,
-            self.font_color,
-            1,
-        )
-        cv2.putText(
-            hud_image,
-            f"Location: {self.location}",
-            (10, 120),
-            self.font,
-            self.font_scale,
-            self.font_color,
-            1,
-        )
-        cv2.putText(
-            hud_image,
-            "Collision:",
-            (10, 140),
-            self.font,
-            self.font_scale,
-            self.font_color,
-            1,
-        )
-        for i, value in enumerate(self.collision):
-            cv2.putText(
-                hud_image,
-                f"{i}: {value:.2f}",
-                (10, 160 + i * 20),
-                self.font,
-                self.font_scale,
-                self.font_color,
-                1,
-            )
-        cv2.putText(
-            hud_image,
-            f"Nearby vehicles:",
-            (10, 160 + len(self.collision) * 20),
-            self.font,
-            self.font_scale,
-            self.font_color,
-            1,
-        )
-        for i, vehicle in enumerate(self.nearby_vehicles):
-            cv2.putText(
-                hud_image,
-                f"{i}: {vehicle}",
-                (10, 180 + (len(self.collision) + i) * 20),
-                self.font,
-                self.font_scale,
-                self.font_color,
-                1,
-            )
-
-        # Overlay HUD image onto camera image
-        camera_image_with_hud = cv2.addWeighted(camera_image, 1, hud_image, 0.5, 0)
+# online network, target network and optimizer, built by the main block (see model.create_networks)
+network = None
+target_network = None
+optimizer = None
 
-        return camera_image_with_hud
 
 # visualize delete
 def draw_spawn_points(world, spawn_points, duration=10.0):
@@ -397,9 +84,14 @@ class Environment:
         car_config: Configuration for the vehicle.
         sensor_config: Configuration for the sensors.
         reward_function: The reward function to use.
-        map: The map to load (default is 0).
+        map: The map to load (default is 0, which uses Town04).
         spawn_index: The spawn index for the vehicle.
         random: Whether to use random spawning.
+        reload_on_reset: Whether to reset with a quick reload_world instead of destroying actors one by one.
+        scenario_mode: Serve traffic from the cached scenario pool ("round-robin" or "difficulty"), None to disable.
+        snapshot_fraction: Fraction of resets that start from a stored world snapshot (0 disables snapshots).
+        traffic_config: Configuration for the NPC traffic level-of-detail manager.
+        tm_port: Port of the Traffic Manager.
     """
     
     def __init__(
@@ -411,18 +103,29 @@ class Environment:
         map=0,
         spawn_index=None,
         random=False,
+        reload_on_reset=False,
+        scenario_mode=None,
+        snapshot_fraction=0.0,
+        traffic_config=None,
+        tm_port=8000,
     ):
         # Connecting to Carla Client
         self.client = carla_client
         self.client.set_timeout(20.0)
-        self.world = self.client.load_world("Town04")
+        self.map_name = map if map else DEFAULT_MAP
+        world_start = time.time()
+        self.world, cold = load_world(self.client, self.map_name)
+        world_data = get_world_data(self.world, self.map_name)
+        self.map = world_data["map"]
+        self.spawn_points = world_data["spawn_points"]
+        print(
+            f"World {self.map_name} ready in {time.time() - world_start:.2f} s "
+            f"({'cold: map loaded' if cold else 'warm: loaded map reused'})"
+        )
 
 
-        self.traffic_manager = self.client.get_trafficmanager(8000)  # Use port 8000 for the Traffic Manager
+        self.traffic_manager = self.client.get_trafficmanager(tm_port)  # port 8000 by default
         self.traffic_manager.set_global_distance_to_leading_vehicle(2.5)  # Maintain a minimum distance
-        # if loading specifc map
-    #    if map != 0:
-    #        self.world = self.client.load_world(map)
         """ This portion can be moved to env.reset
          #delete what we created, eg. vehicles and sensors
         actor_list = self.world.get_actors()
@@ -435,15 +138,18 @@ class Environment:
         ## Setting environment attributes
         self.car_config = car_config
         self.random = random
+        self.reload_on_reset = reload_on_reset
         self.sensor_config = sensor_config
         self.rf = int(reward_function[0])
-        self.blueprint_library = self.world.get_blueprint_library()
+        self.blueprint_library = world_data["blueprint_library"]
         self.vehicle_bps = [
             bp
             for bp in self.blueprint_library.filter("vehicle")
             if bp.has_attribute("number_of_wheels")
         ]
-        self.vehicle_bp = self.vehicle_bps[0]
+        # separate copy of the blueprint so the hero role is not shared with the NPCs
+        self.vehicle_bp = self.blueprint_library.find(self.vehicle_bps[0].id)
+        self.vehicle_bp.set_attribute("role_name", "hero")  # hybrid physics is centered on the hero
         self.camera_bp = self.blueprint_library.find("sensor.camera.rgb")
         self.camera_bp.set_attribute("image_size_x", str(sensor_config["image_size_x"]))
         self.camera_bp.set_attribute("image_size_y", str(sensor_config["image_size_y"]))
@@ -472,12 +178,71 @@ class Environment:
         ).T.reshape(-1, 2)
         self.spawn_point = None
         if spawn_index is not None:
-            self.spawn_point = self.world.get_map().get_spawn_points()[spawn_index]
+            self.spawn_point = self.spawn_points[spawn_index]
 
         # self.camera.listen(lambda data: self.process_image(data))
 
-        # Initialize HUD
-        self.hud = HUD(sensor_config["image_size_x"], sensor_config["image_size_y"])
+        # Precomputed lane geometry answers the reward's waypoint queries locally when available
+        self.lanes = None
+        lane_raster_path = LaneRaster.path_for(self.map_name)
+        if os.path.exists(lane_raster_path):
+            self.lanes = LaneRaster(lane_raster_path, self.map)
+            print(f"Using lane raster {lane_raster_path}")
+
+        # NPC traffic is kept around the ego by the level-of-detail manager
+        if traffic_config is None:
+            traffic_config = {}
+        self.traffic = TrafficLOD(
+            self.world, self.traffic_manager, self.vehicle_bps, **traffic_config
+        )
+
+        # Validated traffic layouts, generated once per map and stored on disk
+        self.scenarios = None
+        if scenario_mode:
+            self.scenarios = ScenarioPool(self.map_name, mode=scenario_mode)
+            if not self.scenarios.load():
+                print(f"Generating scenario pool for {self.map_name}")
+                ego_index = spawn_index if spawn_index is not None else 34
+                self.scenarios.generate(
+                    self.spawn_points, self.vehicle_bps, [ego_index], preferred=IDEAL_SPAWNS
+                )
+                dropped = self.scenarios.validate(
+                    self.client, self.world, self.blueprint_library, self.spawn_points, self.vehicle_bp
+                )
+                print(f"Scenario pool: {len(self.scenarios.layouts)} layouts ({dropped} dropped)")
+                if self.scenarios.layouts:
+                    self.scenarios.save()
+                else:
+                    print("No scenario layout could be spawned, using random NPC spawns instead")
+                    self.scenarios = None
+
+        # Snapshots of interesting moments that episodes can start from
+        self.snapshots = None
+        # phase timers of step() and reset(), replaced by an enabled profiler while training
+        self.profiler = PhaseProfiler(enabled=False)
+        self.from_snapshot = False
+        self.steps = 0
+        self.overtook = False
+        if snapshot_fraction > 0:
+            self.snapshots = SnapshotLibrary(
+                os.path.join("snapshots", self.map_name + ".json"), snapshot_fraction
+            )
+
+    def get_lane_waypoint(self, location):
+        """
+        Project a location onto the closest driving lane, from the lane raster when available.
+
+        Args:
+            location (carla.Location): The location to project.
+
+        Returns:
+            carla.Waypoint or RasterWaypoint: The waypoint at the center of the closest driving lane.
+        """
+        if self.lanes is not None:
+            return self.lanes.get_waypoint(location)
+        return self.map.get_waypoint(
+            location, project_to_road=True, lane_type=carla.LaneType.Driving
+        )
 
     def detect_unsafe_lane_change(self):    # change
         """
@@ -490,10 +255,7 @@ class Environment:
         vehicle_rotation = vehicle_transform.rotation.yaw
 
         # Get the map and waypoint
-        map = self.world.get_map()
-        waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+        waypoint = self.get_lane_waypoint(vehicle_location)
 
         # Check if the vehicle is crossing solid lane markings (unsafe)
         left_marking = waypoint.left_lane_marking
@@ -572,7 +334,7 @@ class Environment:
         speed = math.sqrt(velocity.x**2 + velocity.y**2 + velocity.z**2)  # Convert to scalar speed (m/s)
 
         # Get the speed limit from the waypoint
-        waypoint = self.world.get_map().get_waypoint(self.vehicle.get_transform().location)
+        waypoint = self.get_lane_waypoint(self.vehicle.get_transform().location)
         speed_limit = 70
 
         # Get nearby vehicles
@@ -597,18 +359,32 @@ class Environment:
         excessively_conservative = driving_too_slow or not_overtaking
         return excessively_conservative
 
+    def reload_world(self):
+        """
+        Quickly reset the world by reloading the current map while keeping its settings.
+
+        All actors are destroyed; the cached map data stays valid since the map does not change.
+        """
+        self.world, _ = load_world(self.client, self.map_name, reload=True)
+        self.traffic.world = self.world
+
     def on_collision(self, event):
         """
         Callback function for collision events.
         """
         self.collision_detected = True
 
-    def reset(self):  # reset is to reset world?
+    def reset(self, snapshot=None):  # reset is to reset world?
         """
         Reset the environment.
+
+        Args:
+            snapshot (dict, optional): World snapshot to start from instead of the spawn point.
         """
         # Spawn or respawn the vehicle at a random location
         # delete what we created, eg. vehicles and sensors
+        if self.reload_on_reset:
+            self.reload_world()  # reloading the map destroys every actor at once
         actor_list = self.world.get_actors()
 
         # Identify IDs of vehicles and sensors to be deleted
@@ -633,32 +409,49 @@ class Environment:
                 print("Actor with ID", actor_id, "not found.")
 
         
-        spawn_points = self.world.get_map().get_spawn_points()
+        spawn_points = self.spawn_points
         #draw_spawn_points(self.world, spawn_points)
         self.world.wait_for_tick(10) #wait for world to be ready 
         
-        if self.spawn_point is None or self.random:
+        if snapshot is None and self.snapshots is not None:
+            snapshot = self.snapshots.choose(self.map_name)
+        self.from_snapshot = snapshot is not None
+        self.steps = 0
+        if snapshot is not None:
+            # start directly from a stored scenario state
+            self.vehicle, npc_ids = restore_snapshot(
+                self.client, self.world, self.blueprint_library, self.vehicle_bp, snapshot, self.traffic_manager
+            )
+            self.traffic.adopt(self.world.get_actors(npc_ids), spawn_points)
+            print(f"Starting from snapshot of episode {snapshot['episode']} step {snapshot['step']}")
+        else:
+            if self.spawn_point is None or self.random:
             
-            #self.spawn_point = random.choice(spawn_points) #for random spawn   
-                                        # for hardcoded spawn, since we are doing overtaking, hardcoded spawn close
-                                        # to other vehicles is ideal
-            self.spawn_point = spawn_points[34]
-            print(f"spawn index: {spawn_points.index(self.spawn_point)}")
-        self.vehicle = self.world.spawn_actor(self.vehicle_bp, self.spawn_point)
-        self.vehicle.set_autopilot(False)
-        self.vehicle.apply_control(carla.VehicleControl(manual_gear_shift=True, gear=1))
-
-        # adding additional traffic for overtaking simulation
-        # list of ideal spawn indexes for overtaking
-        ideal_spawns = [37, 39, 40, 366, 367, 365, 263, 33, 35, 36, 312, 313, 314, 315, 49, 50, 51, 52, 45, 46, 47, 48, 41, 42, 43, 44, 278, 279, 280, 281 ]
-        for i in range(20):
-            transform = (spawn_points[random.choice(ideal_spawns)]) # choose random ideal spawns for some variety between episodes
-            blueprint = random.choice(self.vehicle_bps)
-            autovehicle = self.world.try_spawn_actor(blueprint, transform)
-           # autovehicle.set_autopilot(True, self.traffic_manager.get_port()) #IMP here
-            if autovehicle:
-                #print("Spawned vehicle \n")
-                autovehicle.set_autopilot(True, self.traffic_manager.get_port()) # making sure no crashes happen unless our vehicle causes it
+                #self.spawn_point = random.choice(spawn_points) #for random spawn   
+                                            # for hardcoded spawn, since we are doing overtaking, hardcoded spawn close
+                                            # to other vehicles is ideal
+                self.spawn_point = spawn_points[34]
+                print(f"spawn index: {spawn_points.index(self.spawn_point)}")
+            if self.scenarios is not None:
+                layout = self.scenarios.next()
+                self.spawn_point = spawn_points[layout["ego"]]
+            self.vehicle = self.world.spawn_actor(self.vehicle_bp, self.spawn_point)
+            self.vehicle.set_autopilot(False)
+            self.vehicle.apply_control(carla.VehicleControl(manual_gear_shift=True, gear=1))
+
+            # adding additional traffic for overtaking simulation
+            if self.scenarios is not None:
+                npc_ids = self.scenarios.spawn(
+                    self.client, self.blueprint_library, spawn_points, layout, self.traffic_manager.get_port()
+                )
+                self.traffic.adopt(self.world.get_actors(npc_ids), spawn_points)
+                print(
+                    f"Scenario difficulty {layout['difficulty']:.2f}: spawned {len(npc_ids)}/{len(layout['npcs'])} NPCs, "
+                    f"spawn success rate {self.scenarios.success_rate() * 100:.1f}%"
+                )
+            else:
+                # ideal spawns are tried first before other free spawn points in range
+                self.traffic.populate(self.vehicle, spawn_points, IDEAL_SPAWNS)
 
         # Attach the camera sensor
         camera_transform = carla.Transform(
@@ -687,8 +480,9 @@ class Environment:
         # Start collecting data
         self.image = None
         print("Environment reset successful")
-        while self.image is None:
-            self.world.tick()
+        with self.profiler.phase("reset.camera_wait"):
+            while self.image is None:
+                self.world.tick()
         return self.image
 
     def process_image(self, image):
@@ -700,61 +494,6 @@ class Environment:
             (self.sensor_config["image_size_y"], self.sensor_config["image_size_x"], 4)
         )
         self.image = i2[:, :, :3]
-        image_array_copy = self.image.copy()
-        self.font = cv2.FONT_HERSHEY_SIMPLEX
-        self.font_scale = 0.5
-        self.font_color = (255, 255, 255)
-        elapsed_since_last_iteration = time.time() - start_time
-        self.time = elapsed_since_last_iteration
-        self.episode = num_ep
-        self.reward_number = reward_num
-
-        # # vehicle control
-        """
-        ###
-        control = self.vehicle.get_control()
-
-        # # throttle bar
-        throttle_bar_length = int(100 * control.throttle)
-        throttle_bar_x = 80
-        throttle_bar_y = 150
-        # # unfilled rectangle
-        cv2.rectangle(image_array_copy, (throttle_bar_x, throttle_bar_y), (throttle_bar_x + 100, throttle_bar_y + 10), (255, 255, 255), 1)
-        # # throttle fill
-        throttle_color = (int(255 * control.throttle), int(255 * (1 - control.throttle)), 0)
-        cv2.rectangle(image_array_copy, (throttle_bar_x + 1, throttle_bar_y + 1), (throttle_bar_x + throttle_bar_length, throttle_bar_y + 9), throttle_color, -1)
-
-        # # steer bar
-        steer_bar_length = int(50 * (control.steer + 1))  # Adjust multiplier as needed
-        steer_bar_x = 80
-        steer_bar_y = 170
-        cv2.rectangle(image_array_copy, (steer_bar_x, steer_bar_y), (steer_bar_x + 100, steer_bar_y + 10), (255, 255, 255), 1)
-        # # Draw slider for steer value
-        slider_x = steer_bar_x + int(100 * (control.steer + 1) / 2)
-        slider_y = steer_bar_y
-        cv2.rectangle(image_array_copy, (slider_x - 3, slider_y), (slider_x + 3, slider_y + 9), (255, 255, 255), -1)
-
-        # # Calculate the speed (magnitude of velocity)
-        velocity = self.vehicle.get_velocity()
-        speed = velocity.x ** 2 + velocity.y ** 2 + velocity.z ** 2
-        speed = speed ** 0.5
-
-        # # display location
-        location = self.vehicle.get_location()
-        formatted_location = "({:.2f}, {:.2f})".format(location.x, location.y)
-
-        cv2.putText(image_array_copy, f'Simulation Time: {self.time:.2f} s', (10, 40), self.font, 0.5, self.font_color)
-        cv2.putText(image_array_copy, f'Reward Function: {self.reward_number}', (10, 60), self.font, 0.5, self.font_color)
-        cv2.putText(image_array_copy, f'Episode Number: {self.episode}', (10, 80), self.font, 0.5, self.font_color)
-        cv2.putText(image_array_copy, f'Speed: {speed:.2f} m/s', (10, 100), self.font, 0.5, self.font_color)
-        cv2.putText(image_array_copy, f'Location: {formatted_location}', (10, 120), self.font, 0.5, self.font_color)
-        cv2.putText(image_array_copy, "Throttle:", (10, 160), self.font, self.font_scale, self.font_color)
-        cv2.putText(image_array_copy, "Steer:", (10, 180), self.font, self.font_scale, self.font_color)
-
-        cv2.imshow("Camera View", image_array_copy)
-        cv2.waitKey(5)
-        """
-        ###
 
     def step(self, action):
         """
@@ -764,82 +503,91 @@ class Environment:
             action: The action to take.
         """
         self.throttle, self.steer = action
+        profiler = self.profiler
         #  print(self.action_space)
-        self.vehicle.apply_control(
-            carla.VehicleControl(throttle=self.throttle, steer=self.steer)
-        )
+        with profiler.phase("step.control"):
+            self.vehicle.apply_control(
+                carla.VehicleControl(throttle=self.throttle, steer=self.steer)
+            )
 
-        self.world.tick()
+        with profiler.phase("step.tick"):
+            self.traffic.tick(self.vehicle)
 
-        # Compute the distance traveled since the last step
-        current_location = self.vehicle.get_location()
-        current_xy = np.array([current_location.x, current_location.y])
-        dd = np.linalg.norm(current_xy - self.prev_xy)
-        self.distance += dd
+        with profiler.phase("step.observe"):
+            # Compute the distance traveled since the last step
+            current_location = self.vehicle.get_location()
+            current_xy = np.array([current_location.x, current_location.y])
+            dd = np.linalg.norm(current_xy - self.prev_xy)
+            self.distance += dd
 
-        info = {}
+            info = {}
 
-        # getting info data
+            # getting info data
 
-        vehicle_transform = self.vehicle.get_transform()
-        vehicle_location = vehicle_transform.location
-        vehicle_rotation = vehicle_transform.rotation.yaw
-        map = self.world.get_map()
-        waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+            vehicle_transform = self.vehicle.get_transform()
+            vehicle_location = vehicle_transform.location
+            vehicle_rotation = vehicle_transform.rotation.yaw
+            waypoint = self.get_lane_waypoint(vehicle_location)
+            self.last_waypoint = waypoint
 
-        vehicle_rotation_radians = math.radians(vehicle_rotation)
-        vehicle_rotation_radians = (vehicle_rotation_radians + 2*np.pi) % (
-            2 * np.pi
-        )
-        road_direction = waypoint.transform.rotation.yaw
-        road_direction_radians = math.radians(road_direction)
-        road_dir = (road_direction_radians + 2*np.pi) % (2*np.pi)
-        theta = abs(vehicle_rotation_radians - road_direction_radians) % (2 * np.pi)
-        if theta > np.pi:
-            theta = 2 * np.pi - theta
-        going_opposite_direction = theta > np.pi / 2
+            vehicle_rotation_radians = math.radians(vehicle_rotation)
+            vehicle_rotation_radians = (vehicle_rotation_radians + 2*np.pi) % (
+                2 * np.pi
+            )
+            road_direction = waypoint.transform.rotation.yaw
+            road_direction_radians = math.radians(road_direction)
+            road_dir = (road_direction_radians + 2*np.pi) % (2*np.pi)
+            theta = abs(vehicle_rotation_radians - road_direction_radians) % (2 * np.pi)
+            if theta > np.pi:
+                theta = 2 * np.pi - theta
+            going_opposite_direction = theta > np.pi / 2
 
-        road_half_width = waypoint.lane_width / 2.0
+            road_half_width = waypoint.lane_width / 2.0
 
-        center_of_lane = waypoint.transform.location
-        distance_from_center = vehicle_location.distance(center_of_lane)
+            center_of_lane = waypoint.transform.location
+            distance_from_center = vehicle_location.distance(center_of_lane)
 
-        not_near_center = distance_from_center > road_half_width / 1.5
-        done = not_near_center or going_opposite_direction or self.collision_detected
+            not_near_center = distance_from_center > road_half_width / 1.5
+            done = not_near_center or going_opposite_direction or self.collision_detected
 
-        current_xy = np.array([vehicle_location.x, vehicle_location.y])
-        dd = np.linalg.norm(current_xy - self.prev_xy)
+            current_xy = np.array([vehicle_location.x, vehicle_location.y])
+            dd = np.linalg.norm(current_xy - self.prev_xy)
 
-        Py = distance_from_center
+            Py = distance_from_center
 
-        velocity = self.vehicle.get_velocity()
-        speed = velocity.x**2 + velocity.y**2 + velocity.z**2
-        speed = speed**0.5
+            velocity = self.vehicle.get_velocity()
+            speed = velocity.x**2 + velocity.y**2 + velocity.z**2
+            speed = speed**0.5
 
         info["angle"] = math.cos(theta)
         info["lane_deviation"] = Py
         info["collision"] = 1 if self.collision_detected else 0
         info["speed"] = speed
 
-        # Calculate reward based on the chosen reward function
-        if self.rf == 1:
-            reward, done = self.reward_1()
-        elif self.rf == 2:
-            reward, done = self.reward_2()
-        elif self.rf == 3:
-            reward, done = self.reward_3()
-        elif self.rf == 4:
-            reward, done, theta, Py = self.reward_4()
-            info["angle"] = math.cos(theta)
-            info["lane_deviation"] = Py
-            info["collision"] = 1 if self.collision_detected else 0
-        elif self.rf ==5:
-            reward, done, theta, Py = self.overtaking_reward()
-            info["angle"] = math.cos(theta)
-            info["lane_deviation"] = Py
-            info["collision"] = 1 if self.collision_detected else 0
+        with profiler.phase("step.reward"):
+            # Calculate reward based on the chosen reward function
+            if self.rf == 1:
+                reward, done = self.reward_1()
+            elif self.rf == 2:
+                reward, done = self.reward_2()
+            elif self.rf == 3:
+                reward, done = self.reward_3()
+            elif self.rf == 4:
+                reward, done, theta, Py = self.reward_4()
+                info["angle"] = math.cos(theta)
+                info["lane_deviation"] = Py
+                info["collision"] = 1 if self.collision_detected else 0
+            elif self.rf ==5:
+                reward, done, theta, Py = self.overtaking_reward()
+                info["angle"] = math.cos(theta)
+                info["lane_deviation"] = Py
+                info["collision"] = 1 if self.collision_detected else 0
+
+        info["overtake"] = 1 if self.rf == 5 and self.overtook else 0
+
+        self.steps += 1
+        if self.snapshots is not None:
+            self.snapshots.observe(self, num_ep)
 
         self.prev_xy = current_xy
         # CHANGED HERE, first return is state representation
@@ -884,10 +632,7 @@ class Environment:
         exceed_max_rotation = np.abs(vehicle_rotation_radians) > maximal_rotation
 
         # Getting the vehicle's lane information
-        map = self.world.get_map()
-        waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+        waypoint = self.get_lane_waypoint(vehicle_location)
         #   print("Map is", map)
         # Calculate the heading difference between the vehicle and the road
         road_direction = waypoint.transform.rotation.yaw
@@ -959,10 +704,7 @@ class Environment:
         exceed_max_rotation = np.abs(vehicle_rotation_radians) > maximal_rotation
 
         # Getting the vehicle's lane information
-        map = self.world.get_map()
-        waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+        waypoint = self.get_lane_waypoint(vehicle_location)
         road_half_width = waypoint.lane_width / 2.0
 
         # Calculate the distance from the center of the lane+
@@ -1007,10 +749,7 @@ class Environment:
         vehicle_transform = self.vehicle.get_transform()
         vehicle_location = vehicle_transform.location
         vehicle_rotation = vehicle_transform.rotation.yaw
-        map = self.world.get_map()
-        waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+        waypoint = self.get_lane_waypoint(vehicle_location)
 
         # Convert yaw to radians and normalize between -pi and pi
         vehicle_rotation_radians = math.radians(vehicle_rotation)
@@ -1059,10 +798,7 @@ class Environment:
         vehicle_transform = self.vehicle.get_transform()
         vehicle_location = vehicle_transform.location
         vehicle_rotation = vehicle_transform.rotation.yaw
-        map = self.world.get_map()
-        waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+        waypoint = self.get_lane_waypoint(vehicle_location)
 
         vehicle_rotation_radians = math.radians(vehicle_rotation)
         vehicle_rotation_radians = (vehicle_rotation_radians + np.pi) % (
@@ -1151,10 +887,7 @@ class Environment:
         vehicle_rotation = vehicle_transform.rotation.yaw
 
         # Get the map and waypoint
-        map = self.world.get_map()
-        waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+        waypoint = self.get_lane_waypoint(vehicle_location)
 
         # Compute vehicle rotation in radians
         vehicle_rotation_radians = math.radians(vehicle_rotation)
@@ -1198,7 +931,8 @@ class Environment:
         lane_change_penalty = -5 if unsafe_lane_change else 0  # Penalty for unsafe lane changes
        # print("Attempting overtake_successful() function")
 
-        overtake_reward = 10 if self.overtake_successful() else 0  # Reward for successful overtaking
+        self.overtook = self.overtake_successful()
+        overtake_reward = 10 if self.overtook else 0  # Reward for successful overtaking
        # print ("Completed overtake successful")
 
        # print("Attempting check_excessively_conservative() function")
@@ -1242,7 +976,7 @@ class Environment:
             carla.Vector3D: The direction vector of the road.
         """
         # This is a simplified example. You'll need to adapt it based on how your road data is structured
-        map = self.world.get_map()
+        map = self.map
         waypoint = map.get_waypoint(self.vehicle.get_location())
         next_waypoint = waypoint.next(1.0)[0]  # Assuming there's a next waypoint
         direction = next_waypoint.transform.location - waypoint.transform.location
@@ -1288,12 +1022,9 @@ class Environment:
         """
         # Get the vehicle's location
         vehicle_location = self.vehicle.get_location()
-        map = self.world.get_map()
 
         # Get the closest waypoint to the vehicle's location
-        closest_waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+        closest_waypoint = self.get_lane_waypoint(vehicle_location)
 
         # Calculate the lateral position error
         # This is a simple approximation. For more accuracy, consider the direction of the road
@@ -1315,13 +1046,10 @@ class Environment:
             bool: True if the vehicle is within the lane, False otherwise.
         """
         # Get the vehicle's location
-        map = self.world.get_map()
         vehicle_location = self.vehicle.get_location()
 
         # Get the closest waypoint to the vehicle's location, considering only driving lanes
-        closest_waypoint = map.get_waypoint(
-            vehicle_location, project_to_road=True, lane_type=carla.LaneType.Driving
-        )
+        closest_waypoint = self.get_lane_waypoint(vehicle_location)
 
         # Get the transform of the closest waypoint
         waypoint_transform = closest_waypoint.transform
@@ -1376,222 +1104,13 @@ class Environment:
     
 
 
-Transition = namedtuple(
-    "Transition", ("state", "action", "reward", "next_state", "done")
-)
-
-
-def optimize_model(memory, batch_size, gamma):
-    """
-    Optimize the Q-network model using a batch of transitions from the replay memory.
-
-    Args:
-        memory (ReplayMemory): The replay memory containing transitions.
-        batch_size (int): The size of the batch to sample from the replay memory.
-        gamma (float): The discount factor for future rewards.
-    """
-    # print("__FUNCTION__optimize_model()")
-   # print("optimizing")
-    if memory.size() < batch_size:
-       # print("Memory is less than batch size")
-        return
-
-    transitions = memory.sample(batch_size)
-    batch = Transition(*zip(*transitions))
-    #print("Batched")
-    # convert to tensors and move to device
-    state_batch = torch.cat([s for s in batch.state]).to(device)
-    # action_batch = torch.cat([a for a in batch.action]).to(device)
-    action_batch = torch.cat([torch.tensor([a]).to(device) for a in batch.action])
-    reward_batch = torch.cat([torch.tensor([r]).to(device) for r in batch.reward])
-    next_state_batch = torch.cat([s for s in batch.next_state if s is not None]).to(
-        device
-    )
-    done_batch = torch.cat([torch.tensor([d]).to(device) for d in batch.done])
-    # non_final_mask = torch.tensor(tuple(map(lambda s: s is not None, batch.next_state)), dtype=torch.bool).to(device)
-   # print("batch done")
-    # print(f"\tstate_batch.shape = {state_batch.shape}")
-    state_batch = state_batch.permute(0, 3, 1, 2)
-    next_state_batch = next_state_batch.permute(0, 3, 1, 2)
-    # print(f"\tstate_batch.shape = {state_batch.shape}")
-    # print(f"\taction_batch.shape = {action_batch.shape}")
-    # print(f"\treward_batch.shape = {reward_batch.shape}")
-    # print(f"\tnext_state_batch.shape = {next_state_batch.shape}")
-    # print(f"\tdone_batch.shape = {done_batch.shape}")
-    # Compute Q
-    current_q = network(state_batch)
-    # print("  __FUNCTION__optimize_model()")
-    # print(f"\tcurrent_q.shape = {current_q.shape}")
-    # print(f"\taction_batch.unsqueeze(1).shape = {action_batch.unsqueeze(1).shape}")
-    # print(f"\taction_batch.unsqueeze(1).long().shape = {action_batch.unsqueeze(1).long().shape}")
-    current_q = torch.gather(
-        current_q, dim=1, index=action_batch.unsqueeze(1).long()
-    ).squeeze(-1)
-    # print(f"\tcurrent_q.shape = {current_q.shape}")
-    # print(f"\tcurrent_q = {current_q}")
-   # print("Q calculated")
-    # print(f"\tlen(next_state_batch) = {len(next_state_batch)}")
-
-    with torch.no_grad():
-        # compute target Q
-        target_q = torch.full([len(next_state_batch)], 0, dtype=torch.float32).to(device)
-        # target_q = torch.zeros(batch_size, NUM_ACTIONS, dtype=torch.float32)
-
-        for idx in range(len(next_state_batch)):
-            reward = reward_batch[idx]
-            next_state = next_state_batch[idx].unsqueeze(0).to(device)
-           # print(f"next_state shape: {next_state.shape}, dtype: {next_state.dtype}, device: {next_state.device}")
-            done = done_batch[idx]
-            if done:
-                target_q[idx] = reward
-              #  print(f"\t\t\treward = {reward}")
-            else:
-              #  print(f"\tstate_batch.shape = {state_batch.shape}")
-              #  print(f"\t\t\tnext_state.shape = {next_state.shape}")
-                q_values = target_network(next_state)
-              #  print(f"\t\t\tt_q_values.shape = {q_values.shape}")
-                max_q = q_values[0][torch.argmax(q_values)]
-                target = reward + gamma * max_q
-                target_q[idx] = target
-
-    #print("Target q calculated")
-    # print(f"\ttarget_q.shape = {target_q.shape}")
-
-    # Compute Huber loss
-    loss_q = loss_fn(current_q, target_q)
-
-    # Optimize the model
-    optimizer.zero_grad()
-    loss_q.backward()
-    optimizer.step()
-    #print("Optimize finished")
-
-
-def update_plot(rewards, num_steps, lane_deviation, angle, speed):
-    """
-    Update the training plot with new data.
-
-    Args:
-        rewards (list): List of average rewards per episode.
-        num_steps (list): List of number of steps per episode.
-        lane_deviation (list): List of lane deviation values per episode.
-        angle (list): List of angle values per episode.
-        speed (list): List of speed values per episode.
-    """
-    # with open('plot')
-    # plt.clf()  just adds blank figure
-    plt.figure(figsize=(10, 8))
-
-    # create plots
-    plt.subplot(4, 1, 1)
-    plt.plot(np.arange(0, len(rewards)), rewards)
-    plt.xlabel("Training Episodes")
-    plt.ylabel("Average Reward per Episode")
-    plt.title("Average Reward")
-
-    # Plot the number of steps per episode
-    plt.subplot(4, 1, 2)
-    plt.plot(np.arange(0, len(num_steps)), num_steps)
-    plt.xlabel("Training Episodes")
-    plt.ylabel("Number of Steps per Episode")
-    plt.title("Steps per Episode")
-
-    plt.subplot(4, 1, 3)
-    y1 = lane_deviation
-    y2 = angle
-    y3 = speed
-    x = len(speed)
-    plt.plot(np.arange(0, x), y1, label="Lane Deviation (distance from center)")
-    plt.plot(np.arange(0, x), y2, label="Angle (radians)")
-    plt.plot(np.arange(0, x), y3, label="Speed (m/s)")
-    plt.xlabel("Training Episodes")
-    plt.ylabel("Lane Deviation, Angle, Speed")
-    plt.title("Lane Deviation, Angle, Speed per Episode")
-    plt.legend()
-
-    plt.subplot(4, 1, 4)
-    plt.scatter(np.arange(0, len(rewards)), rewards, color="blue")
-    coeffs = np.polyfit(np.arange(len(rewards)), rewards, 1)
-    p = np.poly1d(coeffs)
-    plt.plot(np.arange(len(rewards)), p(np.arange(len(rewards))), "r--")
-    plt.xlabel("Training Episodes")
-    plt.ylabel("Average Reward per Episode")
-    plt.title(
-        "Average Reward (Corr: {:.2f})".format(
-            np.corrcoef(rewards, p(np.arange(len(rewards))))[0, 1]
-        )
-    )
-
-    # Adjust layout and display the plot
-    plt.tight_layout()
-    plt.show()
-
-
 if __name__ == "__main__":
     print("Running Main")
     print(torch.__version__)
     print(torch.version.cuda)
     print(torch.backends.cudnn.version())
-    parser = argparse.ArgumentParser(
-        description="Run the simulator with random actions"
-    )
-    parser.add_argument(
-        "--version",
-        type=str,
-        nargs="+",
-        help="version number for model naming",
-        required=False,
-    )
-    parser.add_argument(
-        "--operation", type=str, nargs="+", help="Load or New or Tune", required=True
-    )
-    parser.add_argument(
-        "--save-path",
-        type=str,
-        nargs="+",
-        help="Path to the saved model state",
-        required=False,
-    )
-    # reward function
-    parser.add_argument(
-        "--reward-function",
-        type=str,
-        nargs="+",
-        help="1 or 2 or 3 or 4 or",
-        required=True,
-    )
-    parser.add_argument(
-        "--map",
-        type=str,
-        nargs="+",
-        help="Specify CARLA map: (Town01, ...  Town07)",
-        required=False,
-    )
-    parser.add_argument(
-        "--epsilon-decrement", type=str, nargs="+", help="Epsilon", required=False
-    )
-    parser.add_argument(
-        "--num-episodes",
-        type=str,
-        nargs="+",
-        help="Number of episodes for training",
-        required=False,
-    )
-    parser.add_argument(
-        "--max-steps",
-        type=str,
-        nargs="+",
-        help="Maximum number of steps per episode",
-        required=False,
-    )
-    parser.add_argument(
-        "--random-spawn",
-        type=str,
-        nargs=1,
-        help="Vehicle spawn location random? (True/False)",
-        required=False,
-    )
-    args = parser.parse_args()
+
+    network, target_network, optimizer = create_networks(device)
 
     if not args.operation:
         print("Operation argument is required")
@@ -1620,15 +1139,34 @@ if __name__ == "__main__":
         if args.random_spawn[0] == "False":
             random_spawn = False
 
-    env = Environment(
-        client,
-        car_config,
-        sensor_config,
-        args.reward_function,
-        map,
-        34,
-        random=random_spawn,
-    )
+    reload_on_reset = False
+    if args.reload_world:
+        reload_on_reset = args.reload_world[0] == "True"
+
+    traffic_config = {}  # NPC traffic level-of-detail configuration
+    if args.npc_count:
+        traffic_config["target_npcs"] = int(args.npc_count[0])
+    if args.npc_radius:
+        traffic_config["radius"] = float(args.npc_radius[0])
+    if args.tick_budget:
+        traffic_config["tick_budget"] = float(args.tick_budget[0])
+
+    # offline pretraining only reads recorded transitions and needs no simulator
+    if args.operation[0].lower() != "pretrain":
+        env = Environment(
+            get_client(args.host[0] if args.host else "localhost", int(args.port[0]) if args.port else 2000),
+            car_config,
+            sensor_config,
+            args.reward_function,
+            map,
+            34,
+            random=random_spawn,
+            reload_on_reset=reload_on_reset,
+            scenario_mode=args.scenarios[0] if args.scenarios else None,
+            snapshot_fraction=float(args.snapshot_fraction[0]) if args.snapshot_fraction else 0.0,
+            traffic_config=traffic_config,
+            tm_port=int(args.tm_port[0]) if args.tm_port else 8000,
+        )
 
     print("Arguments received:")
     print("Version:", args.version)
@@ -1641,8 +1179,14 @@ if __name__ == "__main__":
     print("Max Steps per Episode:", args.max_steps)
     print("Random Vehicle Spawn:", args.random_spawn)
 
-    # initialize HUD
-    hud = HUD(sensor_config["image_size_x"], sensor_config["image_size_y"])
+    # camera view with the HUD, rendered and shown by a display thread off the training loop
+    hud = None
+    if args.hud and args.hud[0] == "True" and args.operation[0].lower() != "pretrain":
+        hud = HUDDisplay(
+            sensor_config["image_size_x"],
+            sensor_config["image_size_y"],
+            title=f"Reward Function: {args.reward_function[0]}",
+        )
 
     root_directory = os.path.abspath(os.path.dirname(__file__))
     save_path = os.path.join(root_directory, 'saves')
@@ -1659,8 +1203,26 @@ if __name__ == "__main__":
             network.load_state_dict(torch.load(os.path.join(save_path, "v" + args.save_path[0])))
             target_network = deepcopy(network)
 
-        replay_buffer = ReplayBuffer(10000)
         batch_size = 32 # CHANGED
+        # memory accounting, with a budget the replay buffer is sized to fit and shed when it is exceeded
+        memory = MemoryMonitor(
+            device,
+            budget=float(args.memory_budget[0]) * 1e9 if args.memory_budget else None,
+            min_capacity=batch_size,
+        )
+        if args.compress_replay and args.compress_replay[0] == "True":
+            # compressed frame sizes are not known ahead, the budget is enforced by shedding only
+            replay_buffer = CompressedReplayBuffer(10000, batch_size=batch_size)
+        else:
+            replay_capacity = memory.replay_capacity(
+                (sensor_config["image_size_y"], sensor_config["image_size_x"]),
+                10000,
+                steps_per_episode=int(args.max_steps[0]) if args.max_steps else 400,
+            )
+            replay_buffer = ReplayBuffer(replay_capacity)
+        prefetcher = None
+        if args.prefetch_batches and int(args.prefetch_batches[0]) > 0:
+            prefetcher = BatchPrefetcher(replay_buffer, batch_size, device, depth=int(args.prefetch_batches[0]))
         gamma = 0.99
         epsilon_start = 1
         epsilon_end = 0.01
@@ -1678,68 +1240,216 @@ if __name__ == "__main__":
         reward_num = args.reward_function[0]
 
         target_update = 10  # Update target network every 10 episodes
+        if args.target_update:
+            target_update = int(args.target_update[0])
+
+        feature_cache = None
+        if args.cache_target_features and args.cache_target_features[0] == "True":
+            # the target syncs every target_update steps and at the end of every episode
+            cache_hit_rate = expected_hit_rate(
+                min(target_update, max_num_steps), batch_size, replay_buffer.buffer.maxlen
+            )
+            if isinstance(replay_buffer, CompressedReplayBuffer):
+                # sampled frames are freshly decompressed tensors, so entries keyed by frame identity never hit
+                print("--cache-target-features has no effect with --compress-replay, target feature cache disabled")
+            elif prefetcher is not None:
+                # prefetched batches arrive as assembled tensors without the stored frames to key on
+                print("--cache-target-features has no effect with --prefetch-batches, target feature cache disabled")
+            elif cache_hit_rate < MIN_HIT_RATE:
+                print(
+                    f"--cache-target-features would hit {cache_hit_rate * 100:.1f}% of {replay_buffer.buffer.maxlen} "
+                    f"replay frames per target version (--target-update {target_update}, batch size {batch_size}), "
+                    f"below {MIN_HIT_RATE * 100:.0f}%; target feature cache disabled"
+                )
+            else:
+                feature_cache = TargetFeatureCache(target_network)
 
         best_dict_reward = -1e10
 
         # per episode
-        rewards = np.array([])
-        num_steps = np.array([])
+        rewards = []
+        num_steps = []
 
         epsilon = epsilon_start
-        start_time = time.time()
-        # opening file to append data
-        file = open("plot_data.csv", "w", newline="")
-        writer = csv.writer(file)
-        file2 = open("step_plot.csv", "w", newline="")
-        writer2 = csv.writer(file2)
-        writer2.writerow(["lane_dev_avg", "angle_avg", "speed_avg"])
         lane_deviations = []
         speeds = []
         angles = []
 
+        # full training state checkpoints (networks, optimizer, schedule and replay contents)
+        checkpoint_dir = os.path.join(root_directory, "checkpoints", "v" + args.version[0])
+        checkpoint_every = 10
+        if args.checkpoint_every:
+            checkpoint_every = int(args.checkpoint_every[0])
+        start_episode = 0
+        if args.resume:
+            training_state = load_checkpoint(
+                checkpoint_dir, network, target_network, optimizer, replay_buffer, device
+            )
+            if training_state is None:
+                print(f"No checkpoint found in {checkpoint_dir}, starting from scratch")
+            else:
+                start_episode = training_state["episode"] + 1
+                epsilon = training_state["epsilon"]
+                best_dict_reward = training_state["best_dict_reward"]
+                rewards = training_state["rewards"]
+                num_steps = training_state["num_steps"]
+                lane_deviations = training_state["lane_deviations"]
+                angles = training_state["angles"]
+                speeds = training_state["speeds"]
+                print(
+                    f"Resumed from episode {start_episode}, epsilon {epsilon}, "
+                    f"{replay_buffer.size()} replay transitions"
+                )
+        # a run that was not resumed starts a new replay ring instead of extending an earlier run's
+        fresh_replay = start_episode == 0
+
+        # model checkpoints are written in the background, keeping the best and the most recent ones
+        model_writer = CheckpointWriter(
+            save_path,
+            "v" + args.version[0],
+            top_k=int(args.keep_best[0]) if args.keep_best else 3,
+            keep_last=int(args.keep_last[0]) if args.keep_last else 2,
+        )
+        if start_episode > 0:
+            model_writer.restore(rewards)  # prune the checkpoints written before the restart too
+
+        # columnar metrics store, plot_data.csv and step_plot.csv are exported from it
+        metrics = MetricsRecorder(
+            os.path.join(root_directory, "metrics", "v" + args.version[0]),
+            log_steps=bool(args.log_steps and args.log_steps[0] == "True"),
+            resume=start_episode > 0,
+        )
+        metrics.truncate(start_episode)  # drop episodes recorded after the restored checkpoint
+        metrics.export_csv()
+
+        # opt-in binary trajectories of every Nth episode
+        trajectories = None
+        if args.record_trajectories and int(args.record_trajectories[0]) > 0:
+            trajectories = TrajectoryRecorder(
+                os.path.join(root_directory, "trajectories", "v" + args.version[0]),
+                every=int(args.record_trajectories[0]),
+                frame_every=int(args.record_frames[0]) if args.record_frames else 0,
+            )
+
+        # per-phase timings of every episode, stored in the metrics profile table
+        profiler = PhaseProfiler(
+            trace_episodes=[int(episode) for episode in args.profile_episodes or []],
+            trace_directory=os.path.join(root_directory, "profiles", "v" + args.version[0]),
+        )
 
+        # opt-in episode videos of every Nth episode and of episodes with the given events
+        videos = None
+        video_every = int(args.record_video[0]) if args.record_video else 0
+        if video_every > 0 or args.video_events:
+            videos = EpisodeVideoRecorder(
+                os.path.join(root_directory, "videos", "v" + args.version[0]),
+                every=video_every,
+                events=args.video_events or [],
+                hud=bool(args.video_hud and args.video_hud[0] == "True"),
+            )
 
+        # opt-in live metrics over HTTP, served from background threads
+        telemetry = None
+        if args.telemetry_port and int(args.telemetry_port[0]) > 0:
+            telemetry = TrainingTelemetry(
+                int(args.telemetry_port[0]), args.telemetry_host[0] if args.telemetry_host else "127.0.0.1"
+            )
 
-        for episode in range(num_episodes):
-            torch.cuda.empty_cache()    #CHANGED
+        # opt-in offline dataset of all transitions, used by --operation pretrain
+        dataset_writer = None
+        if args.record_dataset and args.record_dataset[0] == "True":
+            dataset_writer = DatasetWriter(os.path.join(root_directory, "datasets", "v" + args.version[0]))
+
+        # expert warm start of the replay buffer, skipped when resuming since the buffer is restored
+        if start_episode == 0:
+            warm_start_stats = {"steps": 0}
+            if args.warm_start and int(args.warm_start[0]) > 0:
+                warm_start_stats = warm_start(
+                    env,
+                    replay_buffer,
+                    LaneFollowingExpert(env.action_space),
+                    int(args.warm_start[0]),
+                    max_num_steps,
+                    device,
+                    dataset_writer,
+                )
+                print(
+                    f"Warm start: {warm_start_stats['steps']} expert transitions in {warm_start_stats['episodes']} "
+                    f"episodes (mean {warm_start_stats['steps_mean']:.1f} steps, reward per step "
+                    f"{warm_start_stats['reward_per_step']:.3f}) in {warm_start_stats['time']:.1f} s"
+                )
+            save_warm_start(metrics.directory, warm_start_stats)
+
+        # attached after the warm start, so its resets and steps are not counted in episode 0
+        env.profiler = profiler
+
+        start_time = time.time()
+
+        for episode in range(start_episode, num_episodes):
             ep_deviation = []
             ep_angles = []
             ep_speed = []
+            ep_overtakes = 0
             num_ep = episode
-            state = env.reset() 
+            if env.scenarios is not None:
+                # curriculum over the scenario difficulty in "difficulty" mode
+                env.scenarios.difficulty = episode / max(1, num_episodes - 1)
+            profiler.start_episode(episode)
+            if telemetry is not None:
+                telemetry.update(episode=episode, epsilon=epsilon)
+            with profiler.phase("reset"):
+                state = env.reset()
             
             elapsed_since_last_iteration = time.time() - start_time
             start_time = time.time()
+            if trajectories is not None:
+                trajectories.start_episode(env, episode)
+            if videos is not None:
+                videos.start_episode(env, episode, title=f"Reward Function: {args.reward_function[0]}")
 
             # print(f"main, state.shape after reset = {state.shape.app}")
             # print(state)
             #     display.reset()
             total_reward = 0
+            ep_loss = 0
+            learner_time = 0.0
             done = False
             step = 0
 
             while step < max_num_steps and not done:
+                step_start = time.perf_counter()
                 # Convert state to the appropriate format and move to device
                 #print("Starting next step")
-                state_tensor = torch.from_numpy(state).unsqueeze(0).to(device)
-                #print("State tensor done")
-                # Select action using epsilon greedy policy
-                action = env.epsilon_greedy_action(state_tensor, epsilon)
-                next_state, reward, done, info = env.step(action)  # data here
+                with profiler.phase("action"):
+                    state_tensor = torch.from_numpy(state).unsqueeze(0).to(device)
+                    #print("State tensor done")
+                    # Select action using epsilon greedy policy
+                    action = env.epsilon_greedy_action(state_tensor, epsilon)
+                with profiler.phase("env.step"):
+                    next_state, reward, done, info = env.step(action)  # data here
                 # next_state = next_state
                 ep_deviation.append(info["lane_deviation"])
                 ep_angles.append(info["angle"])
                 ep_speed.append(info["speed"])
-                # Convert next_state to tensor and move to device
-                next_state_tensor = (
-                    torch.from_numpy(next_state).unsqueeze(0).to(device)
-                    if next_state is not None
-                    else None
-                )
-
-                replay_buffer.store(
-                    (state_tensor, env.action_idx, reward, next_state_tensor, done)
-                )
+                ep_overtakes += info["overtake"]
+                with profiler.phase("record"):
+                    if trajectories is not None:
+                        trajectories.record(env, reward, done, info)
+                    if videos is not None:
+                        videos.record(env, reward, info)
+                with profiler.phase("replay.store"):
+                    # Convert next_state to tensor and move to device
+                    next_state_tensor = (
+                        torch.from_numpy(next_state).unsqueeze(0).to(device)
+                        if next_state is not None
+                        else None
+                    )
+
+                    replay_buffer.store(
+                        (state_tensor, env.action_idx, reward, next_state_tensor, done)
+                    )
+                    if dataset_writer is not None and next_state is not None:
+                        dataset_writer.add(state, env.action_idx, reward, next_state, done)
                 #print("replay buffer stored")
                 state = next_state
                 total_reward += reward
@@ -1748,26 +1458,53 @@ if __name__ == "__main__":
 
                 # Optimize the model if the replay buffer has enough samples
                 #print("Replay buffer", replay_buffer, "gamma", gamma)
-                optimize_model(replay_buffer, batch_size, gamma) # HERE check batch size and what it contains 
+                learner_start = time.perf_counter()
+                with profiler.phase("optimize"):  # on CUDA this times the kernel launches
+                    loss = optimize_model(
+                        replay_buffer, batch_size, gamma, network, target_network, optimizer, prefetcher, feature_cache
+                    ) # HERE check batch size and what it contains 
+                learner_time += time.perf_counter() - learner_start
+                if loss is not None:
+                    ep_loss += loss  # stays on the device, read once per episode
                 #print("Model optimized")
 
                 if step % target_update == 0 or done:
                     #print("AHHH")
-                    target_network.load_state_dict(network.state_dict())
-
+                    with profiler.phase("target_sync"):
+                        target_network.load_state_dict(network.state_dict())
+                    if feature_cache is not None:
+                        feature_cache.invalidate()
+
+                metrics.record_step(
+                    episode=episode,
+                    step=step,
+                    reward=reward,
+                    lane_deviation=info["lane_deviation"],
+                    angle=info["angle"],
+                    speed=info["speed"],
+                    action=env.action_idx,
+                    loss=float(loss) if metrics.log_steps and loss is not None else np.nan,
+                    step_time=time.perf_counter() - step_start,
+                )
+                if hud is not None:
+                    throttle, steer = env.action_space[env.action_idx]
+                    hud.submit(
+                        env.image,
+                        episode=episode,
+                        step=step,
+                        time=time.time() - start_time,
+                        reward=reward,
+                        speed=info["speed"],
+                        lane_deviation=info["lane_deviation"],
+                        angle=info["angle"],
+                        throttle=throttle,
+                        steer=steer,
+                    )
                 step += 1
+                if telemetry is not None:
+                    telemetry.step()
                 # cv2.imshow(f'Car Agent in Episode {episode}', vis_img[:, :, ::-1])
                 # cv2.waitKey(5)
-
-                # hud.update(env.vehicle.get_velocity().x, throttle, steer)
-
-                # Get camera image
-                #camera_image = env.image  # Assumss
-
-                # Display HUD and camera view
-                # camera_image_with_hud = hud.tick(camera_image)
-                # cv2.imshow("Camera View with HUD", camera_image_with_hud)
-                # cv2.waitKey(1)
             # while loop ends
 
             print("Episode steps complete")
@@ -1780,38 +1517,128 @@ if __name__ == "__main__":
             #print ("Write data complete")
             # write this data to a file for frontend use
 
-            rewards = np.append(rewards, total_reward / step)
-            num_steps = np.append(num_steps, step)
-            data = [float(total_reward) / float(step), float(step)]
-            data2 = [lane_dev_avg, angle_avg, speed_avg]
-            #  print("data to be written", data)
-            writer.writerow(data)
-            writer2.writerow(data2)
-            file.flush()
-            file2.flush()
-            if total_reward > best_dict_reward:
+            rewards.append(total_reward / step)
+            num_steps.append(step)
+            phase_stats = profiler.episode_stats()
+            metrics.record_profile(episode, phase_stats)
+            metrics.record_episode(
+                episode=episode,
+                avg_reward=total_reward / step,
+                total_reward=total_reward,
+                steps=step,
+                lane_deviation=lane_dev_avg,
+                angle=angle_avg,
+                speed=speed_avg,
+                epsilon=epsilon,
+                loss=float(ep_loss) / step,
+                episode_time=time.time() - start_time,
+            )
+            # the legacy plot CSVs stay current after every episode, as before the metrics store
+            metrics.export_csv()
+            # best model is keyed on average reward per step so long and short episodes compare fairly
+            average_reward = total_reward / step
+            new_best = average_reward > best_dict_reward
+            if new_best:
                 print("Saving new best")
-                torch.save(
-                    target_network.state_dict(),
-                    os.path.join(save_path, "v" + args.version[0] + "_best_dqn_network_nn_model.pth") #CHANGED HERE
-                )
-                best_dict_reward = total_reward
+                best_dict_reward = average_reward
+            model_writer.save(target_network.state_dict(), episode, average_reward, best=new_best)
 
             print(
                 f"Episode {episode}: Total Reward: {total_reward}, Epsilon: {epsilon}, NumSteps: {step}"
             )
+            traffic_stats = env.traffic.episode_summary()
+            print(
+                f"Traffic: NPCs mean {traffic_stats['npc_mean']:.1f} max {traffic_stats['npc_max']} "
+                f"(target {traffic_stats['target']}, recycled {traffic_stats['recycled']}), "
+                f"tick mean {traffic_stats['tick_mean'] * 1000:.1f} ms p95 {traffic_stats['tick_p95'] * 1000:.1f} ms"
+            )
+            if isinstance(replay_buffer, CompressedReplayBuffer):
+                print(replay_buffer.report())
+            if prefetcher is not None:
+                print(prefetcher.episode_summary(learner_time))
+            if feature_cache is not None:
+                print(feature_cache.summary())
+            if hud is not None:
+                print(hud.summary())
+            print(memory.check(replay_buffer, network, target_network, optimizer))
+            if telemetry is not None:
+                telemetry.update(
+                    episode_reward=total_reward / step,
+                    loss=float(ep_loss) / step,
+                    reward_avg={"10": float(np.mean(rewards[-10:])), "100": float(np.mean(rewards[-100:]))},
+                    replay={"size": replay_buffer.size(), "capacity": replay_buffer.buffer.maxlen},
+                    phases=phase_stats,
+                    memory=memory.last,
+                )
+            trace_path = profiler.end_episode()
+            if trace_path is not None:
+                print(f"torch.profiler trace written to {trace_path}")
+            if args.profile:
+                print(format_profile(phase_stats, time.time() - start_time))
+            if trajectories is not None:
+                trajectory_report = trajectories.end_episode(time.time() - start_time)
+                if trajectory_report:
+                    print(trajectory_report)
+            if videos is not None:
+                video_report = videos.end_episode(time.time() - start_time)
+                if video_report:
+                    print(video_report)
+            if env.snapshots is not None:
+                env.snapshots.end_episode(env.from_snapshot, step, ep_overtakes)
+                print(env.snapshots.report(env.world.get_settings().fixed_delta_seconds or 0.05))
 
             # Update epsilon
             #     epsilon = max(epsilon_end, epsilon_decay * epsilon)
             epsilon = max(epsilon_end, epsilon - epsilon_decrement)
 
+            if checkpoint_every > 0 and (episode + 1) % checkpoint_every == 0:
+                checkpoint_start = time.time()
+                training_state = {
+                    "episode": episode,
+                    "epsilon": epsilon,
+                    "best_dict_reward": best_dict_reward,
+                    "rewards": rewards,
+                    "num_steps": num_steps,
+                    "lane_deviations": lane_deviations,
+                    "angles": angles,
+                    "speeds": speeds,
+                }
+                written = save_checkpoint(
+                    checkpoint_dir, training_state, network, target_network, optimizer, replay_buffer, fresh_replay
+                )
+                fresh_replay = False
+                print(
+                    f"Checkpoint saved ({written} new replay transitions) in {time.time() - checkpoint_start:.1f} s"
+                )
+                print(model_writer.summary())
+
         # Save the model's state dictionary
-        torch.save(
-            target_network.state_dict(),
-            os.path.join(save_path, "v" + args.version[0] + "_final_dqn_network_nn_model.pth"
-                         ))
-        file.close()
-        file2.close()
+        model_writer.save_as(
+            target_network.state_dict(), "v" + args.version[0] + "_final_dqn_network_nn_model.pth"
+        )
+        model_writer.close()
+        print(model_writer.summary())
+        metrics.export_csv()
+        if trajectories is not None:
+            trajectories.close()
+        if videos is not None:
+            videos.close()
+        if telemetry is not None:
+            telemetry.close()
+        if args.target_reward:
+            target_reward = float(args.target_reward[0])
+            warm_start_steps = load_warm_start(metrics.directory)["steps"]
+            needed = steps_to_reward(rewards, num_steps, target_reward, offset=warm_start_steps)
+            if needed is None:
+                print(f"Average reward per step {target_reward} not reached")
+            else:
+                print(
+                    f"Average reward per step {target_reward} reached after {needed} environment steps "
+                    f"({warm_start_steps} of them warm start); compare runs with python expert.py"
+                )
+        if dataset_writer is not None:
+            dataset_writer.close()
+            print(f"Offline dataset: {dataset_writer.written} transitions recorded")
 
         # for loop ends
 
@@ -1819,7 +1646,10 @@ if __name__ == "__main__":
         print(f"rewards = {rewards}")
         print(f"num_steps = {num_steps}")
 
-        # update plot for frontend
+        # update plot for frontend, matplotlib is only loaded once training is done
+        import matplotlib.pyplot as plt
+        from plotting import update_plot
+
         update_plot(rewards, num_steps, lane_deviations, angles, speeds)
         #   display.render()
         plt.show()
@@ -1840,6 +1670,58 @@ if __name__ == "__main__":
         plt.title("Steps per Episode")
         # Display the plot
         plt.show()
+    elif args.operation[0].lower() == "pretrain":
+        # offline pretraining from recorded transitions, fine-tune afterwards with --operation tune
+        batch_size = 32
+        gamma = 0.99
+        target_update = 10  # same target sync interval (in gradient steps) as online training
+        pretrain_steps = int(args.pretrain_steps[0]) if args.pretrain_steps else 10000
+        dataset = OfflineDataset(args.dataset, batch_size=batch_size)
+        print(f"Pretraining on {dataset.size} transitions from {len(dataset.shards)} shards")
+        losses = []
+        pretrain_start = time.time()
+        for update, batch in enumerate(dataset):
+            state_batch, action_batch, reward_batch, next_state_batch, done_batch = (
+                tensor.to(device, non_blocking=True) for tensor in batch
+            )
+            losses.append(
+                update_network(
+                    network,
+                    target_network,
+                    optimizer,
+                    state_batch,
+                    action_batch,
+                    reward_batch,
+                    next_state_batch,
+                    done_batch,
+                    gamma,
+                )
+            )
+            if update % target_update == 0:
+                target_network.load_state_dict(network.state_dict())
+            if (update + 1) % 500 == 0 or update + 1 == pretrain_steps:
+                print(
+                    f"Update {update + 1}/{pretrain_steps}: loss {float(torch.stack(losses).mean()):.4f}, "
+                    + dataset.summary(time.time() - pretrain_start)
+                )
+                losses = []
+            if update + 1 == pretrain_steps:
+                break
+        target_network.load_state_dict(network.state_dict())
+        pretrained_name = "v" + args.version[0] + "_pretrained_dqn_network_nn_model.pth"
+        os.makedirs(save_path, exist_ok=True)
+        torch.save(target_network.state_dict(), os.path.join(save_path, pretrained_name))
+        print(
+            f"Saved {pretrained_name}, fine-tune with --operation tune --save-path {pretrained_name[1:]}"
+        )
+    elif args.operation[0].lower() == "replay":
+        # re-drive a recorded episode with its recorded controls as a regression check
+        result = replay_trajectory(env, args.trajectory[0])
+        print(
+            f"Replayed {result['steps']} steps of {args.trajectory[0]}: position error max "
+            f"{result['max_position_error']:.3f} m mean {result['mean_position_error']:.3f} m, "
+            f"reward error max {result['max_reward_error']:.4f}, ended early at {result['ended_early']}"
+        )
     elif args.operation[0].lower() == "load":
         print(f"Loading model from {args.save_path[0]}")
         network = DuelingDDQN(NUM_ACTIONS).to(device)
@@ -1861,6 +1743,18 @@ if __name__ == "__main__":
                 state_tensor = torch.from_numpy(state).unsqueeze(0).to(device)
                 action = env.epsilon_greedy_action(state_tensor, 0.1)
                 state, reward, done, info = env.step(action)
+                if hud is not None:
+                    throttle, steer = env.action_space[env.action_idx]
+                    hud.submit(
+                        env.image,
+                        episode=episode,
+                        reward=reward,
+                        speed=info["speed"],
+                        lane_deviation=info["lane_deviation"],
+                        angle=info["angle"],
+                        throttle=throttle,
+                        steer=steer,
+                    )
                 ep_angles.append(info["angle"])
                 ep_deviation.append(info["lane_deviation"])
                 if collided:
@@ -1883,4 +1777,7 @@ if __name__ == "__main__":
         )
         print(
             f"Average lane deviation over {num_episodes} episodes: {average_lane_dev}"
-        )
\ No newline at end of file
+        )
+
+    if hud is not None:
+        hud.close()
@@ -0,0 +1,351 @@
+import glob
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+import numpy as np
+import torch
+
+
+def save_replay(replay_buffer, directory, fresh=False):
+    """
+    Write the replay buffer contents to memory-mapped files.
+
+    The files are a ring with the capacity of the buffer, indexed by the global
+    transition count, so each call only writes the transitions stored since the
+    previous call. The metadata file holds the actions, rewards and done flags
+    and the range [first, total) of valid transitions, and is replaced
+    atomically. Before frames are overwritten in place, a metadata file that no
+    longer covers their slots is committed, so after a crash at any point the
+    metadata only describes slots whose frames belong to it. A fresh ring is
+    started when requested (the first save of a run that was not resumed) or
+    when the saved files are ahead of the buffer, so transitions of an earlier
+    run in the same directory are never mixed in.
+
+    Args:
+        replay_buffer (ReplayBuffer): The replay buffer.
+        directory (str): Checkpoint directory.
+        fresh (bool): Ignore an existing ring and start a new one.
+
+    Returns:
+        int: Number of transitions written.
+    """
+    replay_buffer.flush()
+    capacity = replay_buffer.buffer.maxlen
+    size = replay_buffer.size()
+    if size == 0:
+        return 0
+    meta_path = os.path.join(directory, "replay_meta.npz")
+    states_path = os.path.join(directory, "replay_states.npy")
+    next_states_path = os.path.join(directory, "replay_next_states.npy")
+
+    total = replay_buffer.total
+    saved_total = 0
+    if not fresh and os.path.exists(meta_path) and os.path.exists(states_path):
+        meta = dict(np.load(meta_path))
+        saved_total = int(meta["total"])
+        fresh = saved_total > total  # written by another run, or by this one after its last training state
+    else:
+        fresh = True
+    if not fresh:
+        actions, rewards, dones = meta["actions"], meta["rewards"], meta["dones"]
+        states = np.load(states_path, mmap_mode="r+")
+        next_states = np.load(next_states_path, mmap_mode="r+")
+        capacity = len(states)  # the ring keeps its size if the buffer was resized since
+        saved_first = _first(meta, capacity)
+        # the slots about to be written hold transitions older than total - capacity
+        kept_first = max(saved_first, total - capacity)
+        if kept_first > saved_first:
+            _write_meta(meta_path, actions, rewards, dones, min(kept_first, saved_total), saved_total)
+    else:
+        saved_total = 0
+        saved_first = 0
+        if os.path.exists(meta_path):
+            os.remove(meta_path)  # the old meta must not describe the new ring after a crash
+        frame_shape = tuple(replay_buffer.get(0)[0].shape)
+        states = np.lib.format.open_memmap(states_path, "w+", np.uint8, (capacity,) + frame_shape)
+        next_states = np.lib.format.open_memmap(next_states_path, "w+", np.uint8, (capacity,) + frame_shape)
+        actions = np.zeros(capacity, dtype=np.int64)
+        rewards = np.zeros(capacity, dtype=np.float32)
+        dones = np.zeros(capacity, dtype=np.bool_)
+
+    first = max(saved_total, total - size)
+    for index in range(first, total):
+        state, action, reward, next_state, done = replay_buffer.get(index - (total - size))
+        slot = index % capacity
+        states[slot] = state
+        next_states[slot] = next_state
+        actions[slot] = action
+        rewards[slot] = reward
+        dones[slot] = done
+    states.flush()
+    next_states.flush()
+    # transitions dropped from the buffer before they were saved leave a gap, only the newer ones stay valid
+    valid_first = first if first > saved_total else saved_first
+    _write_meta(meta_path, actions, rewards, dones, max(valid_first, total - capacity, 0), total)
+    return total - first
+
+
+def _first(meta, capacity):
+    # metadata written before the valid range was stored covers the last capacity transitions
+    if "first" in meta:
+        return int(meta["first"])
+    return max(0, int(meta["total"]) - capacity)
+
+
+def _write_meta(meta_path, actions, rewards, dones, first, total):
+    with open(meta_path + ".tmp", "wb") as file:
+        np.savez(file, actions=actions, rewards=rewards, dones=dones, first=first, total=total)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def load_replay(replay_buffer, directory, device, total=None):
+    """
+    Refill the replay buffer from the memory-mapped files of a checkpoint.
+
+    Args:
+        replay_buffer (ReplayBuffer): The (empty) replay buffer.
+        directory (str): Checkpoint directory.
+        device (torch.device): Device the transitions are moved to.
+        total (int, optional): Transition count of the training state being restored; newer
+            transitions (saved before a crash prevented the training state from being written) are skipped.
+
+    Returns:
+        int: Number of transitions restored.
+    """
+    meta_path = os.path.join(directory, "replay_meta.npz")
+    if not os.path.exists(meta_path):
+        return 0
+    meta = dict(np.load(meta_path))
+    states = np.load(os.path.join(directory, "replay_states.npy"), mmap_mode="r")
+    next_states = np.load(os.path.join(directory, "replay_next_states.npy"), mmap_mode="r")
+    capacity = len(states)
+    saved_total = int(meta["total"])
+    total = saved_total if total is None else min(total, saved_total)
+    first = max(_first(meta, capacity), total - min(capacity, replay_buffer.buffer.maxlen))
+    for index in range(first, total):
+        slot = index % capacity
+        replay_buffer.store(
+            (
+                torch.from_numpy(np.array(states[slot])).unsqueeze(0).to(device),
+                int(meta["actions"][slot]),
+                float(meta["rewards"][slot]),
+                torch.from_numpy(np.array(next_states[slot])).unsqueeze(0).to(device),
+                bool(meta["dones"][slot]),
+            )
+        )
+    # the compressed buffer stores asynchronously and counts its transitions when they are compressed
+    replay_buffer.flush()
+    replay_buffer.total = total
+    return replay_buffer.size()
+
+
+def save_checkpoint(directory, training_state, network, target_network, optimizer, replay_buffer, fresh=False):
+    """
+    Save the complete training state so a run can be resumed.
+
+    Args:
+        directory (str): Checkpoint directory.
+        training_state (dict): Loop state such as episode, epsilon, best reward and metric history.
+        network (nn.Module): The online network.
+        target_network (nn.Module): The target network.
+        optimizer (torch.optim.Optimizer): The optimizer.
+        replay_buffer (ReplayBuffer): The replay buffer.
+        fresh (bool): Start a new replay ring, for the first checkpoint of a run that was not resumed.
+
+    Returns:
+        int: Number of replay transitions written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    written = save_replay(replay_buffer, directory, fresh)
+    state = {
+        "training_state": training_state,
+        "network": network.state_dict(),
+        "target_network": target_network.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "random": random.getstate(),
+        "numpy_random": np.random.get_state(),
+        "torch_random": torch.get_rng_state(),
+        "replay_total": replay_buffer.total,  # pairs the state with its replay transitions on resume
+    }
+    # write to a temporary file first so a crash never leaves a truncated checkpoint
+    path = os.path.join(directory, "training_state.pt")
+    torch.save(state, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return written
+
+
+def load_checkpoint(directory, network, target_network, optimizer, replay_buffer, device):
+    """
+    Restore the complete training state saved by save_checkpoint.
+
+    Args:
+        directory (str): Checkpoint directory.
+        network (nn.Module): The online network.
+        target_network (nn.Module): The target network.
+        optimizer (torch.optim.Optimizer): The optimizer.
+        replay_buffer (ReplayBuffer): The (empty) replay buffer.
+        device (torch.device): Device the replay transitions are moved to.
+
+    Returns:
+        dict or None: The saved training state, None if there is no checkpoint.
+    """
+    path = os.path.join(directory, "training_state.pt")
+    if not os.path.exists(path):
+        return None
+    # loaded on the CPU, where the RNG state has to stay; load_state_dict moves the weights and the
+    # optimizer state to the devices of the parameters
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    network.load_state_dict(state["network"])
+    target_network.load_state_dict(state["target_network"])
+    optimizer.load_state_dict(state["optimizer"])
+    random.setstate(state["random"])
+    np.random.set_state(state["numpy_random"])
+    torch.set_rng_state(state["torch_random"])
+    load_replay(replay_buffer, directory, device, state.get("replay_total"))
+    return state["training_state"]
+
+
+class CheckpointWriter:
+    """
+    Background writer for model checkpoints.
+
+    Weights are copied into CPU memory on the calling thread and written by a
+    worker thread to a temporary file that is atomically renamed into place, so
+    the training loop never waits on disk I/O and a crash never leaves a
+    truncated file. Per-episode checkpoints are pruned to the top-k by
+    evaluation metric plus the most recent ones. A failed write (e.g. a full
+    disk) is reported and skipped, so the worker keeps draining the queue and
+    training never blocks on it.
+
+    Args:
+        directory (str): Directory the checkpoints are written to.
+        prefix (str): File name prefix, e.g. "vOTv1".
+        top_k (int): Number of best checkpoints (by metric) to keep.
+        keep_last (int): Number of most recent checkpoints to keep.
+        max_pending (int): Maximum number of checkpoints waiting to be written.
+
+    Attributes:
+        latencies (list): Seconds from submission to completed write, per write.
+        failures (int): Number of writes that failed.
+    """
+
+    def __init__(self, directory, prefix, top_k=3, keep_last=2, max_pending=4):
+        self.directory = directory
+        self.prefix = prefix
+        self.top_k = top_k
+        self.keep_last = keep_last
+        self.latencies = []
+        self.failures = 0
+        self._episodes = []  # (metric, episode, path) of the retained per-episode checkpoints
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def restore(self, episode_metrics):
+        """
+        Take over the per-episode checkpoints of a resumed run, so they are pruned like new ones.
+
+        Must be called before the first save(). Checkpoints of episodes without
+        a metric (written after the restored training state) are left alone and
+        overwritten when those episodes run again.
+
+        Args:
+            episode_metrics (list): Evaluation metric of every episode so far, indexed by episode.
+        """
+        pattern = re.compile(re.escape(self.prefix) + r"_ep(\d+)_dqn_network_nn_model\.pth$")
+        for path in glob.glob(os.path.join(self.directory, f"{self.prefix}_ep*_dqn_network_nn_model.pth")):
+            match = pattern.search(os.path.basename(path))
+            if match and int(match.group(1)) < len(episode_metrics):
+                episode = int(match.group(1))
+                self._episodes.append((episode_metrics[episode], episode, path))
+
+    def save(self, state_dict, episode, metric, best=False):
+        """
+        Queue a per-episode checkpoint, also written as the best model if requested.
+
+        Args:
+            state_dict (dict): The model state dict.
+            episode (int): The episode of the checkpoint.
+            metric (float): Evaluation metric used by the retention policy (higher is better).
+            best (bool): Whether to also write it as the best model.
+        """
+        weights = self._to_cpu(state_dict)
+        path = os.path.join(self.directory, f"{self.prefix}_ep{episode:05d}_dqn_network_nn_model.pth")
+        self._queue.put((weights, path, (metric, episode), time.perf_counter()))
+        if best:
+            best_path = os.path.join(self.directory, f"{self.prefix}_best_dqn_network_nn_model.pth")
+            self._queue.put((weights, best_path, None, time.perf_counter()))
+
+    def save_as(self, state_dict, filename):
+        """
+        Queue a checkpoint under a fixed file name that is not subject to retention.
+
+        Args:
+            state_dict (dict): The model state dict.
+            filename (str): File name inside the checkpoint directory.
+        """
+        weights = self._to_cpu(state_dict)
+        self._queue.put((weights, os.path.join(self.directory, filename), None, time.perf_counter()))
+
+    def close(self):
+        """
+        Wait for all queued checkpoints to be written and stop the worker.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def summary(self):
+        """
+        Summarize the write latency.
+
+        Returns:
+            str: Number of writes, mean and max latency and the pending queue size.
+        """
+        if not self.latencies:
+            return f"Checkpoint writer: no writes yet, {self.failures} failed"
+        return (
+            f"Checkpoint writer: {len(self.latencies)} writes, latency mean "
+            f"{np.mean(self.latencies) * 1000:.0f} ms max {np.max(self.latencies) * 1000:.0f} ms, "
+            f"{self._queue.qsize()} pending, {self.failures} failed"
+        )
+
+    @staticmethod
+    def _to_cpu(state_dict):
+        return {key: value.detach().to("cpu", copy=True) for key, value in state_dict.items()}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            weights, path, retention, submitted = item
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                torch.save(weights, path + ".tmp")
+                os.replace(path + ".tmp", path)
+            except Exception as error:  # a dead worker would block save() and close() forever
+                self.failures += 1
+                print(f"Checkpoint writer: writing {path} failed: {error}")
+                if os.path.exists(path + ".tmp"):
+                    os.remove(path + ".tmp")
+                continue
+            self.latencies.append(time.perf_counter() - submitted)
+            if retention is not None:
+                self._episodes.append(retention + (path,))
+                self._prune()
+
+    def _prune(self):
+        best = sorted(self._episodes, key=lambda entry: entry[0], reverse=True)[: self.top_k]
+        last = sorted(self._episodes, key=lambda entry: entry[1])[-self.keep_last:] if self.keep_last else []
+        keep = {entry[2] for entry in best + last}
+        for entry in self._episodes:
+            if entry[2] not in keep and os.path.exists(entry[2]):
+                try:
+                    os.remove(entry[2])
+                except OSError as error:
+                    print(f"Checkpoint writer: removing {entry[2]} failed: {error}")
+        self._episodes = [entry for entry in self._episodes if entry[2] in keep]
@@ -0,0 +1,316 @@
+import argparse
+
+
+def build_parser():
+    """
+    Build the command line parser of carla_lane_keeping_d3qn.py.
+
+    Kept free of heavy imports so that --help and usage errors return
+    without loading torch, OpenCV or the CARLA client.
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Run the simulator with random actions"
+    )
+    parser.add_argument(
+        "--version",
+        type=str,
+        nargs="+",
+        help="version number for model naming",
+        required=False,
+    )
+    parser.add_argument(
+        "--operation", type=str, nargs="+", help="Load or New or Tune or Replay or Pretrain", required=True
+    )
+    parser.add_argument(
+        "--save-path",
+        type=str,
+        nargs="+",
+        help="Path to the saved model state",
+        required=False,
+    )
+    # reward function
+    parser.add_argument(
+        "--reward-function",
+        type=str,
+        nargs="+",
+        help="1 or 2 or 3 or 4 or",
+        required=True,
+    )
+    parser.add_argument(
+        "--map",
+        type=str,
+        nargs="+",
+        help="Specify CARLA map: (Town01, ...  Town07)",
+        required=False,
+    )
+    parser.add_argument(
+        "--epsilon-decrement", type=str, nargs="+", help="Epsilon", required=False
+    )
+    parser.add_argument(
+        "--num-episodes",
+        type=str,
+        nargs="+",
+        help="Number of episodes for training",
+        required=False,
+    )
+    parser.add_argument(
+        "--max-steps",
+        type=str,
+        nargs="+",
+        help="Maximum number of steps per episode",
+        required=False,
+    )
+    parser.add_argument(
+        "--random-spawn",
+        type=str,
+        nargs=1,
+        help="Vehicle spawn location random? (True/False)",
+        required=False,
+    )
+    parser.add_argument(
+        "--reload-world",
+        type=str,
+        nargs=1,
+        help="Reset episodes by reloading the map instead of destroying actors? (True/False)",
+        required=False,
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=str,
+        nargs=1,
+        help="Use the cached traffic scenario pool: round-robin or difficulty (curriculum)",
+        required=False,
+    )
+    parser.add_argument(
+        "--snapshot-fraction",
+        type=str,
+        nargs=1,
+        help="Fraction of resets that start from a stored world snapshot (default 0, disabled)",
+        required=False,
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume training from the last full checkpoint of --version",
+        required=False,
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=str,
+        nargs=1,
+        help="Number of episodes between full training checkpoints, 0 to disable (default 10)",
+        required=False,
+    )
+    parser.add_argument(
+        "--keep-best",
+        type=str,
+        nargs=1,
+        help="Number of best per-episode model checkpoints kept, by average reward per step (default 3)",
+        required=False,
+    )
+    parser.add_argument(
+        "--keep-last",
+        type=str,
+        nargs=1,
+        help="Number of most recent per-episode model checkpoints kept (default 2)",
+        required=False,
+    )
+    parser.add_argument(
+        "--log-steps",
+        type=str,
+        nargs=1,
+        help="Record per-step metrics in the metrics store? (True/False)",
+        required=False,
+    )
+    parser.add_argument(
+        "--record-trajectories",
+        type=str,
+        nargs=1,
+        help="Record a binary trajectory of every Nth episode, 0 to disable (default 0)",
+        required=False,
+    )
+    parser.add_argument(
+        "--record-frames",
+        type=str,
+        nargs=1,
+        help="Store a downsampled camera frame every Nth step of recorded trajectories, 0 for none (default 0)",
+        required=False,
+    )
+    parser.add_argument(
+        "--record-video",
+        type=str,
+        nargs=1,
+        help="Record a video of every Nth episode, 0 to disable (default 0)",
+        required=False,
+    )
+    parser.add_argument(
+        "--video-events",
+        type=str,
+        nargs="+",
+        help="Also keep videos of episodes with these events: collision, overtake",
+        required=False,
+    )
+    parser.add_argument(
+        "--video-hud",
+        type=str,
+        nargs=1,
+        help="Draw the HUD onto recorded videos? (True/False)",
+        required=False,
+    )
+    parser.add_argument(
+        "--trajectory",
+        type=str,
+        nargs=1,
+        help="Recorded episode directory to re-drive with --operation replay",
+        required=False,
+    )
+    parser.add_argument(
+        "--warm-start",
+        type=str,
+        nargs=1,
+        help="Number of lane-following expert transitions stored in the replay buffer before training (default 0)",
+        required=False,
+    )
+    parser.add_argument(
+        "--target-reward",
+        type=str,
+        nargs=1,
+        help="Report the environment steps until the 10-episode average reward per step reaches this value",
+        required=False,
+    )
+    parser.add_argument(
+        "--target-update",
+        type=str,
+        nargs=1,
+        help="Number of steps between target network syncs (default 10)",
+        required=False,
+    )
+    parser.add_argument(
+        "--cache-target-features",
+        type=str,
+        nargs=1,
+        help="Cache target encoder features of replay frames between target syncs, disabled when --target-update is too short for frames to repeat and with --prefetch-batches or --compress-replay? (True/False)",
+        required=False,
+    )
+    parser.add_argument(
+        "--prefetch-batches",
+        type=str,
+        nargs=1,
+        help="Number of replay batches assembled ahead by a background thread, 0 to disable (default 0)",
+        required=False,
+    )
+    parser.add_argument(
+        "--compress-replay",
+        type=str,
+        nargs=1,
+        help="Store replay frames compressed and deduplicated, decompressed ahead of sampling? (True/False)",
+        required=False,
+    )
+    parser.add_argument(
+        "--record-dataset",
+        type=str,
+        nargs=1,
+        help="Append every training transition to the offline dataset datasets/v<version>? (True/False)",
+        required=False,
+    )
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        nargs="+",
+        help="Dataset or checkpoint directories to pretrain from with --operation pretrain",
+        required=False,
+    )
+    parser.add_argument(
+        "--pretrain-steps",
+        type=str,
+        nargs=1,
+        help="Number of offline gradient steps of --operation pretrain (default 10000)",
+        required=False,
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        nargs=1,
+        help="Host of the CARLA server (default localhost)",
+        required=False,
+    )
+    parser.add_argument(
+        "--port",
+        type=str,
+        nargs=1,
+        help="Port of the CARLA server (default 2000)",
+        required=False,
+    )
+    parser.add_argument(
+        "--tm-port",
+        type=str,
+        nargs=1,
+        help="Port of the Traffic Manager (default 8000)",
+        required=False,
+    )
+    parser.add_argument(
+        "--npc-count",
+        type=str,
+        nargs=1,
+        help="Target number of NPC vehicles kept around the ego (default 20)",
+        required=False,
+    )
+    parser.add_argument(
+        "--npc-radius",
+        type=str,
+        nargs=1,
+        help="Radius in meters around the ego in which NPCs are kept (default 100)",
+        required=False,
+    )
+    parser.add_argument(
+        "--tick-budget",
+        type=str,
+        nargs=1,
+        help="Tick time budget in seconds before NPC density is reduced, e.g. 0.05; 0 keeps the NPC count fixed (default 0)",
+        required=False,
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=str,
+        nargs=1,
+        help="Memory budget in GB of the replay device (host RSS or CUDA memory); sizes the replay buffer and sheds capacity when exceeded",
+        required=False,
+    )
+    parser.add_argument(
+        "--telemetry-port",
+        type=str,
+        nargs=1,
+        help="Serve live training metrics on this port at /metrics (Prometheus) and /json, 0 to disable (default 0)",
+        required=False,
+    )
+    parser.add_argument(
+        "--telemetry-host",
+        type=str,
+        nargs=1,
+        help="Address the telemetry server binds to (default 127.0.0.1, local connections only)",
+        required=False,
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a per-phase timing breakdown at the end of each episode",
+        required=False,
+    )
+    parser.add_argument(
+        "--profile-episodes",
+        type=str,
+        nargs="+",
+        help="Episodes to record a torch.profiler trace of, written to profiles/v<version>",
+        required=False,
+    )
+    parser.add_argument(
+        "--hud",
+        type=str,
+        nargs=1,
+        help="Show the camera view with the HUD from a display thread, frames are dropped rather than slowing training (True/False, default False)",
+        required=False,
+    )
+    return parser
@@ -0,0 +1,225 @@
+import hashlib
+import queue
+import random
+import threading
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+import torch
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # lz4 is optional, zlib is always available
+    lz4_frame = None
+
+
+class CompressedReplayBuffer:
+    """
+    Replay buffer that stores camera frames losslessly compressed and deduplicated.
+
+    Every frame is hashed and stored once in a reference-counted frame store,
+    so the next state of a transition and the state of the following one (the
+    same image), as well as identical frames while the ego stands still, cost
+    a single compressed copy. Hashing and compression run on a background
+    thread fed by store(), and a second thread samples and decompresses the
+    next batches ahead of sample(). Drop-in replacement for ReplayBuffer.
+
+    Args:
+        capacity (int): Maximum number of transitions.
+        batch_size (int): Size of the batches prepared ahead of sampling.
+        prefetch (int): Number of batches prepared ahead.
+        codec (str): "lz4" (when installed) or "zlib".
+        level (int): Compression level of zlib.
+
+    Attributes:
+        buffer (deque): Stored transitions as (state hash, action, reward, next state hash, done).
+        total (int): Number of transitions ever stored.
+        sample_times (list): Seconds sample() waited for each batch.
+    """
+
+    def __init__(self, capacity, batch_size=32, prefetch=2, codec="lz4", level=1):
+        self.buffer = deque(maxlen=capacity)
+        self.total = 0
+        self.batch_size = batch_size
+        self.codec = codec if codec == "zlib" or lz4_frame is not None else "zlib"
+        self.level = level
+        self.frames = {}  # hash -> [compressed bytes, reference count]
+        self.frame_shape = None
+        self.compressed_bytes = 0
+        self.sample_times = []
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._ready = queue.Queue(maxsize=prefetch)
+        self._compressor = threading.Thread(target=self._compress, daemon=True)
+        self._compressor.start()
+        self._prefetcher = threading.Thread(target=self._prefetch, daemon=True)
+        self._prefetcher.start()
+
+    def store(self, experience):
+        """
+        Queue a new experience for compression.
+
+        Args:
+            experience: (state, action, reward, next_state, done) with the states as
+                (1, H, W, 3) tensors or (H, W, 3) arrays.
+        """
+        state, action, reward, next_state, done = experience
+        self._pending.put((_to_frame(state), action, reward, _to_frame(next_state), done))
+
+    def sample(self, batch_size):
+        """
+        Take the next prefetched batch of experiences.
+
+        Args:
+            batch_size (int): Number of experiences, must match the prefetched batch size.
+
+        Returns:
+            list: Experiences with the states as (1, H, W, 3) CPU tensors.
+        """
+        if batch_size != self.batch_size:
+            raise ValueError(f"Batches are prefetched with {self.batch_size} experiences, got {batch_size}")
+        sample_start = time.perf_counter()
+        batch = self._ready.get()
+        self.sample_times.append(time.perf_counter() - sample_start)
+        return batch
+
+    def size(self):
+        """
+        Get the current size of the replay buffer.
+
+        Returns:
+            int: The current number of experiences stored in the buffer.
+        """
+        return len(self.buffer)
+
+    def flush(self):
+        """
+        Wait until all stored experiences are compressed.
+        """
+        self._pending.join()
+
+    def resize(self, capacity):
+        """
+        Change the capacity of the replay buffer, dropping the oldest transitions that no longer fit.
+
+        Args:
+            capacity (int): New maximum number of transitions.
+        """
+        with self._lock:
+            while len(self.buffer) > capacity:
+                evicted = self.buffer.popleft()
+                self._release(evicted[0])
+                self._release(evicted[3])
+            self.buffer = deque(self.buffer, maxlen=capacity)
+
+    def get(self, index):
+        """
+        Get a stored experience with its frames decompressed.
+
+        Args:
+            index (int): Position in the buffer, 0 is the oldest.
+
+        Returns:
+            tuple: (state, action, reward, next_state, done) with the frames as (H, W, 3) arrays.
+        """
+        with self._lock:
+            state_hash, action, reward, next_state_hash, done = self.buffer[index]
+            blobs = self.frames[state_hash][0], self.frames[next_state_hash][0]
+        return self._decode(blobs[0]), action, reward, self._decode(blobs[1]), done
+
+    def report(self):
+        """
+        Summarize the compression ratio and the sample latency.
+
+        Returns:
+            str: Stored transitions and unique frames, raw and compressed size, and sample latency.
+        """
+        with self._lock:
+            unique = len(self.frames)
+            transitions = len(self.buffer)
+            compressed = self.compressed_bytes
+        raw = 2 * transitions * int(np.prod(self.frame_shape)) if self.frame_shape else 0
+        recent = self.sample_times[-1000:]
+        return (
+            f"Compressed replay ({self.codec}): {transitions} transitions, {unique} unique frames, "
+            f"{raw / 1e6:.0f} MB raw -> {compressed / 1e6:.1f} MB ({raw / max(compressed, 1):.1f}x), "
+            f"sample latency mean {np.mean(recent) * 1000 if recent else 0.0:.2f} ms"
+        )
+
+    def _encode(self, frame):
+        if self.codec == "lz4":
+            return lz4_frame.compress(frame.tobytes())
+        return zlib.compress(frame.tobytes(), self.level)
+
+    def _decode(self, blob):
+        # decompressed into a bytearray so the frame is writable, as torch.from_numpy expects
+        if self.codec == "lz4":
+            data = lz4_frame.decompress(blob, return_bytearray=True)
+        else:
+            data = bytearray(zlib.decompress(blob))
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.frame_shape)
+
+    def _compress(self):
+        while True:
+            state, action, reward, next_state, done = self._pending.get()
+            self.frame_shape = state.shape
+            keys = []
+            for frame in (state, next_state):
+                key = hashlib.blake2b(frame.data, digest_size=16).digest()
+                with self._lock:
+                    known = key in self.frames
+                    if known:
+                        self.frames[key][1] += 1
+                if not known:
+                    blob = self._encode(frame)  # outside the lock so sampling is not blocked
+                    with self._lock:
+                        if key in self.frames:
+                            self.frames[key][1] += 1
+                        else:
+                            self.frames[key] = [blob, 1]
+                            self.compressed_bytes += len(blob)
+                keys.append(key)
+            with self._lock:
+                if len(self.buffer) == self.buffer.maxlen:
+                    evicted = self.buffer[0]
+                    self._release(evicted[0])
+                    self._release(evicted[3])
+                self.buffer.append((keys[0], action, reward, keys[1], done))
+                self.total += 1
+            self._pending.task_done()
+
+    def _release(self, key):
+        entry = self.frames[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            self.compressed_bytes -= len(entry[0])
+            del self.frames[key]
+
+    def _prefetch(self):
+        while True:
+            if len(self.buffer) < self.batch_size:
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                entries = random.sample(self.buffer, self.batch_size)
+                blobs = [(self.frames[e[0]][0], self.frames[e[3]][0]) for e in entries]
+            # decompression releases the GIL, so it overlaps with the learner
+            batch = [
+                (
+                    torch.from_numpy(self._decode(state_blob)).unsqueeze(0),
+                    entry[1],
+                    entry[2],
+                    torch.from_numpy(self._decode(next_state_blob)).unsqueeze(0),
+                    entry[4],
+                )
+                for entry, (state_blob, next_state_blob) in zip(entries, blobs)
+            ]
+            self._ready.put(batch)
+
+
+def _to_frame(state):
+    if isinstance(state, torch.Tensor):
+        state = state.detach().cpu().numpy()
+    return np.ascontiguousarray(state.reshape(state.shape[-3:]), dtype=np.uint8)
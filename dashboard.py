@@ -0,0 +1,227 @@
+import os
+import time
+import tkinter as tk
+
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+from metrics_store import MetricsReader
+
+
+# Episode columns tailed by the dashboard
+DASHBOARD_COLUMNS = ["avg_reward", "steps", "lane_deviation", "angle", "speed"]
+
+
+def minmax_decimate(x, y, max_points):
+    """
+    Downsample a series to at most max_points, keeping the minimum and maximum of every bucket.
+
+    Unlike taking every Nth point, spikes and dips stay visible however long the series is.
+
+    Args:
+        x (np.ndarray): X values.
+        y (np.ndarray): Y values.
+        max_points (int): Maximum number of points returned.
+
+    Returns:
+        tuple: The decimated x and y values, in their original order.
+    """
+    count = len(y)
+    if count <= max_points:
+        return x, y
+    buckets = max_points // 2
+    size = -(-count // buckets)  # ceiling division
+    padded = np.concatenate([y, np.full(buckets * size - count, y[-1])]).reshape(buckets, size)
+    low = padded.argmin(axis=1)
+    high = padded.argmax(axis=1)
+    base = np.arange(buckets) * size
+    index = np.stack([base + np.minimum(low, high), base + np.maximum(low, high)], axis=1).ravel()
+    index = np.minimum(index, count - 1)
+    return x[index], y[index]
+
+
+class RunningTrend:
+    """
+    Least squares trend line and correlation maintained from running sums.
+
+    Replaces refitting np.polyfit over all episodes on every redraw; adding
+    new points costs O(new points).
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+
+    def add(self, x, y):
+        """
+        Add points to the fit.
+
+        Args:
+            x (np.ndarray): X values.
+            y (np.ndarray): Y values.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.n += len(x)
+        self.sx += x.sum()
+        self.sy += y.sum()
+        self.sxx += (x * x).sum()
+        self.sxy += (x * y).sum()
+        self.syy += (y * y).sum()
+
+    def fit(self):
+        """
+        Get the current trend line.
+
+        Returns:
+            tuple: Slope, intercept and the correlation coefficient (nan with fewer than two points).
+        """
+        var_x = self.n * self.sxx - self.sx**2
+        var_y = self.n * self.syy - self.sy**2
+        if self.n < 2 or var_x <= 0:
+            return 0.0, (self.sy / self.n if self.n else 0.0), float("nan")
+        cov = self.n * self.sxy - self.sx * self.sy
+        slope = cov / var_x
+        intercept = (self.sy - slope * self.sx) / self.n
+        correlation = cov / np.sqrt(var_x * var_y) if var_y > 0 else float("nan")
+        return slope, intercept, correlation
+
+
+class TrainingDashboard:
+    """
+    Live training plots embedded in a Tk window.
+
+    A Tk timer tails the run's metrics store, reading only the episodes
+    appended since the previous poll, updates the existing plot lines with
+    min/max-decimated series and redraws the canvas, so the UI never blocks
+    and long runs redraw as fast as short ones.
+
+    Args:
+        master (tk.Misc): Parent widget.
+        directory (str): Metrics store directory of the run, e.g. metrics/vOTv1.
+        interval (int): Polling interval in milliseconds.
+        max_points (int): Maximum number of points drawn per series.
+    """
+
+    def __init__(self, master, directory, interval=1000, max_points=2000):
+        self.master = master
+        self.directory = directory
+        self.interval = interval
+        self.max_points = max_points
+        self.reader = None
+        self._after = None
+        self._reset()
+
+        self.figure = Figure(figsize=(10, 8))
+        axes = [self.figure.add_subplot(4, 1, i + 1) for i in range(4)]
+        self.axes = axes
+        (self.reward_line,) = axes[0].plot([], [])
+        axes[0].set_xlabel("Training Episodes")
+        axes[0].set_ylabel("Average Reward per Episode")
+        axes[0].set_title("Average Reward")
+        (self.steps_line,) = axes[1].plot([], [])
+        axes[1].set_xlabel("Training Episodes")
+        axes[1].set_ylabel("Number of Steps per Episode")
+        axes[1].set_title("Steps per Episode")
+        (self.deviation_line,) = axes[2].plot([], [], label="Lane Deviation (distance from center)")
+        (self.angle_line,) = axes[2].plot([], [], label="Angle (radians)")
+        (self.speed_line,) = axes[2].plot([], [], label="Speed (m/s)")
+        axes[2].set_xlabel("Training Episodes")
+        axes[2].set_ylabel("Lane Deviation, Angle, Speed")
+        axes[2].set_title("Lane Deviation, Angle, Speed per Episode")
+        axes[2].legend()
+        (self.scatter_line,) = axes[3].plot([], [], "o", color="blue", markersize=3)
+        (self.trend_line,) = axes[3].plot([], [], "r--")
+        axes[3].set_xlabel("Training Episodes")
+        axes[3].set_ylabel("Average Reward per Episode")
+        self.figure.tight_layout()
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.status = tk.Label(master, text=f"Waiting for {directory}")
+        self.status.pack(fill=tk.X)
+        self.poll()
+
+    def poll(self):
+        """
+        Read new episodes and redraw if there are any, then schedule the next poll.
+        """
+        try:
+            self._update()
+        finally:
+            self._after = self.master.after(self.interval, self.poll)
+
+    def stop(self):
+        """
+        Stop polling.
+        """
+        if self._after is not None:
+            self.master.after_cancel(self._after)
+            self._after = None
+
+    def _reset(self):
+        self.data = {column: np.zeros(0, dtype=np.float32) for column in DASHBOARD_COLUMNS}
+        self.trend = RunningTrend()
+
+    def _update(self):
+        if self.reader is None:
+            if not os.path.exists(os.path.join(self.directory, "schema.json")):
+                return
+            self.reader = MetricsReader(self.directory)
+        if self.reader.rows("episodes") < len(self.data["avg_reward"]):
+            self._reset()  # the run was restarted or truncated after a resume
+        new = self.reader.tail("episodes", DASHBOARD_COLUMNS)
+        count = len(new["avg_reward"])
+        if count == 0:
+            return
+        draw_start = time.perf_counter()
+        start = len(self.data["avg_reward"])
+        for column in DASHBOARD_COLUMNS:
+            self.data[column] = np.concatenate([self.data[column], new[column].astype(np.float32)])
+        self.trend.add(np.arange(start, start + count), new["avg_reward"])
+
+        episodes = np.arange(len(self.data["avg_reward"]))
+        for line, column in (
+            (self.reward_line, "avg_reward"),
+            (self.steps_line, "steps"),
+            (self.deviation_line, "lane_deviation"),
+            (self.angle_line, "angle"),
+            (self.speed_line, "speed"),
+            (self.scatter_line, "avg_reward"),
+        ):
+            line.set_data(*minmax_decimate(episodes, self.data[column], self.max_points))
+        slope, intercept, correlation = self.trend.fit()
+        self.trend_line.set_data([0, episodes[-1]], [intercept, intercept + slope * episodes[-1]])
+        self.axes[3].set_title(f"Average Reward (Corr: {correlation:.2f})")
+        for axis in self.axes:
+            axis.relim()
+            axis.autoscale_view()
+        self.canvas.draw()
+        self.status.config(
+            text=f"{len(episodes)} episodes, redrawn in {(time.perf_counter() - draw_start) * 1000:.0f} ms"
+        )
+
+
+def open_dashboard(root, directory, interval=1000):
+    """
+    Open a dashboard for a run in its own window.
+
+    Args:
+        root (tk.Tk): The application root.
+        directory (str): Metrics store directory of the run.
+        interval (int): Polling interval in milliseconds.
+
+    Returns:
+        TrainingDashboard: The dashboard, stopped when its window is closed.
+    """
+    window = tk.Toplevel(root)
+    window.title(f"Training Dashboard: {directory}")
+    dashboard = TrainingDashboard(window, directory, interval)
+
+    def close():
+        dashboard.stop()
+        window.destroy()
+
+    window.protocol("WM_DELETE_WINDOW", close)
+    return dashboard
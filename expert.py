@@ -0,0 +1,214 @@
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+import torch
+
+from metrics_store import MetricsReader
+
+
+def nearest_action(action_space, throttle, steer):
+    """
+    Find the discrete action closest to a continuous control.
+
+    Both control dimensions are scaled by their range in the action space, so
+    throttle and steer errors weigh equally.
+
+    Args:
+        action_space (np.ndarray): The (throttle, steer) action grid, shape (N, 2).
+        throttle (float): Continuous throttle.
+        steer (float): Continuous steer.
+
+    Returns:
+        int: Index of the closest action.
+    """
+    scale = np.ptp(action_space, axis=0)
+    scale[scale == 0] = 1.0
+    error = (action_space - np.array([throttle, steer])) / scale
+    return int(np.argmin(np.sum(error**2, axis=1)))
+
+
+class LaneFollowingExpert:
+    """
+    Pure pursuit lane-following controller restricted to the discrete action space.
+
+    Steers towards the lane center a lookahead distance ahead along the lane and
+    holds a target speed with a proportional throttle, then picks the closest
+    of the agent's actions, so the stored transitions are ones the agent itself
+    could have produced.
+
+    Args:
+        action_space (np.ndarray): The (throttle, steer) action grid of the environment.
+        target_speed (float): Speed to hold in m/s.
+        lookahead (float): Distance in meters along the lane of the steering target.
+        steer_gain (float): Steer per radian of heading error towards the target.
+        throttle_gain (float): Throttle per m/s of speed error.
+    """
+
+    def __init__(self, action_space, target_speed=10.0, lookahead=8.0, steer_gain=1.0, throttle_gain=0.2):
+        self.action_space = action_space
+        self.target_speed = target_speed
+        self.lookahead = lookahead
+        self.steer_gain = steer_gain
+        self.throttle_gain = throttle_gain
+
+    def act(self, env):
+        """
+        Choose the expert action for the current state of the environment.
+
+        Args:
+            env (Environment): The environment.
+
+        Returns:
+            tuple: Index of the action and the (throttle, steer) action.
+        """
+        # the simulator import is deferred so the report tools below run without CARLA installed
+        import carla
+
+        transform = env.vehicle.get_transform()
+        location = transform.location
+        waypoint = env.map.get_waypoint(location, project_to_road=True, lane_type=carla.LaneType.Driving)
+        targets = waypoint.next(self.lookahead)
+        target = targets[0].transform.location if targets else waypoint.transform.location
+        heading = math.radians(transform.rotation.yaw)
+        bearing = math.atan2(target.y - location.y, target.x - location.x)
+        error = (bearing - heading + math.pi) % (2 * math.pi) - math.pi
+        steer = float(np.clip(self.steer_gain * error, -1.0, 1.0))
+
+        velocity = env.vehicle.get_velocity()
+        speed = math.sqrt(velocity.x**2 + velocity.y**2 + velocity.z**2)
+        throttle = float(np.clip(self.throttle_gain * (self.target_speed - speed), 0.0, 1.0))
+
+        index = nearest_action(self.action_space, throttle, steer)
+        return index, self.action_space[index]
+
+
+def warm_start(env, replay_buffer, expert, steps, max_steps, device, dataset_writer=None):
+    """
+    Fill the replay buffer with expert transitions before reinforcement learning starts.
+
+    Args:
+        env (Environment): The environment.
+        replay_buffer (ReplayBuffer): The replay buffer to fill.
+        expert (LaneFollowingExpert): The expert choosing the actions.
+        steps (int): Number of transitions to store.
+        max_steps (int): Maximum number of steps per expert episode.
+        device (torch.device): Device the states are moved to.
+        dataset_writer (DatasetWriter, optional): Offline dataset the transitions are also appended to.
+
+    Returns:
+        dict: Stored steps, expert episodes, mean steps and reward per step of the
+            expert episodes, and the wall time in seconds.
+    """
+    start = time.time()
+    episode_steps = []
+    episode_rewards = []
+    stored = 0
+    while stored < steps:
+        state = env.reset()
+        total_reward = 0.0
+        step = 0
+        done = False
+        while step < max_steps and not done and stored < steps:
+            state_tensor = torch.from_numpy(state).unsqueeze(0).to(device)
+            env.action_idx, action = expert.act(env)
+            next_state, reward, done, _ = env.step(action)
+            next_state_tensor = torch.from_numpy(next_state).unsqueeze(0).to(device)
+            replay_buffer.store((state_tensor, env.action_idx, reward, next_state_tensor, done))
+            if dataset_writer is not None:
+                dataset_writer.add(state, env.action_idx, reward, next_state, done)
+            state = next_state
+            total_reward += reward
+            step += 1
+            stored += 1
+        episode_steps.append(step)
+        episode_rewards.append(total_reward / max(step, 1))
+    return {
+        "steps": stored,
+        "episodes": len(episode_steps),
+        "steps_mean": float(np.mean(episode_steps)) if episode_steps else 0.0,
+        "reward_per_step": float(np.mean(episode_rewards)) if episode_rewards else 0.0,
+        "time": time.time() - start,
+    }
+
+
+def save_warm_start(directory, stats):
+    """
+    Store the warm start statistics of a run next to its metrics.
+
+    Args:
+        directory (str): Metrics store directory of the run.
+        stats (dict): Statistics returned by warm_start ({"steps": 0} without warm start).
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "warm_start.json"), "w") as file:
+        json.dump(stats, file)
+
+
+def load_warm_start(directory):
+    """
+    Load the warm start statistics of a run.
+
+    Args:
+        directory (str): Metrics store directory of the run.
+
+    Returns:
+        dict: The stored statistics, {"steps": 0} if the run had no warm start.
+    """
+    path = os.path.join(directory, "warm_start.json")
+    if not os.path.exists(path):
+        return {"steps": 0}
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def steps_to_reward(avg_rewards, steps, target, window=10, offset=0):
+    """
+    Count the environment steps a run needed to reach an average reward.
+
+    Args:
+        avg_rewards (list): Average reward per step of every episode.
+        steps (list): Number of steps of every episode.
+        target (float): Moving average of the episode reward per step to reach.
+        window (int): Number of episodes in the moving average.
+        offset (int): Environment steps taken before the first episode (the warm start).
+
+    Returns:
+        int or None: Environment steps including the offset, None if the target was not reached.
+    """
+    avg_rewards = np.asarray(avg_rewards, dtype=np.float64)
+    if len(avg_rewards) < window:
+        return None
+    moving = np.convolve(avg_rewards, np.ones(window) / window, mode="valid")
+    reached = np.flatnonzero(moving >= target)
+    if len(reached) == 0:
+        return None
+    return offset + int(np.sum(np.asarray(steps)[: reached[0] + window]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the environment steps runs needed to reach an average reward"
+    )
+    parser.add_argument("directories", type=str, nargs="+", help="Metrics store directories, e.g. metrics/vOTv1")
+    parser.add_argument("--target-reward", type=float, required=True, help="Moving average reward per step to reach")
+    parser.add_argument("--window", type=int, default=10, help="Episodes in the moving average")
+    args = parser.parse_args()
+
+    results = []
+    for directory in args.directories:
+        data = MetricsReader(directory).read("episodes", ["avg_reward", "steps"])
+        warm_steps = load_warm_start(directory)["steps"]
+        needed = steps_to_reward(data["avg_reward"], data["steps"], args.target_reward, args.window, warm_steps)
+        results.append(needed)
+        print(
+            f"{directory}: {warm_steps} warm start steps, "
+            + (f"reached {args.target_reward} after {needed} environment steps" if needed is not None else "not reached")
+        )
+    baseline = results[-1]
+    for directory, needed in zip(args.directories[:-1], results[:-1]):
+        if needed is not None and baseline is not None:
+            print(f"{directory} saves {baseline - needed} environment steps over {args.directories[-1]}")
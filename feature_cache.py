@@ -0,0 +1,133 @@
+import time
+import weakref
+
+import torch
+
+
+# Expected hit rate below which the cache costs more (float16 round trip and a
+# separate encoder pass for the misses) than it saves
+MIN_HIT_RATE = 0.3
+
+
+class TargetFeatureCache:
+    """
+    Cache of target network encoder features for replay next states.
+
+    The target network only changes when it is synced with the online
+    network, so the encoder output (conv layers and fc1) of a replay frame is
+    computed once per target network version and kept in float16; target
+    Q-values of cached frames then only cost the dueling head. Entries are
+    keyed by the identity of the stored frame tensor (checked with a weak
+    reference, so a recycled id never returns another frame's features) and
+    are dropped by invalidate() on every target sync.
+
+    Replay buffers that return new tensors on every sample (such as
+    CompressedReplayBuffer) never hit the cache and are not supported. The
+    cache only pays off when a target version is sampled often enough for
+    frames to repeat, see expected_hit_rate().
+
+    Args:
+        target_network (DuelingDDQN): The target network.
+        dtype (torch.dtype): Storage type of the cached features.
+
+    Attributes:
+        lookups (int): Frames looked up since the last summary.
+        hits (int): Lookups answered from the cache since the last summary.
+    """
+
+    def __init__(self, target_network, dtype=torch.float16):
+        self.target_network = target_network
+        self.dtype = dtype
+        self.lookups = 0
+        self.hits = 0
+        self.target_time = 0.0
+        self.encode_time = 0.0
+        self.updates = 0
+        self._features = {}
+
+    def invalidate(self):
+        """
+        Drop all cached features, called whenever the target network changes.
+        """
+        self._features = {}
+
+    def max_q(self, next_states):
+        """
+        Compute the maximal target Q-value of every next state.
+
+        Args:
+            next_states (list): Next state tensors (1, H, W, 3) as stored in the replay buffer.
+
+        Returns:
+            torch.Tensor: Maximal target Q-value per next state (B,).
+        """
+        target_start = time.perf_counter()
+        features = [None] * len(next_states)
+        misses = []
+        for i, frame in enumerate(next_states):
+            entry = self._features.get(id(frame))
+            if entry is not None and entry[0]() is frame:
+                features[i] = entry[1]
+            else:
+                misses.append(i)
+        self.lookups += len(next_states)
+        self.hits += len(next_states) - len(misses)
+
+        with torch.no_grad():
+            if misses:
+                encode_start = time.perf_counter()
+                batch = torch.cat([next_states[i] for i in misses]).permute(0, 3, 1, 2)
+                encoded = self.target_network.encode(batch).to(self.dtype)
+                for row, i in enumerate(misses):
+                    features[i] = encoded[row]
+                    self._features[id(next_states[i])] = (weakref.ref(next_states[i]), encoded[row])
+                self.encode_time += time.perf_counter() - encode_start
+            q_values = self.target_network.head(torch.stack(features).float())
+        self.target_time += time.perf_counter() - target_start
+        self.updates += 1
+        return q_values.max(dim=1).values
+
+    def summary(self):
+        """
+        Summarize the hit rate and the estimated speedup of the target computation, and reset the counters.
+
+        The uncached cost is estimated from the measured encoder time per missed
+        frame; on CUDA the host times only cover kernel launches.
+
+        Returns:
+            str: Hit rate, target time per update and the estimated speedup.
+        """
+        misses = self.lookups - self.hits
+        text = f"Target feature cache: hit rate {self.hits / max(self.lookups, 1) * 100:.1f}%"
+        if misses and self.updates:
+            head_time = max(self.target_time - self.encode_time, 0.0)
+            uncached_time = self.encode_time / misses * self.lookups + head_time
+            text += (
+                f", target {self.target_time / self.updates * 1000:.2f} ms per update "
+                f"(estimated {uncached_time / max(self.target_time, 1e-9):.2f}x faster than uncached)"
+            )
+        self.lookups = self.hits = self.updates = 0
+        self.target_time = self.encode_time = 0.0
+        return text
+
+
+def expected_hit_rate(updates, batch_size, frames):
+    """
+    Estimate the hit rate of the cache for uniformly sampled replay frames.
+
+    Of n lookups drawn from m frames, m * (1 - (1 - 1/m)^n) are distinct and
+    miss, the rest hit.
+
+    Args:
+        updates (int): Learner updates per target network version.
+        batch_size (int): Frames looked up per update.
+        frames (int): Frames in the replay buffer.
+
+    Returns:
+        float: The expected share of lookups answered from the cache.
+    """
+    lookups = updates * batch_size
+    if lookups <= 0 or frames <= 0:
+        return 0.0
+    distinct = frames * (1.0 - (1.0 - 1.0 / frames) ** lookups)
+    return 1.0 - distinct / lookups
@@ -1,12 +1,16 @@
+import time
+
+startup_start = time.perf_counter()
+
 import tkinter as tk
-import subprocess
-from tkinter import ttk
+from tkinter import messagebox, ttk
 from googletrans import Translator
 from googletrans import LANGUAGES
-from carla_lane_keeping_d3qn import update_plot
-import subprocess
-import threading
+from run_manager import RunManager
+from run_panel import RunPanel
 import csv
+import os
+import sys
 
 # import carla
 
@@ -55,6 +59,16 @@ def show_plot():
         Display the plot of rewards versus number of steps, lane deviation, angle, and speed.
     """
 
+    # plotting modules load matplotlib, so they are only imported on the first plot
+    from dashboard import open_dashboard
+    from plotting import update_plot
+
+    # live dashboard over the metrics store of the run when there is one, the legacy CSV files otherwise
+    metrics_directory = os.path.join("metrics", "v" + entry1.get())
+    if os.path.exists(os.path.join(metrics_directory, "schema.json")):
+        open_dashboard(root, metrics_directory)
+        return
+
     try:
         csv_file = "plot_data.csv"
 
@@ -94,52 +108,38 @@ def show_plot():
 
 def run_backend():
     """
-    Run the backend script with the provided arguments.
-    """
-    run_button.config(state="disabled")
-    arg1 = entry1.get()
-    arg2 = entry2.get()
-    arg3 = entry3.get()
-    arg4 = entry4.get()
-    arg5 = entry5.get()
-    arg6 = entry6.get()
-    arg7 = entry7.get()
-    arg8 = entry8.get()
-    arg9 = entry9.get()
-
-    subprocess.run(
-        [
-            "python",
-            "carla_lane_keeping_d3qn.py",
-            "--version",
-            arg1,
-            "--operation",
-            arg2,
-            "--save-path",
-            arg3,
-            "--reward-function",
-            arg4,
-            "--map",
-            arg5,
-            "--epsilon-decrement",
-            arg6,
-            "--num-episodes",
-            arg7,
-            "--max-steps",
-            arg8,
-            "--random-spawn",
-            arg9,
-        ]
-    )
-    run_button.config(state="normal")
-
-
-def run_backend_thread():
+    Queue the backend script with the provided arguments in the run manager.
     """
-    Run the backend script in a separate thread.
-    """
-    backend_thread = threading.Thread(target=run_backend)
-    backend_thread.start()
+    arguments = [
+        "--version",
+        entry1.get(),
+        "--operation",
+        entry2.get(),
+        "--save-path",
+        entry3.get(),
+        "--reward-function",
+        entry4.get(),
+        "--map",
+        entry5.get(),
+        "--epsilon-decrement",
+        entry6.get(),
+        "--num-episodes",
+        entry7.get(),
+        "--max-steps",
+        entry8.get(),
+        "--random-spawn",
+        entry9.get(),
+    ]
+    try:
+        max_concurrent = int(concurrent_entry.get() or 1)
+    except ValueError:
+        messagebox.showerror("Invalid input", "Concurrent runs must be a whole number.")
+        return
+    if max_concurrent < 1:
+        messagebox.showerror("Invalid input", "Concurrent runs must be at least 1.")
+        return
+    run_manager.max_concurrent = max_concurrent
+    run_manager.submit(arguments, name="v" + entry1.get())
 
 
 root = tk.Tk()
@@ -220,13 +220,61 @@ translate_button = tk.Button(
 translate_button.grid(row=9, column=2, columnspan=2, padx=(20, 20), pady=5)
 
 
-# Create 'Run' button
-run_button = tk.Button(root, text="Run Backend", command=run_backend_thread)
+# Create 'Run' button, runs are queued and supervised by the run manager
+run_button = tk.Button(root, text="Run Backend", command=run_backend)
 run_button.grid(row=10, column=0, columnspan=2, padx=5, pady=5)
 
 plot_button = tk.Button(root, text="Show Plot", command=show_plot)
 plot_button.grid(row=10, column=1, columnspan=2, padx=(20, 20), pady=5)
 
+concurrent_label = tk.Label(root, text="Concurrent Runs:")
+concurrent_label.grid(row=10, column=2, padx=5, pady=5)
+concurrent_entry = tk.Entry(root, width=5)
+concurrent_entry.insert(0, "1")
+concurrent_entry.grid(row=10, column=3, padx=5, pady=5)
+
+# Run list and streamed logs
+run_manager = RunManager()
+run_panel = RunPanel(root, run_manager)
+run_panel.frame.grid(row=11, column=0, columnspan=4, padx=5, pady=5, sticky="nsew")
+
+
+def report_startup():
+    """
+    Print the time from launch until the window is ready, closing it when started with --startup-time.
+    """
+    print(f"Frontend ready in {time.perf_counter() - startup_start:.3f} s")
+    if "--startup-time" in sys.argv:
+        root.destroy()
+
+
+root.after_idle(report_startup)
+
+
+def close_window():
+    """
+    Ask what happens to queued and running jobs before closing the window.
+
+    Running jobs write to their log files, not to this process, so they can
+    keep going after the window is closed; queued jobs only start while the
+    window is open.
+    """
+    if run_manager.active():
+        answer = messagebox.askyesnocancel(
+            "Runs in progress",
+            "Runs are still queued or running.\n\n"
+            "Yes: cancel all runs and quit.\n"
+            "No: quit and let running jobs finish (output in logs/), queued runs are not started.\n"
+            "Cancel: keep the window open.",
+        )
+        if answer is None:
+            return
+        if answer:
+            run_manager.shutdown()
+    root.destroy()
+
+
+root.protocol("WM_DELETE_WINDOW", close_window)
 
 # Start the GUI event loop
 root.mainloop()
@@ -0,0 +1,231 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+# Value fields of the HUD: (name, label, format)
+HUD_FIELDS = [
+    ("episode", "Episode:", "{}"),
+    ("step", "Step:", "{}"),
+    ("time", "Time:", "{:.1f} s"),
+    ("reward", "Reward:", "{:.3f}"),
+    ("speed", "Speed:", "{:.2f} m/s"),
+    ("lane_deviation", "Lane Deviation:", "{:.2f} m"),
+    ("angle", "Angle:", "{:.2f}"),
+]
+
+
+class HUDRenderer:
+    """
+    Heads-Up Display (HUD) drawn into a small panel in the top left corner of camera images.
+
+    Labels, the title and the bar outlines are rendered once into a static
+    layer. Only values whose text (or bar length) changed are redrawn, each
+    into its own small region of the panel, and only the panel region of the
+    camera image is blended, instead of allocating and blending a full size
+    overlay every frame.
+
+    Args:
+        width (int): Width of the camera image.
+        height (int): Height of the camera image.
+        title (str): Static first line, e.g. the reward function.
+        fields (list): (name, label, format) of the value fields.
+        alpha (float): Weight of the panel added onto the camera image.
+
+    Attributes:
+        panel (np.ndarray): The current panel image (H, W, 3).
+    """
+
+    def __init__(self, width, height, title="", fields=HUD_FIELDS, alpha=0.5):
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+        self.font_scale = 0.5
+        self.font_color = (255, 255, 255)
+        self.line_height = 20
+        self.x_offset = 10
+        self.alpha = alpha
+        self.fields = fields
+
+        label_width = max(cv2.getTextSize(label, self.font, self.font_scale, 1)[0][0] for _, label, _ in fields)
+        value_x = self.x_offset + label_width + 8
+        value_width = 130
+        rows = len(fields) + 2 + (1 if title else 0)
+        self.size = (min(value_x + value_width, width), min(rows * self.line_height + 10, height))
+        static = np.zeros((self.size[1], self.size[0], 3), dtype=np.uint8)
+
+        # static layer: title, labels and bar outlines
+        y = self.line_height
+        if title:
+            cv2.putText(static, title, (self.x_offset, y), self.font, self.font_scale, self.font_color, 1)
+            y += self.line_height
+        # value regions (x0, y0, x1, y1), text is drawn at the baseline y1 - 5
+        self.regions = {}
+        for name, label, _ in fields:
+            cv2.putText(static, label, (self.x_offset, y), self.font, self.font_scale, self.font_color, 1)
+            self.regions[name] = (value_x, y - self.line_height + 5, self.size[0], y + 5)
+            y += self.line_height
+        self.bars = {}
+        for name, label in (("throttle", "Throttle:"), ("steer", "Steer:")):
+            cv2.putText(static, label, (self.x_offset, y), self.font, self.font_scale, self.font_color, 1)
+            x0, y0 = value_x, y - 10
+            cv2.rectangle(static, (x0, y0), (x0 + 101, y0 + 11), self.font_color, 1)
+            self.bars[name] = (x0 + 1, y0 + 1, x0 + 101, y0 + 11)
+            y += self.line_height
+
+        self.static = static
+        self.panel = static.copy()
+        self._drawn = {}
+
+    def update(self, values):
+        """
+        Redraw the regions of values that changed since the last update.
+
+        Args:
+            values (dict): Field values by name; "throttle" in [0, 1] and "steer" in [-1, 1] fill the bars.
+        """
+        for name, _, value_format in self.fields:
+            if name not in values:
+                continue
+            text = value_format.format(values[name])
+            if self._drawn.get(name) == text:
+                continue
+            self._drawn[name] = text
+            x0, y0, x1, y1 = self.regions[name]
+            region = self.panel[y0:y1, x0:x1]
+            region[:] = self.static[y0:y1, x0:x1]
+            cv2.putText(region, text, (0, y1 - y0 - 5), self.font, self.font_scale, self.font_color, 1)
+        if "throttle" in values:
+            length = int(np.clip(values["throttle"], 0.0, 1.0) * 100)
+            color = (0, int(255 * (1 - length / 100)), int(255 * length / 100))
+            self._draw_bar("throttle", length, 0, length, color)
+        if "steer" in values:
+            center = int((np.clip(values["steer"], -1.0, 1.0) + 1) * 50)
+            self._draw_bar("steer", center, max(center - 3, 0), min(center + 3, 100), self.font_color)
+
+    def _draw_bar(self, name, key, start, end, color):
+        if self._drawn.get(name) == key:
+            return
+        self._drawn[name] = key
+        x0, y0, x1, y1 = self.bars[name]
+        self.panel[y0:y1, x0:x1] = 0
+        if end > start:
+            self.panel[y0:y1, x0 + start : x0 + end] = color
+
+    def compose(self, frame):
+        """
+        Blend the panel onto a copy of a camera image.
+
+        Args:
+            frame (np.ndarray): Camera image (H, W, 3), not modified.
+
+        Returns:
+            np.ndarray: The camera image with the HUD.
+        """
+        image = np.ascontiguousarray(frame)
+        if image is frame:
+            image = frame.copy()
+        width, height = self.size
+        roi = image[:height, :width]
+        cv2.addWeighted(roi, 1, self.panel, self.alpha, 0, dst=roi)
+        return image
+
+
+class HUDDisplay:
+    """
+    Shows camera images with the HUD in a window from a separate display thread.
+
+    submit() only stores a reference to the newest frame and its values in a
+    single slot and returns; the display thread renders and shows whatever
+    frame is newest when it is ready. Frames submitted while the previous one
+    was not shown yet are dropped, so a slow display never blocks the
+    environment step or the learner. All OpenCV window calls happen on the
+    display thread.
+
+    Args:
+        width (int): Width of the camera image.
+        height (int): Height of the camera image.
+        title (str): Static first line of the HUD.
+        window_name (str): Name of the window.
+
+    Attributes:
+        shown (int): Frames shown since the last summary.
+        dropped (int): Frames replaced before they were shown since the last summary.
+    """
+
+    def __init__(self, width, height, title="", window_name="Camera View with HUD"):
+        self.renderer = HUDRenderer(width, height, title)
+        self.window_name = window_name
+        self.shown = 0
+        self.dropped = 0
+        self.render_time = 0.0
+        self._opened = False
+        self._lock = threading.Lock()
+        self._slot = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, **values):
+        """
+        Offer a frame to the display, replacing any frame not shown yet.
+
+        Args:
+            frame (np.ndarray): Camera image (H, W, 3); it must not be modified afterwards.
+            **values: HUD field values, see HUDRenderer.update.
+        """
+        if frame is None:
+            return
+        with self._lock:
+            if self._slot is not None:
+                self.dropped += 1
+            self._slot = (frame, values)
+        self._ready.set()
+
+    def summary(self):
+        """
+        Summarize the shown and dropped frames and the render time, and reset the counters.
+
+        Returns:
+            str: Frames shown and dropped and the render time per frame.
+        """
+        total = max(self.shown + self.dropped, 1)
+        text = (
+            f"HUD: {self.shown} frames shown, {self.dropped} dropped ({self.dropped / total * 100:.1f}%), "
+            f"{self.render_time / max(self.shown, 1) * 1000:.2f} ms render per frame"
+        )
+        self.shown = self.dropped = 0
+        self.render_time = 0.0
+        return text
+
+    def close(self):
+        """
+        Stop the display thread and close the window.
+        """
+        self._stop.set()
+        self._ready.set()
+        self._thread.join(timeout=5.0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._ready.wait(timeout=0.1):
+                if self._opened:
+                    cv2.waitKey(1)  # keep the window responsive between episodes
+                continue
+            with self._lock:
+                slot, self._slot = self._slot, None
+                self._ready.clear()
+            if slot is None:
+                continue
+            frame, values = slot
+            render_start = time.perf_counter()
+            self.renderer.update(values)
+            image = self.renderer.compose(frame)
+            self.render_time += time.perf_counter() - render_start
+            cv2.imshow(self.window_name, image)
+            cv2.waitKey(1)
+            self._opened = True
+            self.shown += 1
+        if self._opened:
+            cv2.destroyWindow(self.window_name)
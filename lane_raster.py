@@ -0,0 +1,255 @@
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+import carla
+
+
+# One record per grid cell, stored as a memory-mapped .npy
+RASTER_DTYPE = np.dtype(
+    [
+        ("valid", np.uint8),
+        ("left_marking", np.uint8),
+        ("right_marking", np.uint8),
+        ("lane_id", np.int16),
+        ("road_id", np.int32),
+        ("yaw", np.float32),
+        ("lateral", np.float32),
+        ("lane_width", np.float32),
+        ("z", np.float32),
+    ]
+)
+
+
+class RasterLaneMarking:
+    """
+    Lane marking answered from the raster, mirroring the type attribute of carla.LaneMarking.
+    """
+
+    def __init__(self, marking_type):
+        self.type = marking_type
+
+
+class RasterWaypoint:
+    """
+    Waypoint answered from the raster.
+
+    Mirrors the part of carla.Waypoint used by the reward functions: transform
+    (location is the projection onto the lane centerline, rotation the lane
+    heading), lane_width, lane_id, road_id and the lane markings.
+    """
+
+    def __init__(self, transform, lane_width, lane_id, road_id, left_lane_marking, right_lane_marking):
+        self.transform = transform
+        self.lane_width = lane_width
+        self.lane_id = lane_id
+        self.road_id = road_id
+        self.left_lane_marking = left_lane_marking
+        self.right_lane_marking = right_lane_marking
+
+
+def build_lane_raster(carla_map, path, resolution=1.0, margin=1.0, sample_distance=1.0):
+    """
+    Sample the driving lanes of a map into a grid and save it for LaneRaster.
+
+    Cells within half a lane width (plus margin) of a lane centerline are filled by
+    projecting the cell center onto the road, exactly as the live map would.
+
+    Args:
+        carla_map (carla.Map): The map to rasterize.
+        path (str): Path of the .npy file (a .json with the grid metadata is written next to it).
+        resolution (float): Cell size in meters.
+        margin (float): Extra distance in meters beyond the lane borders that is rasterized.
+        sample_distance (float): Distance in meters between sampled centerline waypoints.
+
+    Returns:
+        np.ndarray: The raster.
+    """
+    waypoints = [
+        wp for wp in carla_map.generate_waypoints(sample_distance)
+        if wp.lane_type == carla.LaneType.Driving
+    ]
+    centers = np.array([[wp.transform.location.x, wp.transform.location.y] for wp in waypoints])
+    reach = np.array([wp.lane_width / 2.0 + margin for wp in waypoints])
+
+    origin = centers.min(axis=0) - reach.max()
+    shape = tuple((np.ceil((centers.max(axis=0) + reach.max() - origin) / resolution) + 1).astype(int))
+
+    # mark every cell close enough to a centerline sample
+    covered = np.zeros(shape, dtype=bool)
+    for (x, y), r in zip(centers, reach):
+        i0, j0 = np.floor((np.array([x, y]) - r - origin) / resolution).astype(int)
+        i1, j1 = np.ceil((np.array([x, y]) + r - origin) / resolution).astype(int)
+        ii, jj = np.meshgrid(np.arange(max(i0, 0), min(i1, shape[0] - 1) + 1),
+                             np.arange(max(j0, 0), min(j1, shape[1] - 1) + 1), indexing="ij")
+        cx = origin[0] + ii * resolution
+        cy = origin[1] + jj * resolution
+        covered[ii, jj] |= (cx - x) ** 2 + (cy - y) ** 2 <= r * r
+
+    raster = np.zeros(shape, dtype=RASTER_DTYPE)
+    for i, j in zip(*np.nonzero(covered)):
+        x = origin[0] + i * resolution
+        y = origin[1] + j * resolution
+        wp = carla_map.get_waypoint(
+            carla.Location(x=float(x), y=float(y)), project_to_road=True, lane_type=carla.LaneType.Driving
+        )
+        if wp is None:
+            continue
+        center = wp.transform.location
+        yaw = wp.transform.rotation.yaw
+        yaw_radians = math.radians(yaw)
+        # signed offset of the cell center along the lane's right vector
+        lateral = -(x - center.x) * math.sin(yaw_radians) + (y - center.y) * math.cos(yaw_radians)
+        raster[i, j] = (
+            1,
+            int(wp.left_lane_marking.type),
+            int(wp.right_lane_marking.type),
+            wp.lane_id,
+            wp.road_id,
+            yaw,
+            lateral,
+            wp.lane_width,
+            center.z,
+        )
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.save(path, raster)
+    with open(os.path.splitext(path)[0] + ".json", "w") as file:
+        json.dump(
+            {"map": carla_map.name.split("/")[-1], "origin": origin.tolist(),
+             "resolution": resolution, "shape": [int(n) for n in shape]},
+            file,
+        )
+    return raster
+
+
+class LaneRaster:
+    """
+    Local lookup of lane geometry from a precomputed raster.
+
+    Answers the get_waypoint(..., project_to_road=True, lane_type=Driving) queries
+    of the reward functions from a memory-mapped grid instead of the live map.
+    Inside a cell the lateral offset is extended linearly along the lane's right
+    vector, so the distance from the lane center stays exact on straight lanes;
+    cells straddling a lane border answer for the lane of the cell center.
+    Locations off the raster fall back to the live map.
+
+    Args:
+        path (str): Path of the raster .npy file.
+        carla_map (carla.Map, optional): Live map used as fallback.
+
+    Attributes:
+        raster (np.memmap): The memory-mapped grid of RASTER_DTYPE records.
+        hits (int): Number of queries answered from the raster.
+        misses (int): Number of queries answered by the live map.
+    """
+
+    def __init__(self, path, carla_map=None):
+        with open(os.path.splitext(path)[0] + ".json", "r") as file:
+            meta = json.load(file)
+        self.raster = np.load(path, mmap_mode="r")
+        self.origin_x, self.origin_y = meta["origin"]
+        self.resolution = meta["resolution"]
+        self.shape = self.raster.shape
+        self.carla_map = carla_map
+        self.marking_types = carla.LaneMarkingType.values
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def path_for(map_name, directory="lane_rasters"):
+        """
+        Get the raster path of a map.
+
+        Args:
+            map_name (str): Name of the map.
+            directory (str): Directory in which rasters are stored.
+
+        Returns:
+            str: Path of the raster .npy file.
+        """
+        return os.path.join(directory, map_name + ".npy")
+
+    def get_waypoint(self, location):
+        """
+        Project a location onto the closest driving lane.
+
+        Args:
+            location (carla.Location): The location to project.
+
+        Returns:
+            RasterWaypoint or carla.Waypoint: The projected waypoint, from the live map when off the raster.
+        """
+        i = int(round((location.x - self.origin_x) / self.resolution))
+        j = int(round((location.y - self.origin_y) / self.resolution))
+        if 0 <= i < self.shape[0] and 0 <= j < self.shape[1]:
+            cell = self.raster[i, j]
+            if cell["valid"]:
+                self.hits += 1
+                yaw = float(cell["yaw"])
+                yaw_radians = math.radians(yaw)
+                right_x = -math.sin(yaw_radians)
+                right_y = math.cos(yaw_radians)
+                # lateral offset of the location itself, extended from the cell center
+                lateral = (
+                    float(cell["lateral"])
+                    + (location.x - (self.origin_x + i * self.resolution)) * right_x
+                    + (location.y - (self.origin_y + j * self.resolution)) * right_y
+                )
+                center = carla.Location(
+                    x=location.x - lateral * right_x,
+                    y=location.y - lateral * right_y,
+                    z=float(cell["z"]),
+                )
+                return RasterWaypoint(
+                    carla.Transform(center, carla.Rotation(yaw=yaw)),
+                    float(cell["lane_width"]),
+                    int(cell["lane_id"]),
+                    int(cell["road_id"]),
+                    RasterLaneMarking(self.marking_types[int(cell["left_marking"])]),
+                    RasterLaneMarking(self.marking_types[int(cell["right_marking"])]),
+                )
+        self.misses += 1
+        return self.carla_map.get_waypoint(
+            location, project_to_road=True, lane_type=carla.LaneType.Driving
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the lane geometry raster of a CARLA map")
+    parser.add_argument("--map", type=str, default="Town04", help="Map to rasterize")
+    parser.add_argument("--resolution", type=float, default=1.0, help="Cell size in meters")
+    parser.add_argument("--host", type=str, default="localhost", help="CARLA server host")
+    parser.add_argument("--port", type=int, default=2000, help="CARLA server port")
+    args = parser.parse_args()
+
+    client = carla.Client(args.host, args.port)
+    client.set_timeout(60.0)
+    world = client.get_world()
+    if world.get_map().name.split("/")[-1] != args.map:
+        world = client.load_world(args.map)
+    carla_map = world.get_map()
+
+    path = LaneRaster.path_for(args.map)
+    build_start = time.time()
+    raster = build_lane_raster(carla_map, path, args.resolution)
+    print(
+        f"Raster {path}: {raster.shape[0]}x{raster.shape[1]} cells, {int(raster['valid'].sum())} on lanes, "
+        f"{raster.nbytes / 1e6:.1f} MB, built in {time.time() - build_start:.1f} s"
+    )
+
+    # compare the local lookup against the live map on the sampled lane centers
+    lanes = LaneRaster(path, carla_map)
+    locations = [wp.transform.location for wp in carla_map.generate_waypoints(5.0)]
+    lookup_start = time.perf_counter()
+    for location in locations:
+        lanes.get_waypoint(location)
+    raster_time = (time.perf_counter() - lookup_start) / len(locations)
+    lookup_start = time.perf_counter()
+    for location in locations:
+        carla_map.get_waypoint(location, project_to_road=True, lane_type=carla.LaneType.Driving)
+    live_time = (time.perf_counter() - lookup_start) / len(locations)
+    print(f"Lookup: raster {raster_time * 1e6:.1f} us, live map {live_time * 1e6:.1f} us per query")
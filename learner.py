@@ -0,0 +1,216 @@
+import random
+from collections import deque, namedtuple
+
+import torch
+import torch.nn as nn
+
+
+# The replay buffer and the learner update, free of simulator imports so they
+# can be used (and benchmarked) without the CARLA client library.
+
+loss_fn = nn.SmoothL1Loss()  # huber loss
+
+
+class ReplayBuffer:
+    """
+    Replay buffer for experience replay in reinforcement learning.
+
+    This buffer stores experiences and provides methods for storing,
+    sampling, and retrieving experiences for training.
+
+    Args:
+        capacity (int): Maximum capacity of the replay buffer.
+
+    Attributes:
+        buffer (deque): Deque containing the stored experiences.
+    """
+    
+    def __init__(self, capacity):
+        """
+        Initialize the replay buffer with a given capacity.
+
+        Args:
+            capacity (int): Maximum capacity of the replay buffer.
+        """
+        self.buffer = deque(maxlen=capacity)
+        self.total = 0  # number of experiences ever stored, used by incremental checkpoints
+
+    def store(self, experience):
+        """
+        Store a new experience in the replay buffer.
+
+        Args:
+            experience: The experience to be stored in the buffer.
+        """
+        self.buffer.append(experience)
+        self.total += 1
+
+    def sample(self, batch_size):
+        """
+        Sample a batch of experiences from the replay buffer.
+
+        Args:
+            batch_size (int): Number of experiences to sample.
+
+        Returns:
+            list: A list containing the sampled experiences.
+        """
+        return random.sample(self.buffer, batch_size)
+
+    def get(self, index):
+        """
+        Get a stored experience with its frames as arrays, as used by checkpoints.
+
+        Args:
+            index (int): Position in the buffer, 0 is the oldest.
+
+        Returns:
+            tuple: (state, action, reward, next_state, done) with the frames as (H, W, 3) arrays.
+        """
+        state, action, reward, next_state, done = self.buffer[index]
+        return state[0].cpu().numpy(), action, reward, next_state[0].cpu().numpy(), done
+
+    def flush(self):
+        """
+        Experiences are stored synchronously, so there is nothing to wait for.
+        """
+
+    def resize(self, capacity):
+        """
+        Change the capacity of the replay buffer, dropping the oldest experiences that no longer fit.
+
+        Args:
+            capacity (int): New maximum capacity.
+        """
+        self.buffer = deque(self.buffer, maxlen=capacity)
+
+    def size(self):
+        """
+        Get the current size of the replay buffer.
+
+        Returns:
+            int: The current number of experiences stored in the buffer.
+        """    
+        return len(self.buffer)
+
+
+Transition = namedtuple(
+    "Transition", ("state", "action", "reward", "next_state", "done")
+)
+
+
+def optimize_model(
+    memory, batch_size, gamma, network, target_network, optimizer, prefetcher=None, feature_cache=None
+):
+    """
+    Optimize the Q-network model using a batch of transitions from the replay memory.
+
+    Args:
+        memory (ReplayMemory): The replay memory containing transitions.
+        batch_size (int): The size of the batch to sample from the replay memory.
+        gamma (float): The discount factor for future rewards.
+        network (DuelingDDQN): The online network, updated in place.
+        target_network (DuelingDDQN): The target network.
+        optimizer (torch.optim.Optimizer): The optimizer of the online network.
+        prefetcher (BatchPrefetcher, optional): Source of batches assembled ahead of time.
+        feature_cache (TargetFeatureCache, optional): Cache of target encoder features, unused with a prefetcher.
+
+    Returns:
+        torch.Tensor or None: The detached loss, None if the memory holds less than a batch.
+    """
+    if prefetcher is not None:
+        batch = prefetcher.next()
+        return None if batch is None else update_network(network, target_network, optimizer, *batch, gamma)
+
+    # print("__FUNCTION__optimize_model()")
+   # print("optimizing")
+    if memory.size() < batch_size:
+       # print("Memory is less than batch size")
+        return None
+
+    device = next(network.parameters()).device
+    transitions = memory.sample(batch_size)
+    batch = Transition(*zip(*transitions))
+    #print("Batched")
+    # convert to tensors and move to device
+    state_batch = torch.cat([s for s in batch.state]).to(device)
+    # action_batch = torch.cat([a for a in batch.action]).to(device)
+    action_batch = torch.cat([torch.tensor([a]).to(device) for a in batch.action])
+    reward_batch = torch.cat([torch.tensor([r]).to(device) for r in batch.reward])
+    next_state_batch = torch.cat([s for s in batch.next_state if s is not None]).to(
+        device
+    )
+    done_batch = torch.cat([torch.tensor([d]).to(device) for d in batch.done])
+    # non_final_mask = torch.tensor(tuple(map(lambda s: s is not None, batch.next_state)), dtype=torch.bool).to(device)
+   # print("batch done")
+    max_next_q = None
+    if feature_cache is not None:
+        max_next_q = feature_cache.max_q(batch.next_state)
+    return update_network(
+        network,
+        target_network,
+        optimizer,
+        state_batch,
+        action_batch,
+        reward_batch,
+        next_state_batch,
+        done_batch,
+        gamma,
+        max_next_q,
+    )
+
+
+def update_network(
+    network,
+    target_network,
+    optimizer,
+    state_batch,
+    action_batch,
+    reward_batch,
+    next_state_batch,
+    done_batch,
+    gamma,
+    max_next_q=None,
+):
+    """
+    Perform one gradient step of the Q-network on a batch of transitions.
+
+    Args:
+        network (DuelingDDQN): The online network, updated in place.
+        target_network (DuelingDDQN): The target network.
+        optimizer (torch.optim.Optimizer): The optimizer of the online network.
+        state_batch (torch.Tensor): States (B, H, W, 3).
+        action_batch (torch.Tensor): Action indices (B,).
+        reward_batch (torch.Tensor): Rewards (B,).
+        next_state_batch (torch.Tensor): Next states (B, H, W, 3).
+        done_batch (torch.Tensor): Episode end flags (B,).
+        gamma (float): The discount factor for future rewards.
+        max_next_q (torch.Tensor, optional): Maximal target Q-values of the next states, computed here if None.
+
+    Returns:
+        torch.Tensor: The detached loss.
+    """
+    state_batch = state_batch.permute(0, 3, 1, 2)
+    next_state_batch = next_state_batch.permute(0, 3, 1, 2)
+    # Compute Q
+    current_q = network(state_batch)
+    current_q = torch.gather(
+        current_q, dim=1, index=action_batch.unsqueeze(1).long()
+    ).squeeze(-1)
+
+    with torch.no_grad():
+        # compute target Q, the reward alone for transitions that ended the episode
+        max_q = max_next_q
+        if max_q is None:
+            max_q = target_network(next_state_batch).max(dim=1).values
+        not_done = 1.0 - done_batch.float()
+        target_q = (reward_batch.float() + gamma * max_q * not_done).float()
+
+    # Compute Huber loss
+    loss_q = loss_fn(current_q, target_q)
+
+    # Optimize the model
+    optimizer.zero_grad()
+    loss_q.backward()
+    optimizer.step()
+    return loss_q.detach()
@@ -0,0 +1,277 @@
+import os
+
+import torch
+
+try:
+    import psutil
+except ImportError:  # psutil is optional, /proc or getrusage is used without it
+    psutil = None
+
+
+# Python object overhead of a stored transition (tuple, scalars, tensor headers)
+TRANSITION_OVERHEAD = 512
+
+
+def process_rss():
+    """
+    Get the resident set size of the process.
+
+    Returns:
+        int: Resident bytes, the peak resident bytes where the current value is not available.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024  # kB on Linux, bytes on macOS
+
+
+def module_bytes(module):
+    """
+    Get the bytes of the parameters and buffers of a module.
+
+    Args:
+        module (torch.nn.Module): The module.
+
+    Returns:
+        int: Bytes of all parameters and buffers.
+    """
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(tensor.nelement() * tensor.element_size() for tensor in tensors)
+
+
+def optimizer_bytes(optimizer):
+    """
+    Get the bytes of the optimizer state, e.g. the Adam moment estimates.
+
+    Args:
+        optimizer (torch.optim.Optimizer): The optimizer.
+
+    Returns:
+        int: Bytes of all state tensors.
+    """
+    total = 0
+    for state in optimizer.state.values():
+        for value in state.values():
+            if isinstance(value, torch.Tensor):
+                total += value.nelement() * value.element_size()
+    return total
+
+
+def replay_bytes(replay_buffer):
+    """
+    Get the bytes held by the frames of a replay buffer.
+
+    Tensors sharing storage (on the CPU the next state of a transition and the
+    state of the following one are views of the same camera frame) are
+    counted once, at the size of their whole storage.
+
+    Args:
+        replay_buffer (ReplayBuffer or CompressedReplayBuffer): The replay buffer.
+
+    Returns:
+        int: Bytes of the stored frames plus the per-transition overhead.
+    """
+    if hasattr(replay_buffer, "compressed_bytes"):
+        return replay_buffer.compressed_bytes + len(replay_buffer.buffer) * TRANSITION_OVERHEAD
+    storages = {}
+    for state, _, _, next_state, _ in list(replay_buffer.buffer):
+        for tensor in (state, next_state):
+            if tensor is not None:
+                storage = tensor.untyped_storage()
+                storages[storage.data_ptr()] = storage.nbytes()
+    return sum(storages.values()) + len(replay_buffer.buffer) * TRANSITION_OVERHEAD
+
+
+def transition_bytes(frame_shape, device):
+    """
+    Estimate the bytes one uncompressed transition adds to the replay buffer.
+
+    Args:
+        frame_shape (tuple): Camera frame shape (H, W).
+        device (torch.device): Device the replay tensors are stored on.
+
+    Returns:
+        int: Estimated bytes per transition.
+    """
+    height, width = frame_shape
+    if device.type == "cpu":
+        # state and next state are views of the camera's BGRA buffers, shared with the neighbouring transitions
+        return height * width * 4 + TRANSITION_OVERHEAD
+    # copying to the device makes the state and the next state two separate RGB frames
+    return 2 * height * width * 3 + TRANSITION_OVERHEAD
+
+
+def device_usage(device):
+    """
+    Get the memory in use on the device the budget applies to.
+
+    Args:
+        device (torch.device): The replay device.
+
+    Returns:
+        int: Bytes allocated by tensors on a CUDA device, the process RSS on the CPU.
+    """
+    if device.type == "cuda":
+        return torch.cuda.memory_allocated(device)
+    return process_rss()
+
+
+class MemoryMonitor:
+    """
+    Per-episode memory accounting of a training run, with an optional budget.
+
+    Reports the bytes of the replay buffer, the networks and the optimizer
+    state, the process RSS and, on CUDA, the allocated, reserved and peak
+    device memory. With a budget, the memory the replay buffer lives in (host
+    RSS for CPU tensors, allocated device memory for CUDA tensors) is checked
+    at the end of every episode: above warn_fraction of the budget a warning
+    is printed, and above shed_fraction the replay capacity is reduced,
+    dropping the oldest transitions, until usage is back at warn_fraction.
+    replay_capacity() sizes the buffer before training so that a full buffer
+    stays within the budget.
+
+    Args:
+        device (torch.device): Device the replay tensors are stored on.
+        budget (int, optional): Memory budget in bytes, None to only report.
+        warn_fraction (float): Fraction of the budget above which a warning is printed.
+        shed_fraction (float): Fraction of the budget above which replay capacity is shed.
+        min_capacity (int): Replay capacity is never shed below this, e.g. the batch size.
+
+    Attributes:
+        last (dict): Memory figures of the last check, see sample().
+        shed (int): Replay capacity shed so far.
+    """
+
+    def __init__(self, device, budget=None, warn_fraction=0.85, shed_fraction=0.95, min_capacity=32):
+        self.device = device
+        self.budget = budget
+        self.warn_fraction = warn_fraction
+        self.shed_fraction = shed_fraction
+        self.min_capacity = min_capacity
+        self.last = {}
+        self.shed = 0
+
+    def replay_capacity(self, frame_shape, max_capacity, steps_per_episode=0):
+        """
+        Size the replay buffer to fit the budget next to the memory already in use.
+
+        Args:
+            frame_shape (tuple): Camera frame shape (H, W).
+            max_capacity (int): Capacity used when the budget allows it.
+            steps_per_episode (int): Headroom for the transitions of one episode, stored between two checks.
+
+        Returns:
+            int: Replay capacity, max_capacity without a budget.
+        """
+        if self.budget is None:
+            return max_capacity
+        per_transition = transition_bytes(frame_shape, self.device)
+        available = self.budget * self.warn_fraction - device_usage(self.device)
+        capacity = int(available // per_transition) - steps_per_episode
+        capacity = max(self.min_capacity, min(max_capacity, capacity))
+        print(
+            f"Memory budget {self.budget / 1e9:.1f} GB: replay capacity {capacity} "
+            f"({per_transition / 1e6:.2f} MB per transition, {capacity * per_transition / 1e9:.2f} GB when full)"
+        )
+        return capacity
+
+    def sample(self, replay_buffer=None, network=None, target_network=None, optimizer=None):
+        """
+        Measure the memory of the run.
+
+        Args:
+            replay_buffer (ReplayBuffer or CompressedReplayBuffer, optional): The replay buffer.
+            network (torch.nn.Module, optional): The online network.
+            target_network (torch.nn.Module, optional): The target network.
+            optimizer (torch.optim.Optimizer, optional): The optimizer.
+
+        Returns:
+            dict: Bytes of "replay", "model" (both networks), "optimizer" and "rss", the replay "transitions"
+                and "capacity", and on CUDA "cuda_allocated", "cuda_reserved" and "cuda_peak".
+        """
+        stats = {"rss": process_rss()}
+        if replay_buffer is not None:
+            stats["replay"] = replay_bytes(replay_buffer)
+            stats["transitions"] = replay_buffer.size()
+            stats["capacity"] = replay_buffer.buffer.maxlen
+        stats["model"] = sum(module_bytes(module) for module in (network, target_network) if module is not None)
+        if optimizer is not None:
+            stats["optimizer"] = optimizer_bytes(optimizer)
+        if self.device.type == "cuda":
+            stats["cuda_allocated"] = torch.cuda.memory_allocated(self.device)
+            stats["cuda_reserved"] = torch.cuda.memory_reserved(self.device)
+            stats["cuda_peak"] = torch.cuda.max_memory_allocated(self.device)
+        self.last = stats
+        return stats
+
+    def check(self, replay_buffer, network=None, target_network=None, optimizer=None):
+        """
+        Measure the memory and enforce the budget, called at the end of an episode.
+
+        Args:
+            replay_buffer (ReplayBuffer or CompressedReplayBuffer): The replay buffer, resized when shedding.
+            network (torch.nn.Module, optional): The online network.
+            target_network (torch.nn.Module, optional): The target network.
+            optimizer (torch.optim.Optimizer, optional): The optimizer.
+
+        Returns:
+            str: Report of the memory figures and of any warning or shedding.
+        """
+        stats = self.sample(replay_buffer, network, target_network, optimizer)
+        text = self.report(stats)
+        if self.budget is None:
+            return text
+        usage = device_usage(self.device)
+        if usage > self.shed_fraction * self.budget and stats["transitions"] > 0:
+            per_transition = stats["replay"] / stats["transitions"]
+            excess = usage - self.warn_fraction * self.budget
+            capacity = max(self.min_capacity, stats["transitions"] - int(excess // per_transition) - 1)
+            if capacity < stats["transitions"]:
+                replay_buffer.resize(capacity)
+                self.shed += stats["capacity"] - capacity
+                if self.device.type == "cuda":
+                    torch.cuda.empty_cache()  # return the dropped frames to the driver
+                text += (
+                    f"\nMemory budget exceeded ({usage / 1e9:.2f} of {self.budget / 1e9:.2f} GB): "
+                    f"replay capacity reduced from {stats['capacity']} to {capacity}"
+                )
+            else:
+                text += f"\nMemory budget exceeded ({usage / 1e9:.2f} of {self.budget / 1e9:.2f} GB) at minimum replay capacity"
+        elif usage > self.warn_fraction * self.budget:
+            text += f"\nMemory warning: {usage / self.budget * 100:.0f}% of the {self.budget / 1e9:.2f} GB budget in use"
+        return text
+
+    def report(self, stats=None):
+        """
+        Format memory figures.
+
+        Args:
+            stats (dict, optional): Figures from sample(), the last ones by default.
+
+        Returns:
+            str: One line with the replay, model, optimizer, RSS, device memory and budget use.
+        """
+        stats = self.last if stats is None else stats
+        parts = []
+        if "replay" in stats:
+            parts.append(
+                f"replay {stats['replay'] / 1e9:.2f} GB ({stats['transitions']}/{stats['capacity']} transitions)"
+            )
+        parts.append(f"model {stats['model'] / 1e6:.1f} MB")
+        if "optimizer" in stats:
+            parts.append(f"optimizer {stats['optimizer'] / 1e6:.1f} MB")
+        parts.append(f"RSS {stats['rss'] / 1e9:.2f} GB")
+        if "cuda_allocated" in stats:
+            parts.append(
+                f"CUDA allocated {stats['cuda_allocated'] / 1e9:.2f} GB reserved {stats['cuda_reserved'] / 1e9:.2f} GB "
+                f"peak {stats['cuda_peak'] / 1e9:.2f} GB"
+            )
+        if self.budget is not None:
+            parts.append(f"budget {device_usage(self.device) / self.budget * 100:.0f}% of {self.budget / 1e9:.1f} GB")
+        return "Memory: " + ", ".join(parts)
@@ -0,0 +1,332 @@
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+
+# Column types of the two tables; every column is stored as its own append-only binary file
+EPISODE_COLUMNS = {
+    "episode": "i4",
+    "avg_reward": "f4",
+    "total_reward": "f4",
+    "steps": "i4",
+    "lane_deviation": "f4",
+    "angle": "f4",
+    "speed": "f4",
+    "epsilon": "f4",
+    "loss": "f4",
+    "episode_time": "f4",
+    "step_offset": "i8",  # first row of the episode in the step table
+}
+STEP_COLUMNS = {
+    "episode": "i4",
+    "step": "i4",
+    "reward": "f4",
+    "lane_deviation": "f4",
+    "angle": "f4",
+    "speed": "f4",
+    "action": "i2",
+    "loss": "f4",
+    "step_time": "f4",
+}
+# Per-episode timing percentiles of the profiled phases, one row per phase and episode
+PROFILE_COLUMNS = {
+    "episode": "i4",
+    "phase": "i2",  # index into profile_phases.json
+    "count": "i4",
+    "total": "f4",
+    "p50": "f4",
+    "p90": "f4",
+    "p99": "f4",
+    "max": "f4",
+}
+
+
+class MetricsRecorder:
+    """
+    Append-only columnar recorder for per-episode and per-step training metrics and phase timings.
+
+    Rows are buffered in memory and appended to one raw binary file per column
+    (flushed every flush_every rows and at the end of each episode), so recording
+    costs a list append per value and never rewrites existing data.
+
+    Args:
+        directory (str): Directory of the store.
+        log_steps (bool): Whether per-step rows are recorded.
+        resume (bool): Keep the existing store instead of starting a new one.
+        flush_every (int): Number of buffered step rows that triggers a flush.
+
+    Attributes:
+        rows (dict): Number of rows written (or buffered) per table.
+    """
+
+    def __init__(self, directory, log_steps=False, resume=False, flush_every=1000):
+        self.directory = directory
+        self.log_steps = log_steps
+        self.flush_every = flush_every
+        self.tables = {"episodes": EPISODE_COLUMNS, "steps": STEP_COLUMNS, "profile": PROFILE_COLUMNS}
+        os.makedirs(directory, exist_ok=True)
+        if not resume:
+            for table, columns in self.tables.items():
+                for column in columns:
+                    path = self._path(table, column)
+                    if os.path.exists(path):
+                        os.remove(path)
+            if os.path.exists(os.path.join(directory, "profile_phases.json")):
+                os.remove(os.path.join(directory, "profile_phases.json"))
+        with open(os.path.join(directory, "schema.json"), "w") as file:
+            json.dump(self.tables, file)
+        self.phases = profile_phases(directory) if resume else []
+        self._buffers = {table: {column: [] for column in columns} for table, columns in self.tables.items()}
+        self.rows = {table: table_rows(directory, table, columns) for table, columns in self.tables.items()}
+        self._step_offset = self.rows["steps"]  # first step row of the current episode
+
+    def record_step(self, **values):
+        """
+        Record one step row (ignored unless log_steps is set).
+
+        Args:
+            **values: One value per STEP_COLUMNS column.
+        """
+        if not self.log_steps:
+            return
+        self._append("steps", values)
+        if len(self._buffers["steps"]["step"]) >= self.flush_every:
+            self._flush("steps")
+
+    def record_episode(self, **values):
+        """
+        Record one episode row and flush both tables.
+
+        Args:
+            **values: One value per EPISODE_COLUMNS column except step_offset, which is filled in.
+        """
+        values["step_offset"] = self._step_offset
+        self._append("episodes", values)
+        self._flush("steps")
+        self._flush("profile")
+        self._flush("episodes")
+        self._step_offset = self.rows["steps"]
+
+    def record_profile(self, episode, stats):
+        """
+        Record the phase timings of an episode, written with the next episode row.
+
+        Args:
+            episode (int): The episode.
+            stats (dict): Phase name to its "count", "total", "p50", "p90", "p99" and "max" (seconds).
+        """
+        for name, phase_stats in stats.items():
+            if name not in self.phases:
+                self.phases.append(name)
+                with open(os.path.join(self.directory, "profile_phases.json"), "w") as file:
+                    json.dump(self.phases, file)
+            self._append("profile", dict(phase_stats, episode=episode, phase=self.phases.index(name)))
+
+    def truncate(self, episodes):
+        """
+        Drop everything recorded from the given episode on, e.g. after resuming from a checkpoint.
+
+        Args:
+            episodes (int): Number of episode rows to keep.
+        """
+        reader = MetricsReader(self.directory)
+        episodes = min(episodes, self.rows["episodes"])
+        step_rows = self.rows["steps"]
+        if episodes < self.rows["episodes"]:
+            step_rows = int(reader.read("episodes", ["step_offset"], episodes, episodes + 1)["step_offset"][0])
+        # profile rows are appended in episode order
+        profile_rows = int(np.searchsorted(reader.read("profile", ["episode"])["episode"], episodes))
+        for table, rows in (("episodes", episodes), ("steps", step_rows), ("profile", profile_rows)):
+            for column, dtype in self.tables[table].items():
+                path = self._path(table, column)
+                if os.path.exists(path):
+                    with open(path, "r+b") as file:
+                        file.truncate(rows * np.dtype(dtype).itemsize)
+            self.rows[table] = rows
+        self._step_offset = step_rows
+
+    def export_csv(self):
+        """
+        Export the episode table to plot_data.csv and step_plot.csv in the legacy format.
+        """
+        self.flush()
+        export_legacy_csv(self.directory)
+
+    def flush(self):
+        """
+        Write all buffered rows.
+        """
+        for table in self.tables:
+            self._flush(table)
+
+    def _path(self, table, column):
+        return column_path(self.directory, table, column)
+
+    def _append(self, table, values):
+        buffers = self._buffers[table]
+        for column in self.tables[table]:
+            buffers[column].append(values[column])
+        self.rows[table] += 1
+
+    def _flush(self, table):
+        buffers = self._buffers[table]
+        for column, dtype in self.tables[table].items():
+            if buffers[column]:
+                with open(self._path(table, column), "ab") as file:
+                    np.asarray(buffers[column], dtype=dtype).tofile(file)
+                buffers[column] = []
+
+
+def column_path(directory, table, column):
+    """
+    Get the file of a column.
+
+    Args:
+        directory (str): Directory of the store.
+        table (str): "episodes", "steps" or "profile".
+        column (str): Column name.
+
+    Returns:
+        str: Path of the column's binary file.
+    """
+    return os.path.join(directory, f"{table}.{column}.bin")
+
+
+def table_rows(directory, table, columns):
+    """
+    Get the number of complete rows of a table (the shortest column while a flush is in progress).
+
+    Args:
+        directory (str): Directory of the store.
+        table (str): "episodes", "steps" or "profile".
+        columns (dict): Column name to dtype of the table.
+
+    Returns:
+        int: Number of complete rows.
+    """
+    rows = []
+    for column, dtype in columns.items():
+        path = column_path(directory, table, column)
+        rows.append(os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0)
+    return min(rows)
+
+
+def profile_phases(directory):
+    """
+    Get the phase names of a store's profile table.
+
+    Args:
+        directory (str): Directory of the store.
+
+    Returns:
+        list: Phase names, indexed by the profile table's phase column.
+    """
+    path = os.path.join(directory, "profile_phases.json")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+class MetricsReader:
+    """
+    Reader for a store written by MetricsRecorder.
+
+    Keeps a row offset per table, so tail() only reads the rows appended since
+    the previous call.
+
+    Args:
+        directory (str): Directory of the store.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "schema.json"), "r") as file:
+            self.tables = json.load(file)
+        self.offsets = {table: 0 for table in self.tables}
+
+    def rows(self, table):
+        """
+        Get the number of complete rows of a table.
+
+        Args:
+            table (str): "episodes", "steps" or "profile".
+
+        Returns:
+            int: Number of rows.
+        """
+        return table_rows(self.directory, table, self.tables[table])
+
+    def read(self, table, columns=None, start=0, stop=None):
+        """
+        Read a row range of some columns.
+
+        Args:
+            table (str): "episodes", "steps" or "profile".
+            columns (list, optional): Columns to read, all by default.
+            start (int): First row.
+            stop (int, optional): Row after the last one, the end of the table by default.
+
+        Returns:
+            dict: Column name to np.ndarray.
+        """
+        if stop is None:
+            stop = self.rows(table)
+        count = max(0, stop - start)
+        result = {}
+        for column in columns or self.tables[table]:
+            dtype = np.dtype(self.tables[table][column])
+            path = column_path(self.directory, table, column)
+            if count == 0 or not os.path.exists(path):
+                result[column] = np.zeros(0, dtype=dtype)
+                continue
+            result[column] = np.fromfile(path, dtype=dtype, count=count, offset=start * dtype.itemsize)
+        return result
+
+    def tail(self, table, columns=None):
+        """
+        Read the rows appended since the previous call.
+
+        Args:
+            table (str): "episodes", "steps" or "profile".
+            columns (list, optional): Columns to read, all by default.
+
+        Returns:
+            dict: Column name to np.ndarray of the new rows.
+        """
+        stop = self.rows(table)
+        if stop < self.offsets[table]:
+            self.offsets[table] = 0  # the store was restarted or truncated
+        data = self.read(table, columns, self.offsets[table], stop)
+        self.offsets[table] = stop
+        return data
+
+
+def export_legacy_csv(directory, plot_path="plot_data.csv", step_plot_path="step_plot.csv"):
+    """
+    Export the episode table in the format of plot_data.csv and step_plot.csv.
+
+    Args:
+        directory (str): Directory of the store.
+        plot_path (str): Path of the average reward / steps file (no header).
+        step_plot_path (str): Path of the lane deviation / angle / speed file.
+    """
+    data = MetricsReader(directory).read("episodes")
+    with open(plot_path, "w", newline="") as file:
+        csv.writer(file).writerows(zip(data["avg_reward"].tolist(), data["steps"].astype(float).tolist()))
+    with open(step_plot_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["lane_dev_avg", "angle_avg", "speed_avg"])
+        writer.writerows(zip(data["lane_deviation"].tolist(), data["angle"].tolist(), data["speed"].tolist()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a metrics store to the legacy CSV files")
+    parser.add_argument("directory", type=str, help="Metrics store directory, e.g. metrics/vOTv1")
+    parser.add_argument("--plot-data", type=str, default="plot_data.csv", help="Output for per-episode reward/steps")
+    parser.add_argument("--step-plot", type=str, default="step_plot.csv", help="Output for lane deviation/angle/speed")
+    args = parser.parse_args()
+    export_legacy_csv(args.directory, args.plot_data, args.step_plot)
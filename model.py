@@ -0,0 +1,146 @@
+from copy import deepcopy
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+# Number of discrete (throttle, steer) actions
+NUM_ACTIONS = 45
+
+
+class DuelingDDQN(nn.Module):
+    """
+    Dueling Double Deep Q-Network (DDQN) model for reinforcement learning.
+
+    This neural network model predicts Q-values for each action given a state.
+
+    Args:
+        action_dim (int): Dimensionality of the action space.
+        image_dim (tuple): Dimensions of the input image (height, width).
+
+    Attributes:
+        conv1 (nn.Conv2d): First convolutional layer.
+        pool1 (nn.MaxPool2d): First max pooling layer.
+        conv2 (nn.Conv2d): Second convolutional layer.
+        pool2 (nn.MaxPool2d): Second max pooling layer.
+        conv3 (nn.Conv2d): Third convolutional layer.
+        pool3 (nn.MaxPool2d): Third max pooling layer.
+        flatten_size (int): Size of the flattened output of the final convolutional layer.
+        fc1 (nn.Linear): Fully connected layer.
+        value_stream (nn.Linear): Linear layer for the value stream.
+        advantage_stream (nn.Linear): Linear layer for the advantage stream.
+    """
+    
+    def __init__(self, action_dim, image_dim=(480, 640)):
+        super(DuelingDDQN, self).__init__()
+        # Convolutional and pooling layers
+        self.conv1 = nn.Conv2d(3, 32, kernel_size=8, stride=4)
+        self.pool1 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.conv2 = nn.Conv2d(32, 64, kernel_size=4, stride=2)
+        self.pool2 = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.conv3 = nn.Conv2d(64, 64, kernel_size=3, stride=1)
+        self.pool3 = nn.MaxPool2d(kernel_size=2, stride=2)
+
+        # Flatten the output of the final convolutional layer
+        self.flatten_size = self._get_conv_output((3, image_dim[0], image_dim[1]))
+
+        # Fully connected layers
+        self.fc1 = nn.Linear(self.flatten_size, 512)
+
+        # State Value stream
+        self.value_stream = nn.Linear(512, 1)
+
+        # Advantage stream
+        self.advantage_stream = nn.Linear(512, action_dim)
+
+    def _get_conv_output(self, shape):
+        """
+        Compute the size of the flattened output of the final convolutional layer.
+
+        Args:
+            shape (tuple): Shape of the input tensor (channels, height, width).
+
+        Returns:
+            int: Size of the flattened output.
+        """
+        with torch.no_grad():
+            input = torch.zeros(1, *shape)
+            output = self.conv1(input)
+            output = self.pool1(output)
+            output = self.conv2(output)
+            output = self.pool2(output)
+            output = self.conv3(output)
+            output = self.pool3(output)
+            return int(np.prod(output.size()))
+
+    def forward(self, state):
+        """
+        Forward pass of the neural network.
+
+        Args:
+            state (torch.Tensor): Input state tensor.
+
+        Returns:
+            torch.Tensor: Predicted Q-values for each action.
+        """
+        return self.head(self.encode(state))
+
+    def encode(self, state):
+        """
+        Encode states into the features the dueling streams work on.
+
+        Args:
+            state (torch.Tensor): Input state tensor.
+
+        Returns:
+            torch.Tensor: Output of the fully connected layer (batch, 512).
+        """
+        # Convert state to float and scale if necessary
+        state = state.float() / 255.0  # Scale images to [0, 1]
+
+        x = F.relu(self.pool1(self.conv1(state)))
+        x = F.relu(self.pool2(self.conv2(x)))
+        x = F.relu(self.pool3(self.conv3(x)))
+
+        # Flatten and pass through fully connected layer
+        x = x.reshape(x.size(0), -1)
+        return F.relu(self.fc1(x))
+
+    def head(self, x):
+        """
+        Compute Q-values from encoded features.
+
+        Args:
+            x (torch.Tensor): Features returned by encode.
+
+        Returns:
+            torch.Tensor: Predicted Q-values for each action.
+        """
+        # Value and advantage streams
+        value = self.value_stream(x)
+        advantage = self.advantage_stream(x)
+
+        # Combine to get Q-values
+
+        q_values = value + advantage - advantage.mean(dim=1, keepdim=True)
+        #      print(f'Shapes of network, Value{value.shape}, advantage{advantage.shape}, q_values{q_values.shape}')
+        return q_values
+
+
+def create_networks(device, learning_rate=1e-5):
+    """
+    Build the online network, its target copy and the optimizer.
+
+    Args:
+        device (torch.device): Device the networks are placed on.
+        learning_rate (float): Learning rate of the Adam optimizer.
+
+    Returns:
+        tuple: The online network, the target network and the optimizer.
+    """
+    network = DuelingDDQN(NUM_ACTIONS).to(device)
+    target_network = deepcopy(network)
+    optimizer = torch.optim.Adam(network.parameters(), lr=learning_rate)
+    return network, target_network, optimizer
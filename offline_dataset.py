@@ -0,0 +1,334 @@
+import glob
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+import torch
+
+
+# Shards use the replay file layout of checkpoint.save_replay, so checkpoint directories are shards too
+STATES_FILE = "replay_states.npy"
+NEXT_STATES_FILE = "replay_next_states.npy"
+META_FILE = "replay_meta.npz"
+
+
+class DatasetWriter:
+    """
+    Append-only writer of recorded transitions into fixed-size dataset shards.
+
+    Every shard is a directory holding memory-mapped state/next-state frames and
+    a metadata file with actions, rewards and dones; the metadata file is
+    written when the shard is full (or closed), so a shard is only visible to
+    the loader once it is complete. Flushing a full shard happens on a
+    background thread.
+
+    Args:
+        directory (str): Directory of the dataset, e.g. datasets/vOTv1.
+        shard_size (int): Number of transitions per shard.
+    """
+
+    def __init__(self, directory, shard_size=2000):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.written = 0
+        self._shard = len(glob.glob(os.path.join(directory, "shard*")))  # continue after existing shards
+        self._count = 0
+        self._states = None
+        self._flushers = []
+
+    def add(self, state, action, reward, next_state, done):
+        """
+        Append one transition.
+
+        Args:
+            state (np.ndarray): Camera frame before the step (H, W, 3) uint8.
+            action (int): Index of the action taken.
+            reward (float): The reward of the step.
+            next_state (np.ndarray): Camera frame after the step.
+            done (bool): Whether the episode ended.
+        """
+        if self._states is None:
+            self._open(state.shape)
+        self._states[self._count] = state
+        self._next_states[self._count] = next_state
+        self._actions[self._count] = action
+        self._rewards[self._count] = reward
+        self._dones[self._count] = done
+        self._count += 1
+        self.written += 1
+        if self._count == self.shard_size:
+            self._close_shard()
+
+    def close(self):
+        """
+        Complete the current (partial) shard and wait for all shards to be flushed.
+        """
+        if self._states is not None:
+            self._close_shard()
+        for flusher in self._flushers:
+            flusher.join()
+        self._flushers = []
+
+    def _open(self, frame_shape):
+        self._path = os.path.join(self.directory, f"shard{self._shard:05d}")
+        os.makedirs(self._path, exist_ok=True)
+        shape = (self.shard_size,) + tuple(frame_shape)
+        self._states = np.lib.format.open_memmap(os.path.join(self._path, STATES_FILE), "w+", np.uint8, shape)
+        self._next_states = np.lib.format.open_memmap(
+            os.path.join(self._path, NEXT_STATES_FILE), "w+", np.uint8, shape
+        )
+        self._actions = np.zeros(self.shard_size, dtype=np.int64)
+        self._rewards = np.zeros(self.shard_size, dtype=np.float32)
+        self._dones = np.zeros(self.shard_size, dtype=np.bool_)
+        self._count = 0
+
+    def _close_shard(self):
+        flusher = threading.Thread(
+            target=_flush_shard,
+            args=(self._path, self._states, self._next_states, self._actions, self._rewards, self._dones, self._count),
+            daemon=True,
+        )
+        flusher.start()
+        self._flushers = [f for f in self._flushers if f.is_alive()] + [flusher]
+        self._states = None
+        self._shard += 1
+
+
+def _flush_shard(path, states, next_states, actions, rewards, dones, count):
+    states.flush()
+    next_states.flush()
+    np.savez(os.path.join(path, META_FILE), actions=actions, rewards=rewards, dones=dones, total=count)
+
+
+def find_shards(paths):
+    """
+    Find the complete shards under dataset or checkpoint directories.
+
+    Args:
+        paths (list): Shard, dataset or checkpoint directories (searched recursively).
+
+    Returns:
+        list: Directories that contain a shard.
+    """
+    shards = []
+    for path in paths:
+        for meta in sorted(glob.glob(os.path.join(path, "**", META_FILE), recursive=True)):
+            shards.append(os.path.dirname(meta))
+    return shards
+
+
+class OfflineDataset:
+    """
+    Streaming loader of shuffled transition batches from memory-mapped shards.
+
+    Datasets can be much larger than RAM: each epoch shuffles the order of
+    small contiguous blocks across all shards, worker threads read the blocks
+    from the memory maps (so disk reads stay mostly sequential), and a batcher
+    thread mixes them in a bounded shuffle buffer before assembling batches,
+    pinned for fast transfer when the learner runs on CUDA. Only the shuffle
+    buffer and the prefetched batches are held in memory, about
+    (shuffle_buffer + prefetch * batch_size) * 2 frames.
+
+    Args:
+        paths (list): Shard, dataset or checkpoint directories.
+        batch_size (int): Transitions per batch.
+        shuffle_buffer (int): Number of transitions mixed before sampling.
+        block_size (int): Consecutive transitions read per block.
+        workers (int): Number of reader threads.
+        prefetch (int): Number of batches assembled ahead of the learner.
+        epochs (int, optional): Passes over the data, endless if None.
+        seed (int, optional): Seed of the block order and shuffle buffer.
+
+    Attributes:
+        size (int): Number of transitions in the dataset.
+        wait_time (float): Seconds the learner waited for batches.
+    """
+
+    def __init__(
+        self, paths, batch_size=32, shuffle_buffer=256, block_size=16, workers=2, prefetch=4, epochs=None, seed=None
+    ):
+        self.shards = []
+        for path in find_shards(paths):
+            meta = np.load(os.path.join(path, META_FILE))
+            states = np.load(os.path.join(path, STATES_FILE), mmap_mode="r")
+            capacity = len(states)
+            total = int(meta["total"])
+            # a checkpoint replay ring holds its transitions from first (its last capacity ones if not stored) to total
+            first = int(meta["first"]) if "first" in meta.files else max(0, total - capacity)
+            slots = np.arange(first, total) % capacity
+            self.shards.append(
+                {
+                    "states": states,
+                    "next_states": np.load(os.path.join(path, NEXT_STATES_FILE), mmap_mode="r"),
+                    "actions": meta["actions"],
+                    "rewards": meta["rewards"],
+                    "dones": meta["dones"],
+                    "slots": np.sort(slots),
+                }
+            )
+        self.size = sum(len(shard["slots"]) for shard in self.shards)
+        if self.size == 0:
+            raise ValueError(f"No transitions found in {paths}")
+        self.batch_size = batch_size
+        self.shuffle_buffer = max(shuffle_buffer, batch_size)
+        self.block_size = block_size
+        self.workers = workers
+        self.epochs = epochs
+        self.wait_time = 0.0
+        self.batches = 0
+        self._random = random.Random(seed)
+        self._pin = torch.cuda.is_available()
+        self._blocks = queue.Queue(maxsize=workers * 2)
+        self._batches = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def __iter__(self):
+        """
+        Start the reader threads and yield batches.
+
+        Yields:
+            tuple: States and next states (B, H, W, 3) uint8, actions int64,
+                rewards float32 and dones bool, as CPU tensors.
+        """
+        tasks = queue.Queue()
+        self._threads = [threading.Thread(target=self._schedule, args=(tasks,), daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._read, args=(tasks,), daemon=True) for _ in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._batch, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                batch = self._batches.get()
+                self.wait_time += time.perf_counter() - wait_start
+                if batch is None:
+                    return
+                self.batches += 1
+                yield batch
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop the reader threads.
+        """
+        self._stop.set()
+        for q in (self._blocks, self._batches):
+            while not q.empty():
+                q.get_nowait()
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return True, q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return False, None
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _schedule(self, tasks):
+        epoch = 0
+        while self.epochs is None or epoch < self.epochs:
+            blocks = [
+                (i, shard["slots"][start:start + self.block_size])
+                for i, shard in enumerate(self.shards)
+                for start in range(0, len(shard["slots"]), self.block_size)
+            ]
+            self._random.shuffle(blocks)
+            for block in blocks:
+                # bound the number of scheduled blocks so epochs do not pile up in memory
+                while tasks.qsize() > self.workers * 4 and not self._stop.is_set():
+                    time.sleep(0.001)
+                if self._stop.is_set():
+                    return
+                tasks.put(block)
+            epoch += 1
+        for _ in range(self.workers):
+            tasks.put(None)
+
+    def _read(self, tasks):
+        while True:
+            ok, block = self._get(tasks)
+            if not ok:
+                return
+            if block is None:
+                self._put(self._blocks, None)
+                return
+            index, slots = block
+            shard = self.shards[index]
+            # contiguous slices read sequentially from the memory maps
+            first, last = int(slots[0]), int(slots[-1]) + 1
+            if last - first == len(slots):
+                states = np.array(shard["states"][first:last])
+                next_states = np.array(shard["next_states"][first:last])
+            else:
+                states = shard["states"][slots]
+                next_states = shard["next_states"][slots]
+            item = (states, shard["actions"][slots], shard["rewards"][slots], next_states, shard["dones"][slots])
+            if not self._put(self._blocks, item):
+                return
+
+    def _batch(self):
+        buffer = []
+        finished = 0
+        while not self._stop.is_set():
+            # fill the shuffle buffer, then draw a random batch from it
+            while len(buffer) < self.shuffle_buffer and finished < self.workers:
+                ok, block = self._get(self._blocks)
+                if not ok:
+                    return
+                if block is None:
+                    finished += 1
+                    continue
+                buffer.extend(zip(*block))
+            if not buffer:
+                self._put(self._batches, None)
+                return
+            count = min(self.batch_size, len(buffer))
+            picked = []
+            for _ in range(count):
+                i = self._random.randrange(len(buffer))
+                buffer[i], buffer[-1] = buffer[-1], buffer[i]
+                picked.append(buffer.pop())
+            states, actions, rewards, next_states, dones = zip(*picked)
+            batch = (
+                torch.from_numpy(np.stack(states)),
+                torch.from_numpy(np.asarray(actions, dtype=np.int64)),
+                torch.from_numpy(np.asarray(rewards, dtype=np.float32)),
+                torch.from_numpy(np.stack(next_states)),
+                torch.from_numpy(np.asarray(dones, dtype=np.bool_)),
+            )
+            if self._pin:
+                batch = tuple(tensor.pin_memory() for tensor in batch)
+            if not self._put(self._batches, batch):
+                return
+
+    def summary(self, elapsed):
+        """
+        Summarize the loader throughput.
+
+        Args:
+            elapsed (float): Wall time of the training loop in seconds.
+
+        Returns:
+            str: Batches per second and the fraction of time the learner waited for data.
+        """
+        return (
+            f"Offline dataset ({self.size} transitions in {len(self.shards)} shards): "
+            f"{self.batches / max(elapsed, 1e-9):.1f} batches/s, learner waited "
+            f"{self.wait_time / max(elapsed, 1e-9) * 100:.1f}% of the time"
+        )
@@ -0,0 +1,62 @@
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def update_plot(rewards, num_steps, lane_deviation, angle, speed):
+    """
+    Update the training plot with new data.
+
+    Args:
+        rewards (list): List of average rewards per episode.
+        num_steps (list): List of number of steps per episode.
+        lane_deviation (list): List of lane deviation values per episode.
+        angle (list): List of angle values per episode.
+        speed (list): List of speed values per episode.
+    """
+    # with open('plot')
+    # plt.clf()  just adds blank figure
+    plt.figure(figsize=(10, 8))
+
+    # create plots
+    plt.subplot(4, 1, 1)
+    plt.plot(np.arange(0, len(rewards)), rewards)
+    plt.xlabel("Training Episodes")
+    plt.ylabel("Average Reward per Episode")
+    plt.title("Average Reward")
+
+    # Plot the number of steps per episode
+    plt.subplot(4, 1, 2)
+    plt.plot(np.arange(0, len(num_steps)), num_steps)
+    plt.xlabel("Training Episodes")
+    plt.ylabel("Number of Steps per Episode")
+    plt.title("Steps per Episode")
+
+    plt.subplot(4, 1, 3)
+    y1 = lane_deviation
+    y2 = angle
+    y3 = speed
+    x = len(speed)
+    plt.plot(np.arange(0, x), y1, label="Lane Deviation (distance from center)")
+    plt.plot(np.arange(0, x), y2, label="Angle (radians)")
+    plt.plot(np.arange(0, x), y3, label="Speed (m/s)")
+    plt.xlabel("Training Episodes")
+    plt.ylabel("Lane Deviation, Angle, Speed")
+    plt.title("Lane Deviation, Angle, Speed per Episode")
+    plt.legend()
+
+    plt.subplot(4, 1, 4)
+    plt.scatter(np.arange(0, len(rewards)), rewards, color="blue")
+    coeffs = np.polyfit(np.arange(len(rewards)), rewards, 1)
+    p = np.poly1d(coeffs)
+    plt.plot(np.arange(len(rewards)), p(np.arange(len(rewards))), "r--")
+    plt.xlabel("Training Episodes")
+    plt.ylabel("Average Reward per Episode")
+    plt.title(
+        "Average Reward (Corr: {:.2f})".format(
+            np.corrcoef(rewards, p(np.arange(len(rewards))))[0, 1]
+        )
+    )
+
+    # Adjust layout and display the plot
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,186 @@
+import os
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+
+class _Timer:
+    """
+    Context manager timing one phase, appending the duration to the phase's samples.
+    """
+
+    __slots__ = ("samples", "start")
+
+    def __init__(self):
+        self.samples = []
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.start)
+        return False
+
+
+class _TracedTimer:
+    """
+    Timer that also marks the phase in a running torch.profiler trace.
+    """
+
+    __slots__ = ("timer", "name", "_record")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        from torch.profiler import record_function
+
+        self._record = record_function(self.name)
+        self._record.__enter__()
+        return self.timer.__enter__()
+
+    def __exit__(self, *exc):
+        self.timer.__exit__(*exc)
+        self._record.__exit__(*exc)
+        return False
+
+
+# Shared timer of disabled profilers
+_DISABLED = nullcontext()
+
+
+class PhaseProfiler:
+    """
+    Named wall clock timers around the phases of the training loop and the environment.
+
+    Each phase keeps the durations of its calls in the current episode (a
+    perf_counter pair and a list append per call); episode_stats() turns them
+    into counts, totals and percentiles. During episodes chosen for tracing a
+    torch.profiler trace is recorded as well, with every phase marked by a
+    record_function range, and exported as a Chrome trace.
+
+    Args:
+        enabled (bool): Whether phases are timed; a disabled profiler's timers do nothing.
+        trace_episodes (list): Episodes recorded with torch.profiler.
+        trace_directory (str): Directory of the exported traces.
+
+    Attributes:
+        tracing (bool): Whether a torch.profiler trace is being recorded.
+    """
+
+    def __init__(self, enabled=True, trace_episodes=(), trace_directory="profiles"):
+        self.enabled = enabled
+        self.trace_episodes = set(trace_episodes)
+        self.trace_directory = trace_directory
+        self.tracing = False
+        self._timers = {}
+        self._traced = {}
+        self._trace = None
+        self._trace_path = None
+
+    def phase(self, name):
+        """
+        Get the timer of a phase, used as "with profiler.phase(name):".
+
+        Args:
+            name (str): Name of the phase, e.g. "step.tick".
+
+        Returns:
+            Context manager timing the phase.
+        """
+        if not self.enabled:
+            return _DISABLED
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = _Timer()
+        if self.tracing:
+            traced = self._traced.get(name)
+            if traced is None:
+                traced = self._traced[name] = _TracedTimer(timer, name)
+            return traced
+        return timer
+
+    def start_episode(self, episode):
+        """
+        Start a torch.profiler trace if the episode is one of the traced ones.
+
+        Args:
+            episode (int): The episode.
+        """
+        if not self.enabled or episode not in self.trace_episodes:
+            return
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        os.makedirs(self.trace_directory, exist_ok=True)
+        self._trace_path = os.path.join(self.trace_directory, f"ep{episode:05d}.trace.json")
+        self._trace = profile(activities=activities)
+        self._trace.__enter__()
+        self.tracing = True
+
+    def end_episode(self):
+        """
+        Stop and export the trace of a traced episode.
+
+        Returns:
+            str or None: Path of the exported Chrome trace, None if the episode was not traced.
+        """
+        if not self.tracing:
+            return None
+        self.tracing = False
+        self._trace.__exit__(None, None, None)
+        self._trace.export_chrome_trace(self._trace_path)
+        self._trace = None
+        return self._trace_path
+
+    def episode_stats(self):
+        """
+        Aggregate the phase durations of the episode and start a new one.
+
+        Returns:
+            dict: Phase name to its "count", "total", "p50", "p90", "p99" and "max" in seconds,
+                for the phases that ran in the episode.
+        """
+        stats = {}
+        for name, timer in self._timers.items():
+            if not timer.samples:
+                continue
+            samples = np.asarray(timer.samples)
+            p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+            stats[name] = {
+                "count": len(samples),
+                "total": float(samples.sum()),
+                "p50": float(p50),
+                "p90": float(p90),
+                "p99": float(p99),
+                "max": float(samples.max()),
+            }
+            timer.samples = []
+        return stats
+
+
+def format_profile(stats, episode_time):
+    """
+    Format episode phase statistics as a table.
+
+    Args:
+        stats (dict): Phase statistics from PhaseProfiler.episode_stats.
+        episode_time (float): Wall time of the episode in seconds.
+
+    Returns:
+        str: One line per phase, slowest total first, with calls, total, share of the episode and percentiles.
+    """
+    lines = [f"{'phase':<20}{'calls':>7}{'total s':>9}{'share':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+    for name, phase in sorted(stats.items(), key=lambda item: -item[1]["total"]):
+        lines.append(
+            f"{name:<20}{phase['count']:>7}{phase['total']:>9.2f}{phase['total'] / max(episode_time, 1e-9) * 100:>7.1f}%"
+            f"{phase['p50'] * 1000:>9.2f}{phase['p90'] * 1000:>9.2f}{phase['p99'] * 1000:>9.2f}{phase['max'] * 1000:>9.2f}"
+        )
+    return "\n".join(lines)
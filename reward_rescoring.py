@@ -0,0 +1,306 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from trajectory import load_trajectory
+
+
+# Component weights of overtaking_reward; progress, alignment and center are unit weights in the live reward
+OVERTAKING_WEIGHTS = {
+    "progress": 1.0,
+    "alignment": 1.0,
+    "center": 1.0,
+    "collision": -10.0,
+    "unsafe_lane_change": -5.0,
+    "overtake": 10.0,
+    "conservative": -2.0,
+    "steer": -2.0,
+}
+
+
+def load_run(directory):
+    """
+    Load and concatenate the recorded episodes of a run (or a single episode directory).
+
+    Args:
+        directory (str): Run directory (trajectories/v<version>) or episode directory.
+
+    Returns:
+        dict: Step fields as arrays plus "row" (index into the steps) for the NPC fields
+            prefixed with "npc_".
+    """
+    if os.path.exists(os.path.join(directory, "start.json")):
+        episode_directories = [directory]
+    else:
+        episode_directories = sorted(glob.glob(os.path.join(directory, "ep*")))
+    steps = []
+    npcs = []
+    offset = 0
+    for episode_directory in episode_directories:
+        trajectory = load_trajectory(episode_directory)
+        episode_steps = trajectory["steps"]
+        count = len(episode_steps["step"])
+        if count == 0:
+            continue
+        steps.append(episode_steps)
+        # map every NPC row onto the global row of its step
+        step_to_row = np.full(int(episode_steps["step"].max()) + 1, -1, dtype=np.int64)
+        step_to_row[episode_steps["step"].astype(np.int64)] = np.arange(count) + offset
+        episode_npcs = dict(trajectory["npcs"])
+        episode_npcs["row"] = step_to_row[episode_npcs["step"].astype(np.int64)]
+        npcs.append(episode_npcs)
+        offset += count
+    if not steps:
+        raise ValueError(f"No recorded steps found in {directory}")
+    data = {field: np.concatenate([s[field] for s in steps]).astype(np.float64) for field in steps[0]}
+    for field in npcs[0]:
+        data["npc_" + field] = np.concatenate([n[field] for n in npcs])
+    return data
+
+
+def _any_per_row(rows, mask, count):
+    """
+    Reduce a per-NPC condition to a per-step "any NPC satisfies it" flag.
+    """
+    flags = np.zeros(count, dtype=bool)
+    flags[rows[mask]] = True
+    return flags
+
+
+def _features(data):
+    """
+    Compute the quantities shared by the reward functions for every step.
+    """
+    count = len(data["step"])
+    yaw = np.radians(data["yaw"])
+    road = np.radians(data["lane_yaw"])
+    features = {
+        "dd": np.hypot(data["x"] - data["prev_x"], data["y"] - data["prev_y"]),
+        "distance_from_center": np.sqrt(
+            (data["x"] - data["lane_x"]) ** 2 + (data["y"] - data["lane_y"]) ** 2 + (data["z"] - data["lane_z"]) ** 2
+        ),
+        "half_width": data["lane_width"] / 2.0,
+        "collision": data["collision"] > 0,
+        "steer": data["steer"],
+        "speed": np.sqrt(data["vx"] ** 2 + data["vy"] ** 2 + data["vz"] ** 2),
+        "yaw_signed": (yaw + np.pi) % (2 * np.pi) - np.pi,  # [-pi, pi) as in reward_1..4
+        "yaw_positive": (yaw + 2 * np.pi) % (2 * np.pi),  # [0, 2pi) as in overtaking_reward
+        "road": road,
+        # signed lateral offset along the lane's right vector, as in is_vehicle_within_lane
+        "lateral": -(data["x"] - data["lane_x"]) * np.sin(road) + (data["y"] - data["lane_y"]) * np.cos(road),
+    }
+
+    rows = data["npc_row"]
+    valid = rows >= 0
+    rows = np.where(valid, rows, 0)
+    ego_x = data["x"][rows]
+    ego_y = data["y"][rows]
+    ego_z = data["z"][rows]
+    distance = np.sqrt((data["npc_x"] - ego_x) ** 2 + (data["npc_y"] - ego_y) ** 2 + (data["npc_z"] - ego_z) ** 2)
+    relative_x = ego_x - data["npc_x"]
+    features["proximity"] = _any_per_row(rows, valid & (distance < 5.0), count)
+    features["passed_vehicle"] = _any_per_row(rows, valid & (relative_x > 0) & (relative_x < 10), count)
+    features["vehicle_ahead"] = _any_per_row(rows, valid & (distance < 20) & (data["npc_x"] > ego_x), count)
+    return features
+
+
+def _folded_theta(vehicle, road):
+    theta = np.abs(vehicle - road) % (2 * np.pi)
+    return np.where(theta > np.pi, 2 * np.pi - theta, theta)
+
+
+def reward_1(f, weights=None):
+    """
+    Vectorized Environment.reward_1.
+    """
+    exceed_max_rotation = np.abs(f["yaw_signed"]) > np.pi / 10
+    heading_difference = np.abs(f["yaw_signed"] - f["road"]) % (2 * np.pi)
+    going_opposite = heading_difference > np.pi / 2
+    not_near_center = f["distance_from_center"] > f["half_width"] / 2
+    done = not_near_center | going_opposite | f["collision"]
+    base = np.select(
+        [f["collision"], done, exceed_max_rotation],
+        [-1000.0, np.where(not_near_center, -100.0, -500.0), -50.0],
+        f["dd"] * 50,
+    )
+    components = {"base": base, "heading": -100 * heading_difference}
+    causes = {"not_near_center": not_near_center, "opposite_direction": going_opposite, "collision": f["collision"]}
+    return components, done, causes
+
+
+def reward_2(f, weights=None):
+    """
+    Vectorized intent of Environment.reward_2 (the live version references undefined variables).
+    """
+    out_of_lane = np.abs(f["lateral"]) > f["half_width"]
+    not_near_center = f["distance_from_center"] > f["half_width"] / 4
+    components = {
+        "progress": np.where(out_of_lane, -100.0, f["dd"] * 5),
+        "center": np.where(not_near_center, -0.5, 2.0),
+    }
+    return components, out_of_lane, {"out_of_lane": out_of_lane}
+
+
+def reward_3(f, weights=None):
+    """
+    Vectorized Environment.reward_3.
+    """
+    theta = _folded_theta(f["yaw_signed"], f["road"])
+    going_opposite = theta > np.pi / 2
+    not_near_center = f["distance_from_center"] > f["half_width"] / 1.5
+    done = not_near_center | going_opposite | f["collision"]
+    wd = f["half_width"] * 2 / 2.5
+    components = {
+        "progress": f["dd"],
+        "alignment": 2 * np.cos(theta),
+        "center": -np.abs(f["distance_from_center"] / wd),
+        "fail": -4.0 * done,
+    }
+    causes = {"not_near_center": not_near_center, "opposite_direction": going_opposite, "collision": f["collision"]}
+    return components, done, causes
+
+
+def reward_4(f, weights=None):
+    """
+    Vectorized Environment.reward_4.
+    """
+    theta = _folded_theta(f["yaw_signed"], f["road"])
+    going_opposite = theta > np.pi / 2
+    not_near_center = f["distance_from_center"] > f["half_width"] / 1.5
+    done = not_near_center | going_opposite | f["collision"]
+    wd = f["half_width"] * 2 / 2.5
+    components = {
+        "progress": np.sqrt(f["dd"]),
+        "alignment": np.cos(theta),
+        "center": -np.abs(f["distance_from_center"] / wd),
+        "fail": -2.0 * (f["distance_from_center"] > f["half_width"] / 2.5),
+        "steer": -2 * np.abs(f["steer"]),
+    }
+    causes = {"not_near_center": not_near_center, "opposite_direction": going_opposite, "collision": f["collision"]}
+    return components, done, causes
+
+
+def overtaking_reward(f, weights=None):
+    """
+    Vectorized Environment.overtaking_reward with configurable component weights.
+    """
+    w = dict(OVERTAKING_WEIGHTS)
+    w.update(weights or {})
+    theta = _folded_theta(f["yaw_positive"], f["road"])
+    going_opposite = theta > np.pi / 2
+    not_near_center = f["distance_from_center"] > f["half_width"] / 1.4
+    wd = f["half_width"] * 2 / 2.5
+    unsafe_lane_change = f["left_solid"] | f["right_solid"] | (np.abs(f["steer"]) > 0.5) | f["proximity"]
+    overtake = f["passed_vehicle"] & ~f["collision"] & ~unsafe_lane_change
+    conservative = (f["speed"] < 0.6 * 70) | (f["vehicle_ahead"] & ~overtake)
+    components = {
+        "progress": w["progress"] * np.sqrt(f["dd"]),
+        "alignment": w["alignment"] * np.cos(theta),
+        "center": -w["center"] * np.abs(f["distance_from_center"] / wd),
+        "collision": w["collision"] * f["collision"],
+        "unsafe_lane_change": w["unsafe_lane_change"] * unsafe_lane_change,
+        "overtake": w["overtake"] * overtake,
+        "conservative": w["conservative"] * conservative,
+        "steer": w["steer"] * np.abs(f["steer"]),
+    }
+    done = not_near_center | going_opposite | f["collision"]
+    causes = {"not_near_center": not_near_center, "opposite_direction": going_opposite, "collision": f["collision"]}
+    return components, done, causes
+
+
+REWARD_FUNCTIONS = {1: reward_1, 2: reward_2, 3: reward_3, 4: reward_4, 5: overtaking_reward}
+
+
+def rescore(data, reward_function, weights=None):
+    """
+    Evaluate a reward function over recorded steps.
+
+    Episodes are cut at the first step the rescored reward terminates, so the
+    returns and lengths reflect the new termination rule.
+
+    Args:
+        data (dict): Recorded steps as returned by load_run.
+        reward_function (int): 1 to 4 for reward_1..reward_4, 5 for overtaking_reward.
+        weights (dict, optional): Overtaking component weights overriding OVERTAKING_WEIGHTS.
+
+    Returns:
+        dict: "reward" per step, "components" sums and means over the kept steps,
+            per-episode "returns" and "lengths", and termination cause counts.
+    """
+    features = _features(data)
+    features["left_solid"] = data["left_solid"] > 0
+    features["right_solid"] = data["right_solid"] > 0
+    components, done, causes = REWARD_FUNCTIONS[reward_function](features, weights)
+    reward = sum(components.values())
+
+    # keep each episode up to (and including) its first terminating step
+    episodes = data["episode"].astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, episodes[1:] != episodes[:-1]])
+    episode_index = np.cumsum(np.r_[True, episodes[1:] != episodes[:-1]]) - 1
+    done_before = np.zeros(len(done), dtype=np.int64)
+    cumulative = np.cumsum(done)
+    done_before[1:] = cumulative[:-1]
+    done_before -= np.where(starts > 0, cumulative[starts - 1], 0)[episode_index]
+    kept = done_before == 0
+
+    returns = np.bincount(episode_index, weights=reward * kept)
+    lengths = np.bincount(episode_index, weights=kept).astype(np.int64)
+    terminated = np.bincount(episode_index, weights=done & kept) > 0
+    return {
+        "reward": reward,
+        "components": {
+            name: {"sum": float(np.sum(value * kept)), "mean": float(np.sum(value * kept) / max(1, kept.sum()))}
+            for name, value in components.items()
+        },
+        "returns": returns,
+        "lengths": lengths,
+        "terminated": int(terminated.sum()),
+        "causes": {name: int(np.sum(flags & done & kept)) for name, flags in causes.items()},
+    }
+
+
+def _parse_weights(pairs):
+    weights = {}
+    for pair in pairs or []:
+        name, value = pair.split("=")
+        if name not in OVERTAKING_WEIGHTS:
+            raise ValueError(f"Unknown component {name}, choose from {', '.join(OVERTAKING_WEIGHTS)}")
+        weights[name] = float(value)
+    return weights
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score recorded trajectories with a reward function")
+    parser.add_argument("directory", type=str, help="Trajectory run or episode directory")
+    parser.add_argument("--reward-function", type=int, default=5, help="1 to 4, or 5 for overtaking_reward")
+    parser.add_argument(
+        "--weights", type=str, nargs="*", help="Overtaking component weights, e.g. overtake=5 unsafe_lane_change=-8"
+    )
+    args = parser.parse_args()
+
+    load_start = time.time()
+    data = load_run(args.directory)
+    load_time = time.time() - load_start
+    rescore_start = time.time()
+    result = rescore(data, args.reward_function, _parse_weights(args.weights))
+    rescore_time = time.time() - rescore_start
+
+    print(
+        f"{len(data['step'])} steps in {len(result['returns'])} episodes "
+        f"(loaded in {load_time:.2f} s, rescored in {rescore_time * 1000:.1f} ms)"
+    )
+    print(
+        f"Return mean {np.mean(result['returns']):.2f} std {np.std(result['returns']):.2f}, "
+        f"length mean {np.mean(result['lengths']):.1f}, reward per step "
+        f"{np.sum(result['returns']) / max(1, np.sum(result['lengths'])):.3f}"
+    )
+    print(f"Recorded reward per step {np.mean(data['reward']):.3f}")
+    print("Components (sum, mean per step):")
+    for name, value in result["components"].items():
+        print(f"  {name:20s} {value['sum']:12.2f} {value['mean']:9.4f}")
+    print(f"Terminated episodes: {result['terminated']}/{len(result['returns'])}")
+    for name, count in result["causes"].items():
+        print(f"  {name:20s} {count}")
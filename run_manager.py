@@ -0,0 +1,213 @@
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+
+class Run:
+    """
+    One training job launched by the RunManager.
+
+    Args:
+        name (str): Display name, also the log file name.
+        command (list): Command line of the job.
+        log_path (str): File the job's output is appended to.
+        max_lines (int): Number of output lines kept in memory for display.
+
+    Attributes:
+        status (str): "queued", "running", "cancelling", "finished", "failed" or "cancelled".
+        returncode (int or None): Exit code once the job ended.
+        lines (deque): Most recent output lines.
+    """
+
+    def __init__(self, name, command, log_path, max_lines=5000):
+        self.name = name
+        self.command = command
+        self.log_path = log_path
+        self.status = "queued"
+        self.returncode = None
+        self.process = None
+        self.lines = deque(maxlen=max_lines)
+        self.started = None
+        self.ended = None
+        self._output = queue.Queue()
+        self._cancel_time = None
+        self._offset = 0
+
+    def elapsed(self):
+        """
+        Get the wall time of the job.
+
+        Returns:
+            float: Seconds since it started (until it ended), 0 while queued.
+        """
+        if self.started is None:
+            return 0.0
+        return (self.ended or time.time()) - self.started
+
+    def _start(self, cwd):
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        # the job writes straight to its log file, so it keeps running if this process exits
+        with open(self.log_path, "ab") as log:
+            self._offset = log.tell()
+            self.process = subprocess.Popen(self.command, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        self.status = "running"
+        self.started = time.time()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        # the reader thread tails the log file into the queue, the UI thread drains it
+        partial = ""
+        with open(self.log_path, "r", errors="replace") as log:
+            log.seek(self._offset)
+            while True:
+                exited = self.process.poll() is not None  # checked before reading so no output is missed
+                for line in iter(log.readline, ""):
+                    partial += line
+                    if partial.endswith("\n"):
+                        self._output.put(partial.rstrip("\n"))
+                        partial = ""
+                if exited:
+                    if partial:
+                        self._output.put(partial)
+                    return
+                time.sleep(0.1)
+
+    def _drain(self):
+        new = []
+        while True:
+            try:
+                new.append(self._output.get_nowait())
+            except queue.Empty:
+                break
+        self.lines.extend(new)
+        return new
+
+
+class RunManager:
+    """
+    Queue of training jobs run as non-blocking subprocesses.
+
+    Jobs start in submission order while fewer than max_concurrent are
+    running; their merged stdout/stderr is written straight to a log file,
+    which a reader thread per job tails into a queue, so running jobs do not
+    depend on the manager's process and keep going if it exits. poll() must be
+    called periodically (e.g. from a Tk timer): it collects output, detects
+    finished jobs and starts queued ones, so the caller's thread never blocks.
+
+    Args:
+        max_concurrent (int): Maximum number of jobs running at once.
+        cwd (str, optional): Working directory of the jobs, this file's directory by default.
+        log_directory (str): Directory of the job log files.
+
+    Attributes:
+        runs (list): All submitted runs in submission order.
+    """
+
+    def __init__(self, max_concurrent=1, cwd=None, log_directory="logs"):
+        self.max_concurrent = max_concurrent
+        self.cwd = cwd or os.path.abspath(os.path.dirname(__file__))
+        self.log_directory = os.path.join(self.cwd, log_directory)
+        self.runs = []
+
+    def submit(self, arguments, name=None, script="carla_lane_keeping_d3qn.py"):
+        """
+        Queue a job.
+
+        Args:
+            arguments (list): Command line arguments of the script.
+            name (str, optional): Display name, derived from the submission time by default.
+            script (str): Script to run with the current Python interpreter.
+
+        Returns:
+            Run: The queued run.
+        """
+        name = name or time.strftime("run_%Y%m%d_%H%M%S")
+        if any(run.name == name for run in self.runs):
+            name = f"{name}_{len(self.runs)}"
+        # unbuffered so output streams line by line
+        command = [sys.executable, "-u", script] + [str(argument) for argument in arguments]
+        run = Run(name, command, os.path.join(self.log_directory, name + ".log"))
+        self.runs.append(run)
+        return run
+
+    def cancel(self, run, kill_after=10.0):
+        """
+        Cancel a queued job, or terminate a running one (killed if it has not exited after kill_after seconds).
+
+        Args:
+            run (Run): The run to cancel.
+            kill_after (float): Seconds to wait for a graceful exit.
+        """
+        if run.status == "queued":
+            run.status = "cancelled"
+        elif run.status == "running":
+            run.process.terminate()
+            run.status = "cancelling"
+            run._cancel_time = time.time() + kill_after
+
+    def poll(self):
+        """
+        Collect output, update job states and start queued jobs.
+
+        Returns:
+            dict: New output lines per run that produced any.
+        """
+        output = {}
+        for run in self.runs:
+            if run.process is None:
+                continue
+            new = run._drain()
+            if new:
+                output[run] = new
+            if run.status in ("running", "cancelling"):
+                returncode = run.process.poll()
+                if returncode is None:
+                    if run.status == "cancelling" and time.time() > run._cancel_time:
+                        run.process.kill()
+                    continue
+                run.returncode = returncode
+                run.ended = time.time()
+                if run.status == "cancelling":
+                    run.status = "cancelled"
+                else:
+                    run.status = "finished" if returncode == 0 else "failed"
+        running = sum(run.status in ("running", "cancelling") for run in self.runs)
+        for run in self.runs:
+            if running >= self.max_concurrent:
+                break
+            if run.status == "queued":
+                try:
+                    run._start(self.cwd)
+                except OSError as error:
+                    run.status = "failed"
+                    run.lines.append(f"Could not start: {error}")
+                    continue
+                running += 1
+        return output
+
+    def shutdown(self, timeout=10.0):
+        """
+        Cancel all jobs and wait for the running ones to exit, killing them after the timeout.
+
+        Args:
+            timeout (float): Seconds to wait for a graceful exit.
+        """
+        for run in self.runs:
+            self.cancel(run, kill_after=timeout)
+        deadline = time.time() + timeout + 5.0
+        while self.active() and time.time() < deadline:
+            self.poll()
+            time.sleep(0.1)
+
+    def active(self):
+        """
+        Check whether jobs are queued or running.
+
+        Returns:
+            bool: True while any job is queued, running or being cancelled.
+        """
+        return any(run.status in ("queued", "running", "cancelling") for run in self.runs)
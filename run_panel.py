@@ -0,0 +1,90 @@
+import tkinter as tk
+from tkinter import ttk
+from tkinter.scrolledtext import ScrolledText
+
+
+class RunPanel:
+    """
+    Tk view of a RunManager: a job list with status, exit code and wall time,
+    the streamed log of the selected job, and a cancel button.
+
+    Args:
+        master (tk.Misc): Parent widget.
+        manager (RunManager): The run manager to show and poll.
+        interval (int): Polling interval in milliseconds.
+    """
+
+    def __init__(self, master, manager, interval=200):
+        self.master = master
+        self.manager = manager
+        self.interval = interval
+        self.frame = tk.Frame(master)
+        self.table = ttk.Treeview(self.frame, columns=("status", "code", "time"), height=6)
+        self.table.heading("#0", text="Run")
+        self.table.heading("status", text="Status")
+        self.table.heading("code", text="Exit Code")
+        self.table.heading("time", text="Time")
+        self.table.column("code", width=80)
+        self.table.column("time", width=80)
+        self.table.grid(row=0, column=0, sticky="nsew")
+        self.table.bind("<<TreeviewSelect>>", lambda event: self._show_selected())
+        self.cancel_button = tk.Button(self.frame, text="Cancel Run", command=self._cancel_selected)
+        self.cancel_button.grid(row=0, column=1, sticky="n", padx=5)
+        self.log = ScrolledText(self.frame, height=15, width=100, state="disabled")
+        self.log.grid(row=1, column=0, columnspan=2, sticky="nsew")
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(1, weight=1)
+        self._items = {}
+        self._selected = None
+        self.poll()
+
+    def poll(self):
+        """
+        Poll the manager, refresh the job list and append new log lines, then schedule the next poll.
+        """
+        try:
+            output = self.manager.poll()
+            for run in self.manager.runs:
+                values = (run.status, "" if run.returncode is None else run.returncode, f"{run.elapsed():.0f} s")
+                if run not in self._items:
+                    self._items[run] = self.table.insert("", "end", text=run.name, values=values)
+                    if self._selected is None:
+                        self.table.selection_set(self._items[run])
+                else:
+                    self.table.item(self._items[run], values=values)
+            if self._selected in output:
+                self._append(output[self._selected])
+        finally:
+            self.master.after(self.interval, self.poll)
+
+    def _run_for(self, item):
+        for run, run_item in self._items.items():
+            if run_item == item:
+                return run
+        return None
+
+    def _show_selected(self):
+        selection = self.table.selection()
+        self._selected = self._run_for(selection[0]) if selection else None
+        self.log.config(state="normal")
+        self.log.delete("1.0", tk.END)
+        self.log.config(state="disabled")
+        if self._selected is not None:
+            self._append(list(self._selected.lines))
+
+    def _append(self, lines):
+        # only follow the output if the view is scrolled to the end
+        at_end = self.log.yview()[1] >= 0.999
+        self.log.config(state="normal")
+        self.log.insert(tk.END, "\n".join(lines) + "\n")
+        # keep as many lines as the run does, so long runs do not grow the widget without limit
+        excess = int(self.log.index("end-1c").split(".")[0]) - 1 - self._selected.lines.maxlen
+        if excess > 0:
+            self.log.delete("1.0", f"{excess + 1}.0")
+        self.log.config(state="disabled")
+        if at_end:
+            self.log.see(tk.END)
+
+    def _cancel_selected(self):
+        if self._selected is not None:
+            self.manager.cancel(self._selected)
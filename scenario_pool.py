@@ -0,0 +1,216 @@
+import json
+import os
+import random
+
+import carla
+
+
+class ScenarioPool:
+    """
+    Pool of precomputed, validated traffic layouts stored on disk per map.
+
+    A layout is an ego spawn index together with a set of NPC spawn indices and
+    blueprints that do not overlap each other or the ego, so the NPCs can be
+    spawned in one batch without failed attempts. Layouts are served
+    round-robin or by difficulty (share of the NPCs waiting ahead of the ego).
+
+    Args:
+        map_name (str): Name of the map the layouts belong to.
+        directory (str): Directory in which the layout files are stored.
+        mode (str): How layouts are served, "round-robin" or "difficulty".
+
+    Attributes:
+        layouts (list): Layouts as dicts with "ego", "npcs", "blueprints" and "difficulty".
+        difficulty (float): Requested difficulty in [0, 1] used in "difficulty" mode.
+        attempted (int): Number of NPC spawns attempted so far.
+        spawned (int): Number of NPCs spawned successfully so far.
+    """
+
+    def __init__(self, map_name, directory="scenarios", mode="round-robin"):
+        if mode not in ("round-robin", "difficulty"):
+            raise ValueError(f"Unknown scenario mode {mode}, use 'round-robin' or 'difficulty'.")
+        self.map_name = map_name
+        self.path = os.path.join(directory, map_name + ".json")
+        self.mode = mode
+        self.layouts = []
+        self.difficulty = 0.0
+        self.attempted = 0
+        self.spawned = 0
+        self._next = 0
+
+    def generate(
+        self,
+        spawn_points,
+        vehicle_bps,
+        ego_indices,
+        layouts_per_spawn=20,
+        num_npcs=20,
+        radius=120.0,
+        min_gap=10.0,
+        preferred=None,
+    ):
+        """
+        Precompute non-colliding traffic layouts around each ego spawn point.
+
+        Args:
+            spawn_points (list): All spawn points of the map.
+            vehicle_bps (list): Vehicle blueprints to choose NPCs from.
+            ego_indices (list): Spawn indices the ego can start from.
+            layouts_per_spawn (int): Number of layouts generated per ego spawn point.
+            num_npcs (int): Maximum number of NPCs per layout.
+            radius (float): Radius in meters around the ego NPCs are placed in.
+            min_gap (float): Minimum distance in meters between two spawned vehicles.
+            preferred (list, optional): Spawn indices that are always considered
+                when in range, such as the hand-picked overtaking spawns.
+
+        Returns:
+            list: The generated layouts.
+        """
+        self.layouts = []
+        for ego_index in ego_indices:
+            ego = spawn_points[ego_index]
+            forward = ego.get_forward_vector()
+            candidates = [
+                i
+                for i, transform in enumerate(spawn_points)
+                if min_gap <= transform.location.distance(ego.location) <= radius
+                or (preferred and i in preferred and i != ego_index)
+            ]
+            for _ in range(layouts_per_spawn):
+                random.shuffle(candidates)
+                npcs = []
+                placed = [ego.location]
+                for i in candidates:
+                    location = spawn_points[i].location
+                    if all(location.distance(other) >= min_gap for other in placed):
+                        npcs.append(i)
+                        placed.append(location)
+                    if len(npcs) >= num_npcs:
+                        break
+                ahead = 0
+                for i in npcs:
+                    offset = spawn_points[i].location - ego.location
+                    if offset.x * forward.x + offset.y * forward.y > 0:
+                        ahead += 1
+                self.layouts.append(
+                    {
+                        "ego": ego_index,
+                        "npcs": npcs,
+                        "blueprints": [random.choice(vehicle_bps).id for _ in npcs],
+                        "difficulty": ahead / num_npcs if num_npcs else 0.0,
+                    }
+                )
+        # next() in "difficulty" mode expects the layouts sorted by difficulty, validate() keeps the order
+        self.layouts.sort(key=lambda layout: layout["difficulty"])
+        return self.layouts
+
+    def validate(self, carla_client, world, blueprint_library, spawn_points, ego_bp):
+        """
+        Spawn every layout once in the simulator and drop the ones with failed spawns.
+
+        Args:
+            carla_client (carla.Client): The CARLA client.
+            world (carla.World): The world running the map.
+            blueprint_library (carla.BlueprintLibrary): Blueprints of the map.
+            spawn_points (list): All spawn points of the map.
+            ego_bp (carla.ActorBlueprint): Blueprint of the ego vehicle.
+
+        Returns:
+            int: Number of layouts that were dropped.
+        """
+        valid = []
+        for layout in self.layouts:
+            batch = [carla.command.SpawnActor(ego_bp, spawn_points[layout["ego"]])]
+            batch += [
+                carla.command.SpawnActor(blueprint_library.find(bp_id), spawn_points[i])
+                for i, bp_id in zip(layout["npcs"], layout["blueprints"])
+            ]
+            responses = carla_client.apply_batch_sync(batch, False)
+            carla_client.apply_batch_sync(
+                [carla.command.DestroyActor(r.actor_id) for r in responses if not r.error]
+            )
+            if not any(r.error for r in responses):
+                valid.append(layout)
+        dropped = len(self.layouts) - len(valid)
+        self.layouts = valid
+        world.tick()
+        return dropped
+
+    def save(self):
+        """
+        Store the layouts on disk.
+
+        Raises:
+            ValueError: If there are no layouts, e.g. when validation dropped all of them.
+        """
+        if not self.layouts:
+            raise ValueError(f"No valid scenario layouts for {self.map_name}, nothing to save.")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as file:
+            json.dump({"map": self.map_name, "layouts": self.layouts}, file)
+
+    def load(self):
+        """
+        Load the layouts of the map from disk.
+
+        Returns:
+            bool: True if a layout file with at least one layout was found.
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r") as file:
+            self.layouts = json.load(file)["layouts"]
+        self.layouts.sort(key=lambda layout: layout["difficulty"])
+        return bool(self.layouts)
+
+    def next(self):
+        """
+        Get the layout for the next episode.
+
+        Returns:
+            dict: The layout.
+        """
+        if self.mode == "difficulty":
+            # layouts are sorted by difficulty, pick randomly among those closest to the request
+            target = self.difficulty * (len(self.layouts) - 1)
+            window = max(1, len(self.layouts) // 10)
+            low = max(0, int(round(target)) - window // 2)
+            return random.choice(self.layouts[low:low + window])
+        layout = self.layouts[self._next % len(self.layouts)]
+        self._next += 1
+        return layout
+
+    def spawn(self, carla_client, blueprint_library, spawn_points, layout, tm_port):
+        """
+        Spawn the NPCs of a layout in one batch with the autopilot enabled.
+
+        Args:
+            carla_client (carla.Client): The CARLA client.
+            blueprint_library (carla.BlueprintLibrary): Blueprints of the map.
+            spawn_points (list): All spawn points of the map.
+            layout (dict): The layout to spawn.
+            tm_port (int): Port of the Traffic Manager driving the NPCs.
+
+        Returns:
+            list: Ids of the spawned NPCs.
+        """
+        batch = [
+            carla.command.SpawnActor(blueprint_library.find(bp_id), spawn_points[i]).then(
+                carla.command.SetAutopilot(carla.command.FutureActor, True, tm_port)
+            )
+            for i, bp_id in zip(layout["npcs"], layout["blueprints"])
+        ]
+        responses = carla_client.apply_batch_sync(batch, False)
+        actor_ids = [r.actor_id for r in responses if not r.error]
+        self.attempted += len(batch)
+        self.spawned += len(actor_ids)
+        return actor_ids
+
+    def success_rate(self):
+        """
+        Get the share of NPC spawns that succeeded so far.
+
+        Returns:
+            float: The spawn success rate in [0, 1].
+        """
+        return self.spawned / self.attempted if self.attempted else 1.0
@@ -0,0 +1,72 @@
+DEFAULT_MAP = "Town04"
+
+# Carla Client attribute, created on first use by get_client()
+client = None
+
+# Per map cache of the static world data (map, blueprint library and spawn points)
+world_cache = {}
+
+
+def get_client(host="localhost", port=2000):
+    """
+    Get the CARLA client, connecting on the first call.
+
+    Args:
+        host (str): Host of the CARLA server.
+        port (int): Port of the CARLA server.
+
+    Returns:
+        carla.Client: The shared client instance.
+    """
+    global client
+    if client is None:
+        import carla
+
+        client = carla.Client(host, port)
+        client.set_timeout(5.0)  # Set a timeout in seconds for client connection
+        print("Client established")
+    return client
+
+
+def load_world(carla_client, map_name=DEFAULT_MAP, reload=False):
+    """
+    Get a world running the requested map, only loading the map if it is not already loaded.
+
+    Args:
+        carla_client (carla.Client): The CARLA client.
+        map_name (str): Name of the map to run (e.g. Town04).
+        reload (bool): Reload the current map with reload_world(reset_settings=False)
+            when it already matches, which is much faster than a full load_world.
+
+    Returns:
+        tuple: The world (carla.World) and whether the map had to be loaded (bool).
+    """
+    world = carla_client.get_world()
+    current_map = world.get_map().name.split("/")[-1]
+    if current_map == map_name:
+        if reload:
+            world = carla_client.reload_world(reset_settings=False)
+        return world, False
+    world_cache.pop(map_name, None)
+    return carla_client.load_world(map_name), True
+
+
+def get_world_data(world, map_name):
+    """
+    Get the cached map, blueprint library and spawn points for a map, fetching them once.
+
+    Args:
+        world (carla.World): The world running the map.
+        map_name (str): Name of the map.
+
+    Returns:
+        dict: The "map", "blueprint_library" and "spawn_points" of the map.
+    """
+    if map_name not in world_cache:
+        carla_map = world.get_map()
+        world_cache[map_name] = {
+            "map": carla_map,
+            "blueprint_library": world.get_blueprint_library(),
+            "spawn_points": carla_map.get_spawn_points(),
+        }
+    return world_cache[map_name]
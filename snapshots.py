@@ -0,0 +1,241 @@
+import json
+import math
+import os
+import random
+
+import carla
+
+
+def _transform_to_list(transform):
+    location = transform.location
+    rotation = transform.rotation
+    return [location.x, location.y, location.z, rotation.pitch, rotation.yaw, rotation.roll]
+
+
+def _list_to_transform(values, lift=0.0):
+    x, y, z, pitch, yaw, roll = values
+    return carla.Transform(
+        carla.Location(x=x, y=y, z=z + lift), carla.Rotation(pitch=pitch, yaw=yaw, roll=roll)
+    )
+
+
+def _vector_to_list(vector):
+    return [vector.x, vector.y, vector.z]
+
+
+def _list_to_vector(values):
+    return carla.Vector3D(x=values[0], y=values[1], z=values[2])
+
+
+def _vehicle_state(vehicle):
+    """
+    Capture the dynamic state of a vehicle.
+
+    Args:
+        vehicle (carla.Vehicle): The vehicle.
+
+    Returns:
+        dict: Blueprint id, transform, velocities and the last applied control.
+    """
+    control = vehicle.get_control()
+    return {
+        "type_id": vehicle.type_id,
+        "transform": _transform_to_list(vehicle.get_transform()),
+        "velocity": _vector_to_list(vehicle.get_velocity()),
+        "angular_velocity": _vector_to_list(vehicle.get_angular_velocity()),
+        "control": [
+            control.throttle, control.steer, control.brake, control.hand_brake,
+            control.reverse, control.manual_gear_shift, control.gear,
+        ],
+    }
+
+
+def _control_from_list(values):
+    throttle, steer, brake, hand_brake, reverse, manual_gear_shift, gear = values
+    return carla.VehicleControl(
+        throttle=throttle, steer=steer, brake=brake, hand_brake=hand_brake,
+        reverse=reverse, manual_gear_shift=manual_gear_shift, gear=gear,
+    )
+
+
+def capture_snapshot(env, episode):
+    """
+    Capture the scenario state of the environment.
+
+    The Traffic Manager does not expose its per-vehicle state, so the snapshot
+    records the settings this project applies to it (port, autopilot and the
+    global distance to the leading vehicle) which are re-applied on restore.
+
+    Args:
+        env (Environment): The environment.
+        episode (int): The episode the snapshot was taken in.
+
+    Returns:
+        dict: The snapshot.
+    """
+    return {
+        "map": env.map_name,
+        "episode": episode,
+        "step": env.steps,
+        "ego": _vehicle_state(env.vehicle),
+        "npcs": [_vehicle_state(npc) for npc in env.traffic.npcs if npc.is_alive],
+        "traffic_manager": {"autopilot": True, "distance_to_leading_vehicle": 2.5},
+        "distance": float(env.distance),
+    }
+
+
+def restore_snapshot(carla_client, world, blueprint_library, ego_bp, snapshot, traffic_manager):
+    """
+    Spawn the ego and the NPCs of a snapshot with their velocities and controls.
+
+    Args:
+        carla_client (carla.Client): The CARLA client.
+        world (carla.World): The world running the snapshot's map.
+        blueprint_library (carla.BlueprintLibrary): Blueprints of the map.
+        ego_bp (carla.ActorBlueprint): Blueprint of the ego vehicle.
+        snapshot (dict): The snapshot to restore.
+        traffic_manager (carla.TrafficManager): Traffic manager driving the NPCs.
+
+    Returns:
+        tuple: The ego vehicle (carla.Vehicle) and the ids of the restored NPCs (list).
+    """
+    # lift the vehicles slightly so they do not spawn intersecting the road
+    ego_state = snapshot["ego"]
+    vehicle = world.spawn_actor(ego_bp, _list_to_transform(ego_state["transform"], lift=0.2))
+    vehicle.set_autopilot(False)
+    vehicle.set_target_velocity(_list_to_vector(ego_state["velocity"]))
+    vehicle.set_target_angular_velocity(_list_to_vector(ego_state["angular_velocity"]))
+    vehicle.apply_control(_control_from_list(ego_state["control"]))
+
+    tm_settings = snapshot["traffic_manager"]
+    traffic_manager.set_global_distance_to_leading_vehicle(tm_settings["distance_to_leading_vehicle"])
+    tm_port = traffic_manager.get_port()
+    batch = [
+        carla.command.SpawnActor(
+            blueprint_library.find(state["type_id"]), _list_to_transform(state["transform"], lift=0.2)
+        )
+        .then(carla.command.SetAutopilot(carla.command.FutureActor, tm_settings["autopilot"], tm_port))
+        .then(carla.command.ApplyTargetVelocity(carla.command.FutureActor, _list_to_vector(state["velocity"])))
+        for state in snapshot["npcs"]
+    ]
+    responses = carla_client.apply_batch_sync(batch, False)
+    return vehicle, [r.actor_id for r in responses if not r.error]
+
+
+class SnapshotLibrary:
+    """
+    Library of scenario snapshots that episodes can start from.
+
+    Snapshots are captured when the ego has driven up behind traffic (a vehicle
+    ahead within range), which is where overtaking transitions happen, and a
+    fraction of resets start from a random snapshot instead of the spawn point.
+
+    Args:
+        path (str): JSON file in which the snapshots are stored.
+        fraction (float): Fraction of resets that start from a snapshot.
+        capacity (int): Maximum number of snapshots kept (oldest are dropped).
+        per_episode (int): Maximum number of snapshots captured per episode.
+        min_step (int): Minimum episode step before a snapshot is captured.
+        ahead_distance (float): Distance in meters within which a vehicle ahead makes a moment interesting.
+
+    Attributes:
+        snapshots (list): The stored snapshots.
+        stats (dict): Steps and overtaking transitions of "fresh" and "snapshot" episodes.
+    """
+
+    def __init__(self, path, fraction=0.5, capacity=200, per_episode=1, min_step=20, ahead_distance=25.0):
+        self.path = path
+        self.fraction = fraction
+        self.capacity = capacity
+        self.per_episode = per_episode
+        self.min_step = min_step
+        self.ahead_distance = ahead_distance
+        self.snapshots = []
+        self.stats = {"fresh": [0, 0], "snapshot": [0, 0]}
+        self._captured = 0
+        self._dirty = False
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self.snapshots = json.load(file)
+
+    def choose(self, map_name):
+        """
+        Decide whether the next episode starts from a snapshot.
+
+        Args:
+            map_name (str): Name of the map the environment runs.
+
+        Returns:
+            dict or None: The snapshot to start from, None for a regular reset.
+        """
+        self._captured = 0
+        candidates = [s for s in self.snapshots if s["map"] == map_name]
+        if not candidates or random.random() >= self.fraction:
+            return None
+        return random.choice(candidates)
+
+    def observe(self, env, episode):
+        """
+        Capture a snapshot if the ego is at an interesting moment.
+
+        Args:
+            env (Environment): The environment, after its step.
+            episode (int): The current episode.
+        """
+        if env.from_snapshot or self._captured >= self.per_episode or env.steps < self.min_step:
+            return
+        ego_transform = env.vehicle.get_transform()
+        forward = ego_transform.get_forward_vector()
+        for npc in env.traffic.npcs:
+            offset = npc.get_location() - ego_transform.location
+            along = offset.x * forward.x + offset.y * forward.y
+            lateral = abs(offset.y * forward.x - offset.x * forward.y)
+            if 0 < along < self.ahead_distance and lateral < 4.0:
+                self.snapshots.append(capture_snapshot(env, episode))
+                self.snapshots = self.snapshots[-self.capacity:]
+                self._captured += 1
+                self._dirty = True
+                return
+
+    def end_episode(self, from_snapshot, steps, overtakes):
+        """
+        Record the episode for the time-saving report and store new snapshots.
+
+        Args:
+            from_snapshot (bool): Whether the episode started from a snapshot.
+            steps (int): Number of steps of the episode.
+            overtakes (int): Number of overtaking transitions in the episode.
+        """
+        totals = self.stats["snapshot" if from_snapshot else "fresh"]
+        totals[0] += steps
+        totals[1] += overtakes
+        if self._dirty:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w") as file:
+                json.dump(self.snapshots, file)
+            self._dirty = False
+
+    def report(self, delta_seconds):
+        """
+        Summarize the simulated time spent per overtaking transition.
+
+        Args:
+            delta_seconds (float): Simulated seconds per step.
+
+        Returns:
+            str: Steps and simulated seconds per overtaking transition for both
+                episode kinds and the time saved by starting from snapshots.
+        """
+        per_transition = {}
+        for kind, (steps, overtakes) in self.stats.items():
+            per_transition[kind] = steps / overtakes if overtakes else math.inf
+        fresh = per_transition["fresh"]
+        snapshot = per_transition["snapshot"]
+        text = (
+            f"Snapshots ({len(self.snapshots)} stored): fresh episodes {fresh:.1f} steps "
+            f"({fresh * delta_seconds:.1f} s) per overtaking transition, "
+            f"snapshot episodes {snapshot:.1f} steps ({snapshot * delta_seconds:.1f} s)"
+        )
+        if math.isfinite(fresh) and math.isfinite(snapshot):
+            text += f", saving {(fresh - snapshot) * delta_seconds:.1f} s simulated per transition"
+        return text
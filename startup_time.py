@@ -0,0 +1,91 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+# Commands measured by default, each run in a fresh interpreter
+COMMANDS = {
+    "cli --help": ["carla_lane_keeping_d3qn.py", "--help"],
+    "frontend": ["frontend.py", "--startup-time"],
+    "import plotting": ["-c", "import plotting"],
+    "import metrics_store": ["-c", "import metrics_store"],
+    "import model": ["-c", "import model"],
+    "import simulator": ["-c", "import simulator"],
+}
+
+
+def measure(arguments, repeats=5):
+    """
+    Measure the wall time of a Python command from process launch to exit.
+
+    Args:
+        arguments (list): Arguments passed to the Python interpreter.
+        repeats (int): Number of runs.
+
+    Returns:
+        tuple: Wall times in seconds of the runs and the error output of a failed run (None if all succeeded).
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable] + arguments, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return times, result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit {result.returncode}"
+    return times, None
+
+
+def slowest_imports(arguments, count=10):
+    """
+    List the slowest imports of a Python command and of its direct imports (python -X importtime).
+
+    Args:
+        arguments (list): Arguments passed to the Python interpreter.
+        count (int): Number of imports listed.
+
+    Returns:
+        list: (cumulative microseconds, module name) of the slowest imports.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level <= 1:  # the command's own imports and what they import directly
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the startup time of the frontend, the CLI and the modules")
+    parser.add_argument("--repeats", type=str, nargs=1, help="Runs per command (default 5)", required=False)
+    parser.add_argument(
+        "--imports", type=str, nargs=1, help="List the slowest imports of every command (True/False)", required=False
+    )
+    args = parser.parse_args()
+
+    repeats = int(args.repeats[0]) if args.repeats else 5
+    for name, arguments in COMMANDS.items():
+        times, error = measure(arguments, repeats)
+        if error is not None:
+            print(f"{name}: failed ({error})")
+            continue
+        print(f"{name}: median {statistics.median(times):.3f} s, min {min(times):.3f} s over {len(times)} runs")
+        if args.imports and args.imports[0] == "True":
+            for cumulative, module in slowest_imports(arguments):
+                print(f"    {cumulative / 1e6:.3f} s  {module}")
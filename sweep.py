@@ -0,0 +1,254 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+from metrics_store import MetricsReader
+from run_manager import RunManager
+
+
+def expand_configs(spec):
+    """
+    Expand a sweep spec into the argument sets of its runs.
+
+    The spec's "base" arguments are shared by all runs. A "grid" maps argument
+    names to lists of values and yields their cartesian product; a "random"
+    section draws "samples" configurations where every parameter is
+    {"choice": [...]}, {"uniform": [low, high]} or {"loguniform": [low, high]}.
+    Both can be combined (each random sample is crossed with the grid).
+
+    Args:
+        spec (dict): The sweep spec.
+
+    Returns:
+        list: One dict of argument name (without "--") to value per run.
+    """
+    grid = spec.get("grid", {})
+    grid_configs = [dict(zip(grid, values)) for values in itertools.product(*grid.values())] if grid else [{}]
+    random_spec = spec.get("random")
+    if not random_spec:
+        return [dict(spec.get("base", {}), **config) for config in grid_configs]
+    generator = random.Random(random_spec.get("seed"))
+    configs = []
+    for _ in range(random_spec["samples"]):
+        sample = {}
+        for name, distribution in random_spec["params"].items():
+            if "choice" in distribution:
+                sample[name] = generator.choice(distribution["choice"])
+            elif "uniform" in distribution:
+                sample[name] = generator.uniform(*distribution["uniform"])
+            elif "loguniform" in distribution:
+                low, high = distribution["loguniform"]
+                sample[name] = math.exp(generator.uniform(math.log(low), math.log(high)))
+            else:
+                raise ValueError(f"Unknown distribution for {name}: {distribution}")
+        configs += [dict(spec.get("base", {}), **sample, **config) for config in grid_configs]
+    return configs
+
+
+def to_arguments(config):
+    """
+    Turn an argument dict into command line arguments of carla_lane_keeping_d3qn.py.
+
+    Args:
+        config (dict): Argument name (without "--") to value, lists for multi-value arguments.
+
+    Returns:
+        list: The command line arguments.
+    """
+    arguments = []
+    for name, value in config.items():
+        arguments.append("--" + name)
+        arguments += [str(v) for v in value] if isinstance(value, list) else [str(value)]
+    return arguments
+
+
+def summarize_run(metrics_directory, last=10):
+    """
+    Read the final and best rewards of a run from its metrics store.
+
+    Args:
+        metrics_directory (str): Metrics store directory of the run.
+        last (int): Number of final episodes averaged into the final reward.
+
+    Returns:
+        dict: Episodes, final reward (mean of the last episodes' average reward per step) and best reward.
+    """
+    if not os.path.exists(os.path.join(metrics_directory, "schema.json")):
+        return {"episodes": 0, "final_reward": float("nan"), "best_reward": float("nan")}
+    rewards = MetricsReader(metrics_directory).read("episodes", ["avg_reward"])["avg_reward"]
+    if len(rewards) == 0:
+        return {"episodes": 0, "final_reward": float("nan"), "best_reward": float("nan")}
+    return {
+        "episodes": len(rewards),
+        "final_reward": float(np.mean(rewards[-last:])),
+        "best_reward": float(np.max(rewards)),
+    }
+
+
+class Sweep:
+    """
+    Runs the configurations of a sweep concurrently across a pool of simulator endpoints.
+
+    Every endpoint (CARLA host, port and Traffic Manager port) runs at most one
+    job at a time. Failed jobs are retried up to the configured number of
+    times, resuming from their last full checkpoint. Each run gets its own
+    --version, so its metrics, checkpoints and models do not collide.
+
+    Args:
+        spec (dict): The sweep spec, see expand_configs; also "name", "endpoints"
+            (list of {"host", "port", "tm_port"}) and "retries".
+        root (str): Directory of carla_lane_keeping_d3qn.py and the run outputs.
+
+    Attributes:
+        jobs (list): One dict per configuration with its state and results.
+    """
+
+    def __init__(self, spec, root=None):
+        self.name = spec.get("name", time.strftime("sweep_%Y%m%d_%H%M%S"))
+        self.root = root or os.path.abspath(os.path.dirname(__file__))
+        self.endpoints = spec.get("endpoints") or [{"host": "localhost", "port": 2000, "tm_port": 8000}]
+        self.retries = spec.get("retries", 1)
+        self.directory = os.path.join(self.root, "sweeps", self.name)
+        self.manager = RunManager(
+            max_concurrent=len(self.endpoints), cwd=self.root, log_directory=os.path.join("sweeps", self.name, "logs")
+        )
+        self.jobs = [
+            {
+                "index": i,
+                "version": f"{self.name}_{i:03d}",
+                "config": config,
+                "attempts": 0,
+                "status": "pending",
+                "run": None,
+                "endpoint": None,
+                "time": 0.0,
+            }
+            for i, config in enumerate(expand_configs(spec))
+        ]
+        self.spec = dict(spec, name=self.name)
+
+    def command(self, job, endpoint):
+        """
+        Build the command line arguments of a job on an endpoint.
+
+        Args:
+            job (dict): The job.
+            endpoint (dict): The endpoint to run on.
+
+        Returns:
+            list: The command line arguments.
+        """
+        config = dict(job["config"], version=job["version"])
+        config.update(host=endpoint["host"], port=endpoint["port"], **{"tm-port": endpoint["tm_port"]})
+        arguments = to_arguments(config)
+        if job["attempts"] > 0 and str(config.get("operation", "")).lower() in ("new", "tune"):
+            arguments.append("--resume")  # continue a failed run from its last full checkpoint
+        return arguments
+
+    def run(self, poll_interval=1.0, echo=False):
+        """
+        Run all jobs and write the summary.
+
+        Args:
+            poll_interval (float): Seconds between scheduler polls.
+            echo (bool): Print the output of the jobs.
+
+        Returns:
+            list: Summary rows, one per configuration.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "spec.json"), "w") as file:
+            json.dump(self.spec, file, indent=2)
+        free = list(range(len(self.endpoints)))
+        pending = list(self.jobs)
+        while pending or any(job["status"] == "running" for job in self.jobs):
+            output = self.manager.poll()
+            if echo:
+                for run, lines in output.items():
+                    for line in lines:
+                        print(f"[{run.name}] {line}")
+            for job in self.jobs:
+                run = job["run"]
+                if job["status"] != "running" or run.status in ("queued", "running", "cancelling"):
+                    continue
+                job["time"] += run.elapsed()
+                free.append(job["endpoint"])
+                if run.status == "finished":
+                    job["status"] = "finished"
+                elif job["attempts"] <= self.retries:
+                    job["status"] = "pending"
+                    pending.append(job)
+                    print(f"{job['version']} failed with exit code {run.returncode}, retrying")
+                else:
+                    job["status"] = "failed"
+                print(f"{job['version']}: {job['status']} after {job['attempts']} attempt(s)")
+            while pending and free:
+                job = pending.pop(0)
+                endpoint = free.pop(0)
+                job["run"] = self.manager.submit(
+                    self.command(job, self.endpoints[endpoint]), name=f"{job['version']}_try{job['attempts']}"
+                )
+                job["attempts"] += 1
+                job["endpoint"] = endpoint
+                job["status"] = "running"
+                print(f"{job['version']}: started on {self.endpoints[endpoint]['host']}:{self.endpoints[endpoint]['port']}")
+            time.sleep(poll_interval)
+        return self.write_summary()
+
+    def write_summary(self):
+        """
+        Write summary.csv with the final/best rewards and wall time per configuration.
+
+        Returns:
+            list: The summary rows.
+        """
+        rows = []
+        for job in self.jobs:
+            results = summarize_run(os.path.join(self.root, "metrics", "v" + job["version"]))
+            rows.append(
+                dict(
+                    version=job["version"],
+                    status=job["status"],
+                    attempts=job["attempts"],
+                    wall_time=round(job["time"], 1),
+                    **results,
+                    **{name: json.dumps(value) if isinstance(value, list) else value for name, value in job["config"].items()},
+                )
+            )
+        fields = list(dict.fromkeys(field for row in rows for field in row))
+        with open(os.path.join(self.directory, "summary.csv"), "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a hyperparameter sweep of carla_lane_keeping_d3qn.py")
+    parser.add_argument("spec", type=str, help="JSON sweep spec")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the command lines of the runs")
+    parser.add_argument("--echo", action="store_true", help="Print the output of the runs")
+    args = parser.parse_args()
+
+    with open(args.spec, "r") as file:
+        spec = json.load(file)
+    sweep = Sweep(spec)
+    if args.dry_run:
+        for job in sweep.jobs:
+            print(" ".join(sweep.command(job, sweep.endpoints[job["index"] % len(sweep.endpoints)])))
+    else:
+        start = time.time()
+        rows = sweep.run(echo=args.echo)
+        print(f"Sweep {sweep.name} finished in {time.time() - start:.0f} s, summary in {sweep.directory}/summary.csv")
+        for row in sorted(rows, key=lambda row: -row["final_reward"] if row["final_reward"] == row["final_reward"] else math.inf):
+            print(
+                f"{row['version']}: {row['status']}, final reward {row['final_reward']:.3f}, "
+                f"best {row['best_reward']:.3f}, {row['episodes']} episodes, {row['wall_time']:.0f} s"
+            )
@@ -0,0 +1,224 @@
+import json
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Prefix of the exported Prometheus metric names
+METRIC_PREFIX = "carla_d3qn_"
+
+
+class TrainingTelemetry:
+    """
+    Live training metrics served over HTTP as Prometheus text (/metrics) and JSON (/json).
+
+    The training loop only increments a step counter per step and hands over
+    the episode figures once per episode (a dict replaced under a lock); the
+    steps per second are measured by a sampler thread, and requests are
+    answered by the HTTP server's threads from the latest snapshot, so
+    scraping never waits on or slows down the training loop. The server binds
+    to localhost unless another host is given explicitly.
+
+    Args:
+        port (int): Port of the HTTP server, 0 for a free port.
+        host (str): Address the server binds to.
+        interval (float): Seconds between two step counter samples.
+        window (int): Number of samples the steps per second are averaged over.
+
+    Attributes:
+        steps (int): Environment steps taken in this process, incremented by step().
+        address (tuple): (host, port) the server listens on.
+    """
+
+    def __init__(self, port=9100, host="127.0.0.1", interval=1.0, window=10):
+        if host not in ("127.0.0.1", "localhost", "::1"):
+            print(f"Telemetry is served on {host}, reachable from other machines")
+        self.steps = 0
+        self.interval = interval
+        self._values = {"started": time.time()}
+        self._rate = 0.0
+        self._samples = deque(maxlen=window + 1)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self.address = self._server.server_address[:2]
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, daemon=True),
+            threading.Thread(target=self._sample, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"Telemetry on http://{self.address[0]}:{self.address[1]}/metrics and /json")
+
+    def step(self):
+        """
+        Count an environment step, called by the training loop.
+        """
+        self.steps += 1
+
+    def update(self, **values):
+        """
+        Publish new values, e.g. at the start or the end of an episode.
+
+        Args:
+            **values: Values by name, see snapshot() for the exported ones.
+        """
+        with self._lock:
+            merged = dict(self._values)
+            merged.update(values)
+            self._values = merged
+
+    def snapshot(self):
+        """
+        Get the current metrics.
+
+        Returns:
+            dict: The published values (e.g. "episode", "epsilon", "reward_avg", "loss", "replay", "phases",
+                "memory") with the "steps" counter, the measured "steps_per_second" and the "uptime".
+        """
+        with self._lock:
+            values = dict(self._values)
+        values["steps"] = self.steps
+        values["steps_per_second"] = self._rate
+        values["uptime"] = time.time() - values.pop("started")
+        return values
+
+    def close(self):
+        """
+        Stop the HTTP server and the sampler thread.
+        """
+        self._stop.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._samples.append((time.perf_counter(), self.steps))
+            if len(self._samples) > 1:
+                (start, first), (end, last) = self._samples[0], self._samples[-1]
+                self._rate = (last - first) / (end - start)
+
+
+def format_prometheus(values):
+    """
+    Format a telemetry snapshot in the Prometheus text exposition format.
+
+    Args:
+        values (dict): Snapshot from TrainingTelemetry.snapshot.
+
+    Returns:
+        str: The metrics, one sample per line.
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+            label_text = "{" + label_text + "}" if labels else ""
+            lines.append(f"{METRIC_PREFIX}{name}{label_text} {_prometheus_value(value)}")
+
+    metric("steps_total", "counter", "Environment steps taken", [({}, values["steps"])])
+    metric("steps_per_second", "gauge", "Environment steps per second", [({}, values["steps_per_second"])])
+    metric("uptime_seconds", "gauge", "Seconds since the telemetry started", [({}, values["uptime"])])
+    for name, help_text in (
+        ("episode", "Current episode"),
+        ("epsilon", "Exploration rate"),
+        ("episode_reward", "Average reward per step of the last episode"),
+        ("loss", "Mean learner loss per step of the last episode"),
+    ):
+        if values.get(name) is not None:
+            metric(name, "gauge", help_text, [({}, values[name])])
+    if values.get("reward_avg"):
+        metric(
+            "reward_avg",
+            "gauge",
+            "Moving average of the reward per step over the last episodes",
+            [({"window": window}, value) for window, value in values["reward_avg"].items()],
+        )
+    if values.get("replay"):
+        metric("replay_transitions", "gauge", "Transitions in the replay buffer", [({}, values["replay"]["size"])])
+        metric("replay_capacity", "gauge", "Capacity of the replay buffer", [({}, values["replay"]["capacity"])])
+    if values.get("phases"):
+        metric(
+            "phase_seconds",
+            "gauge",
+            "Phase durations of the last episode",
+            [
+                ({"phase": phase, "quantile": quantile}, stats[key])
+                for phase, stats in values["phases"].items()
+                for quantile, key in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99"))
+            ],
+        )
+        metric(
+            "phase_seconds_sum",
+            "gauge",
+            "Total phase time of the last episode",
+            [({"phase": phase}, stats["total"]) for phase, stats in values["phases"].items()],
+        )
+        metric(
+            "phase_calls",
+            "gauge",
+            "Phase calls of the last episode",
+            [({"phase": phase}, stats["count"]) for phase, stats in values["phases"].items()],
+        )
+    if values.get("memory"):
+        metric(
+            "memory_bytes",
+            "gauge",
+            "Memory of the run by kind",
+            [
+                ({"kind": kind}, value)
+                for kind, value in values["memory"].items()
+                if kind not in ("transitions", "capacity")
+            ],
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _prometheus_value(value):
+    # the exposition format spells the non-finite values +Inf, -Inf and NaN
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def _finite(value):
+    # NaN and infinity are not valid JSON, they are served as null
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _handler(telemetry):
+    class TelemetryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                body = format_prometheus(telemetry.snapshot()).encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path in ("/json", "/metrics.json"):
+                body = json.dumps(_finite(telemetry.snapshot())).encode()
+                content_type = "application/json"
+            else:
+                self.send_error(404, "Use /metrics or /json")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # no request logging on the training output
+
+    return TelemetryHandler
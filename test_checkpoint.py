@@ -0,0 +1,115 @@
+import random
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from checkpoint import load_checkpoint, save_checkpoint, save_replay
+from learner import ReplayBuffer
+
+
+def make_networks():
+    network = nn.Sequential(nn.Flatten(), nn.Linear(4 * 4 * 3, 5))
+    target_network = nn.Sequential(nn.Flatten(), nn.Linear(4 * 4 * 3, 5))
+    optimizer = torch.optim.Adam(network.parameters(), lr=1e-3)
+    return network, target_network, optimizer
+
+
+def fill(replay_buffer, count, start=0):
+    for i in range(start, start + count):
+        frame = torch.full((1, 4, 4, 3), i % 256, dtype=torch.uint8)
+        replay_buffer.store((frame, i % 5, float(i), frame + 1, i % 7 == 0))
+
+
+def test_checkpoint_round_trip(tmp_path):
+    torch.manual_seed(0)
+    network, target_network, optimizer = make_networks()
+    network(torch.rand(2, 4, 4, 3)).sum().backward()
+    optimizer.step()  # so the optimizer has state to restore
+    replay_buffer = ReplayBuffer(20)
+    fill(replay_buffer, 30)
+    random.seed(1)
+    np.random.seed(2)
+    torch.manual_seed(3)
+    save_checkpoint(str(tmp_path), {"episode": 4}, network, target_network, optimizer, replay_buffer, fresh=True)
+    expected = (random.random(), np.random.rand(), torch.rand(1))
+
+    restored, restored_target, restored_optimizer = make_networks()
+    restored_buffer = ReplayBuffer(20)
+    training_state = load_checkpoint(
+        str(tmp_path), restored, restored_target, restored_optimizer, restored_buffer, torch.device("cpu")
+    )
+
+    assert training_state == {"episode": 4}
+    assert (random.random(), np.random.rand()) == expected[:2]
+    assert torch.equal(torch.rand(1), expected[2])
+    for saved, loaded in zip(network.state_dict().values(), restored.state_dict().values()):
+        assert torch.equal(saved, loaded)
+    assert restored_optimizer.state_dict()["state"].keys() == optimizer.state_dict()["state"].keys()
+    assert restored_buffer.total == 30
+    assert restored_buffer.size() == 20
+    for index in range(20):
+        for saved, loaded in zip(replay_buffer.get(index), restored_buffer.get(index)):
+            assert np.array_equal(saved, loaded)
+
+
+def test_resume_continues_the_replay_ring(tmp_path):
+    network, target_network, optimizer = make_networks()
+    replay_buffer = ReplayBuffer(20)
+    fill(replay_buffer, 15)
+    assert save_checkpoint(str(tmp_path), {}, network, target_network, optimizer, replay_buffer, fresh=True) == 15
+    fill(replay_buffer, 10, start=15)
+    assert save_checkpoint(str(tmp_path), {}, network, target_network, optimizer, replay_buffer) == 10
+
+    restored_buffer = ReplayBuffer(20)
+    load_checkpoint(str(tmp_path), *make_networks(), restored_buffer, torch.device("cpu"))
+    assert restored_buffer.total == 25
+    assert [restored_buffer.get(index)[2] for index in range(20)] == [float(i) for i in range(5, 25)]
+
+
+def test_crash_during_replay_save_keeps_transitions_consistent(tmp_path):
+    network, target_network, optimizer = make_networks()
+    replay_buffer = ReplayBuffer(20)
+    fill(replay_buffer, 25)
+    save_checkpoint(str(tmp_path), {"episode": 1}, network, target_network, optimizer, replay_buffer, fresh=True)
+    fill(replay_buffer, 8, start=25)
+
+    get = replay_buffer.get
+
+    def crash_after_three(index, calls=[]):
+        calls.append(index)
+        if len(calls) > 3:
+            raise KeyboardInterrupt
+        return get(index)
+
+    replay_buffer.get = crash_after_three
+    try:
+        save_checkpoint(str(tmp_path), {"episode": 2}, network, target_network, optimizer, replay_buffer)
+    except KeyboardInterrupt:
+        pass
+
+    restored_buffer = ReplayBuffer(20)
+    training_state = load_checkpoint(str(tmp_path), *make_networks(), restored_buffer, torch.device("cpu"))
+    assert training_state == {"episode": 1}
+    assert restored_buffer.total == 25
+    assert restored_buffer.size() > 0
+    for index in range(restored_buffer.size()):
+        state, action, reward, next_state, done = restored_buffer.get(index)
+        # every restored frame belongs to its reward, none was overwritten by the interrupted save
+        assert state[0, 0, 0] == int(reward) % 256
+        assert action == int(reward) % 5
+    assert restored_buffer.get(restored_buffer.size() - 1)[2] == 24.0
+
+
+def test_replay_saved_after_the_training_state_is_not_restored(tmp_path):
+    network, target_network, optimizer = make_networks()
+    replay_buffer = ReplayBuffer(20)
+    fill(replay_buffer, 10)
+    save_checkpoint(str(tmp_path), {"episode": 1}, network, target_network, optimizer, replay_buffer, fresh=True)
+    fill(replay_buffer, 5, start=10)
+    save_replay(replay_buffer, str(tmp_path))  # a crash before training_state.pt was written
+
+    restored_buffer = ReplayBuffer(20)
+    load_checkpoint(str(tmp_path), *make_networks(), restored_buffer, torch.device("cpu"))
+    assert restored_buffer.total == 10
+    assert [restored_buffer.get(index)[2] for index in range(10)] == [float(i) for i in range(10)]
@@ -0,0 +1,261 @@
+import random
+import time
+
+import numpy as np
+
+
+class TrafficLOD:
+    """
+    Level-of-detail manager for the autopilot traffic around the ego vehicle.
+
+    Keeps a target number of NPC vehicles within a radius of the ego, recycles
+    vehicles that fall out of range by moving them to free spawn points ahead of
+    the ego, lets the Traffic Manager run distant vehicles with hybrid physics,
+    and, if a tick budget is given, lowers the NPC density when the measured
+    tick time exceeds it. Adaptation is off by default so the traffic a run
+    trains against does not depend on the speed of the machine.
+
+    Args:
+        world (carla.World): The simulation world.
+        traffic_manager (carla.TrafficManager): Traffic manager driving the NPCs.
+        vehicle_bps (list): Vehicle blueprints to choose NPCs from.
+        target_npcs (int): Number of NPCs to keep around the ego.
+        radius (float): Radius in meters around the ego in which NPCs are kept.
+        min_spawn_distance (float): Minimum distance from the ego for (re)spawning.
+        hybrid_physics_radius (float): Radius in meters around the ego in which
+            the Traffic Manager keeps full physics enabled.
+        tick_budget (float): Tick time budget in seconds, 0 (the default) disables adaptation.
+        min_npcs (int): Lower bound for the adaptive NPC target.
+        update_interval (int): Number of ticks between two LOD updates.
+
+    Attributes:
+        target (int): Current (adaptive) NPC target.
+        npcs (list): NPC actors currently managed.
+        tick_ema (float): Exponential moving average of the tick time in seconds.
+        tick_times (list): Tick times measured during the current episode.
+        npc_counts (list): NPC counts measured during the current episode.
+    """
+
+    def __init__(
+        self,
+        world,
+        traffic_manager,
+        vehicle_bps,
+        target_npcs=20,
+        radius=100.0,
+        min_spawn_distance=10.0,
+        hybrid_physics_radius=50.0,
+        tick_budget=0.0,
+        min_npcs=4,
+        update_interval=10,
+    ):
+        self.world = world
+        self.traffic_manager = traffic_manager
+        self.vehicle_bps = vehicle_bps
+        self.max_npcs = target_npcs
+        self.target = target_npcs
+        self.radius = radius
+        self.min_spawn_distance = min_spawn_distance
+        self.tick_budget = tick_budget
+        self.min_npcs = min(min_npcs, target_npcs)
+        self.update_interval = max(1, update_interval)
+
+        self.npcs = []
+        self.spawn_points = []
+        self.tick_ema = 0.0
+        self.tick_times = []
+        self.npc_counts = []
+        self.recycled = 0
+        self._ticks = 0
+
+        # Vehicles outside this radius around the hero are simulated without physics
+        self.traffic_manager.set_hybrid_physics_mode(True)
+        self.traffic_manager.set_hybrid_physics_radius(hybrid_physics_radius)
+
+    def populate(self, ego, spawn_points, preferred=None):
+        """
+        Spawn NPCs around the ego at the start of an episode.
+
+        Args:
+            ego (carla.Vehicle): The ego vehicle.
+            spawn_points (list): All spawn points of the map.
+            preferred (list, optional): Spawn point indices to try first.
+
+        Returns:
+            int: Number of NPCs spawned.
+        """
+        self._start_episode([], spawn_points)
+
+        candidates = []
+        if preferred:
+            candidates = [spawn_points[i] for i in preferred]
+            random.shuffle(candidates)
+        candidates += self._free_spawn_points(ego.get_location(), ego)
+        for transform in candidates:
+            if len(self.npcs) >= self.target:
+                break
+            self._spawn(transform)
+        return len(self.npcs)
+
+    def adopt(self, npcs, spawn_points):
+        """
+        Take over NPCs that were spawned elsewhere (e.g. from a scenario layout) for an episode.
+
+        Args:
+            npcs (list): The already spawned NPC actors.
+            spawn_points (list): All spawn points of the map.
+        """
+        self._start_episode(list(npcs), spawn_points)
+
+    def _start_episode(self, npcs, spawn_points):
+        """
+        Reset the managed NPCs and the per-episode statistics.
+
+        Args:
+            npcs (list): NPC actors managed from now on.
+            spawn_points (list): All spawn points of the map.
+        """
+        self.npcs = npcs
+        self.tick_times = []
+        self.npc_counts = []
+        self.recycled = 0
+        self._ticks = 0
+        self.spawn_points = spawn_points
+
+    def tick(self, ego):
+        """
+        Tick the world, measure the tick time and periodically update the traffic.
+
+        Args:
+            ego (carla.Vehicle): The ego vehicle.
+
+        Returns:
+            float: The duration of the world tick in seconds.
+        """
+        tick_start = time.perf_counter()
+        self.world.tick()
+        tick_time = time.perf_counter() - tick_start
+
+        self.tick_ema = tick_time if self._ticks == 0 else 0.9 * self.tick_ema + 0.1 * tick_time
+        self.tick_times.append(tick_time)
+        self.npc_counts.append(len(self.npcs))
+        self._ticks += 1
+
+        if self._ticks % self.update_interval == 0:
+            self._adapt_density()
+            self.update(ego)
+        return tick_time
+
+    def update(self, ego):
+        """
+        Recycle NPCs that are out of range and top the traffic up to the target.
+
+        Args:
+            ego (carla.Vehicle): The ego vehicle.
+        """
+        ego_location = ego.get_location()
+        alive = []
+        out_of_range = []
+        for npc in self.npcs:
+            if not npc.is_alive:
+                continue
+            if npc.get_location().distance(ego_location) > self.radius:
+                out_of_range.append(npc)
+            else:
+                alive.append(npc)
+
+        # Shed surplus vehicles first, starting with the ones that are out of range
+        surplus = len(alive) + len(out_of_range) - self.target
+        while surplus > 0 and out_of_range:
+            out_of_range.pop().destroy()
+            surplus -= 1
+        while surplus > 0 and alive:
+            alive.pop().destroy()
+            surplus -= 1
+        self.npcs = alive
+
+        free_points = self._free_spawn_points(ego_location, ego)
+        for npc in out_of_range:
+            if not free_points:
+                npc.destroy()
+                continue
+            npc.set_transform(free_points.pop(0))
+            self.npcs.append(npc)
+            self.recycled += 1
+
+        while len(self.npcs) < self.target and free_points:
+            self._spawn(free_points.pop(0))
+
+    def episode_summary(self):
+        """
+        Summarize NPC counts and tick times of the current episode.
+
+        Returns:
+            dict: Mean/max NPC count, mean/p95 tick time, recycled NPCs and the target.
+        """
+        if not self.tick_times:
+            return {"npc_mean": 0, "npc_max": 0, "tick_mean": 0.0, "tick_p95": 0.0,
+                    "recycled": 0, "target": self.target}
+        return {
+            "npc_mean": float(np.mean(self.npc_counts)),
+            "npc_max": int(np.max(self.npc_counts)),
+            "tick_mean": float(np.mean(self.tick_times)),
+            "tick_p95": float(np.percentile(self.tick_times, 95)),
+            "recycled": self.recycled,
+            "target": self.target,
+        }
+
+    def _adapt_density(self):
+        """
+        Lower the NPC target when the tick time is over budget, raise it when well under.
+        """
+        if self.tick_budget <= 0:
+            return
+        if self.tick_ema > self.tick_budget and self.target > self.min_npcs:
+            self.target -= 1
+        elif self.tick_ema < 0.7 * self.tick_budget and self.target < self.max_npcs:
+            self.target += 1
+
+    def _free_spawn_points(self, ego_location, ego):
+        """
+        Get spawn points within range of the ego that are not occupied, ahead of the ego first.
+
+        Args:
+            ego_location (carla.Location): Location of the ego vehicle.
+            ego (carla.Vehicle): The ego vehicle.
+
+        Returns:
+            list: Free spawn point transforms.
+        """
+        forward = ego.get_transform().get_forward_vector()
+        occupied = [npc.get_location() for npc in self.npcs if npc.is_alive]
+        occupied.append(ego_location)
+        ahead = []
+        behind = []
+        for transform in self.spawn_points:
+            location = transform.location
+            distance = location.distance(ego_location)
+            if distance < self.min_spawn_distance or distance > self.radius:
+                continue
+            if any(location.distance(other) < 8.0 for other in occupied):
+                continue
+            offset = location - ego_location
+            if offset.x * forward.x + offset.y * forward.y > 0:
+                ahead.append(transform)
+            else:
+                behind.append(transform)
+        random.shuffle(ahead)
+        random.shuffle(behind)
+        return ahead + behind
+
+    def _spawn(self, transform):
+        """
+        Try to spawn an autopilot NPC at the given transform.
+
+        Args:
+            transform (carla.Transform): Where to spawn the NPC.
+        """
+        npc = self.world.try_spawn_actor(random.choice(self.vehicle_bps), transform)
+        if npc is not None:
+            npc.set_autopilot(True, self.traffic_manager.get_port())
+            self.npcs.append(npc)
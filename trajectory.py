@@ -0,0 +1,274 @@
+import glob
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+# Numeric state recorded per tick, stored as one float32 row
+STEP_FIELDS = [
+    "episode", "step",
+    "x", "y", "z", "yaw",  # ego pose after the tick
+    "prev_x", "prev_y",  # ego position before the tick
+    "vx", "vy", "vz",
+    "throttle", "steer", "action",
+    "lane_x", "lane_y", "lane_z", "lane_yaw", "lane_width",  # closest driving lane center
+    "left_solid", "right_solid",
+    "collision", "overtake", "reward", "done",
+]
+# State of every NPC per tick, stored as one float32 row per NPC
+NPC_FIELDS = ["step", "id", "x", "y", "z", "yaw", "vx", "vy"]
+
+
+class TrajectoryRecorder:
+    """
+    Opt-in recorder of compact binary episode trajectories.
+
+    Every tick appends the ego pose, velocity and control, the closest lane
+    geometry, reward inputs and the NPC states to in-memory chunks; full chunks
+    (and optionally downsampled camera frames) are compressed and written by a
+    background thread as trajectories/<run>/ep<episode>/chunk<n>.npz. The state
+    at the start of each episode is stored as a snapshot so the episode can be
+    replayed from the same scenario.
+
+    Args:
+        directory (str): Directory of the run's trajectories.
+        every (int): Record every Nth episode.
+        frame_every (int): Store a camera frame every Nth tick, 0 to store no frames.
+        frame_scale (float): Downsampling factor of the stored frames.
+        chunk_size (int): Number of ticks per chunk file.
+
+    Attributes:
+        record_time (float): Seconds spent on the training thread recording the current episode.
+    """
+
+    def __init__(self, directory, every=1, frame_every=0, frame_scale=0.25, chunk_size=500):
+        self.directory = directory
+        self.every = max(1, every)
+        self.frame_every = frame_every
+        self.frame_scale = frame_scale
+        self.chunk_size = chunk_size
+        self.active = False
+        self.record_time = 0.0
+        self._queue = queue.Queue(maxsize=8)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def start_episode(self, env, episode):
+        """
+        Start recording an episode if it is one of the recorded ones.
+
+        Args:
+            env (Environment): The environment, right after its reset.
+            episode (int): The episode.
+        """
+        self.active = episode % self.every == 0
+        if not self.active:
+            return
+        # simulator imports are deferred so recorded trajectories can be loaded without CARLA installed
+        import carla
+        from snapshots import capture_snapshot
+
+        self._solid = carla.LaneMarkingType.Solid
+        self.episode = episode
+        self.episode_directory = os.path.join(self.directory, f"ep{episode:05d}")
+        self.record_time = 0.0
+        self._chunk = 0
+        self._new_chunk()
+        self._prev_xy = (float(env.prev_xy[0]), float(env.prev_xy[1]))
+        self._queue.put(("start", self.episode_directory, capture_snapshot(env, episode)))
+
+    def record(self, env, reward, done, info):
+        """
+        Record the tick that env.step just performed.
+
+        Args:
+            env (Environment): The environment.
+            reward (float): The reward of the step.
+            done (bool): Whether the episode ended.
+            info (dict): The info returned by env.step.
+        """
+        if not self.active:
+            return
+        record_start = time.perf_counter()
+        # one snapshot per tick instead of a transform and a velocity query per actor
+        snapshot = env.world.get_snapshot()
+        ego = snapshot.find(env.vehicle.id)
+        transform = ego.get_transform()
+        velocity = ego.get_velocity()
+        waypoint = env.last_waypoint
+        lane_location = waypoint.transform.location
+        solid = self._solid
+        self._steps.append(
+            (
+                self.episode, env.steps,
+                transform.location.x, transform.location.y, transform.location.z, transform.rotation.yaw,
+                self._prev_xy[0], self._prev_xy[1],
+                velocity.x, velocity.y, velocity.z,
+                env.throttle, env.steer, env.action_idx,
+                lane_location.x, lane_location.y, lane_location.z,
+                waypoint.transform.rotation.yaw, waypoint.lane_width,
+                waypoint.left_lane_marking.type == solid, waypoint.right_lane_marking.type == solid,
+                info["collision"], info["overtake"], reward, done,
+            )
+        )
+        self._prev_xy = (transform.location.x, transform.location.y)
+        for npc in env.traffic.npcs:
+            npc_snapshot = snapshot.find(npc.id)
+            if npc_snapshot is None:
+                continue  # destroyed since the tick
+            npc_transform = npc_snapshot.get_transform()
+            npc_velocity = npc_snapshot.get_velocity()
+            self._npcs.append(
+                (
+                    env.steps, npc.id,
+                    npc_transform.location.x, npc_transform.location.y, npc_transform.location.z,
+                    npc_transform.rotation.yaw, npc_velocity.x, npc_velocity.y,
+                )
+            )
+        if self.frame_every and env.steps % self.frame_every == 0 and env.image is not None:
+            import cv2
+
+            self._frames.append(
+                cv2.resize(env.image, None, fx=self.frame_scale, fy=self.frame_scale, interpolation=cv2.INTER_AREA)
+            )
+            self._frame_steps.append(env.steps)
+        if len(self._steps) >= self.chunk_size:
+            self._submit()
+        self.record_time += time.perf_counter() - record_start
+
+    def end_episode(self, episode_time):
+        """
+        Write the remaining ticks of the episode.
+
+        Args:
+            episode_time (float): Wall time of the episode in seconds, used for the overhead report.
+
+        Returns:
+            str or None: Recording overhead report, None if the episode was not recorded.
+        """
+        if not self.active:
+            return None
+        self._submit()
+        self.active = False
+        return (
+            f"Trajectory {self.episode_directory}: {self.record_time * 1000:.0f} ms recording "
+            f"({self.record_time / max(episode_time, 1e-9) * 100:.2f}% of episode time)"
+        )
+
+    def close(self):
+        """
+        Wait for all chunks to be written and stop the writer thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _new_chunk(self):
+        self._steps = []
+        self._npcs = []
+        self._frames = []
+        self._frame_steps = []
+
+    def _submit(self):
+        if not self._steps:
+            return
+        chunk = {
+            "steps": np.array(self._steps, dtype=np.float32),
+            "npcs": np.array(self._npcs, dtype=np.float32).reshape(-1, len(NPC_FIELDS)),
+        }
+        if self._frames:
+            chunk["frames"] = np.stack(self._frames)
+            chunk["frame_steps"] = np.array(self._frame_steps, dtype=np.int32)
+        path = os.path.join(self.episode_directory, f"chunk{self._chunk:04d}.npz")
+        self._queue.put(("chunk", path, chunk))
+        self._chunk += 1
+        self._new_chunk()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            kind, path, payload = item
+            if kind == "start":
+                os.makedirs(path, exist_ok=True)
+                with open(os.path.join(path, "start.json"), "w") as file:
+                    json.dump({"step_fields": STEP_FIELDS, "npc_fields": NPC_FIELDS, "snapshot": payload}, file)
+            else:
+                np.savez_compressed(path, **payload)
+
+
+def load_trajectory(episode_directory):
+    """
+    Load a recorded episode.
+
+    Args:
+        episode_directory (str): Directory of the episode, e.g. trajectories/vOTv1/ep00012.
+
+    Returns:
+        dict: "steps" and "npcs" as dicts of field name to np.ndarray, "frames" and
+            "frame_steps" (empty when no frames were stored) and the start "snapshot".
+    """
+    with open(os.path.join(episode_directory, "start.json"), "r") as file:
+        start = json.load(file)
+    steps, npcs, frames, frame_steps = [], [], [], []
+    for path in sorted(glob.glob(os.path.join(episode_directory, "chunk*.npz"))):
+        chunk = np.load(path)
+        steps.append(chunk["steps"])
+        npcs.append(chunk["npcs"])
+        if "frames" in chunk:
+            frames.append(chunk["frames"])
+            frame_steps.append(chunk["frame_steps"])
+    steps = np.concatenate(steps) if steps else np.zeros((0, len(start["step_fields"])), dtype=np.float32)
+    npcs = np.concatenate(npcs) if npcs else np.zeros((0, len(start["npc_fields"])), dtype=np.float32)
+    return {
+        "steps": {field: steps[:, i] for i, field in enumerate(start["step_fields"])},
+        "npcs": {field: npcs[:, i] for i, field in enumerate(start["npc_fields"])},
+        "frames": np.concatenate(frames) if frames else np.zeros((0,), dtype=np.uint8),
+        "frame_steps": np.concatenate(frame_steps) if frame_steps else np.zeros(0, dtype=np.int32),
+        "snapshot": start["snapshot"],
+    }
+
+
+def replay_trajectory(env, episode_directory):
+    """
+    Re-drive an environment with the recorded controls and compare the outcome.
+
+    The environment is reset into the recorded start snapshot and stepped with
+    the recorded throttle/steer; the ego positions and rewards are compared
+    against the recording. Exact agreement needs a synchronous world with a
+    seeded Traffic Manager; any env with reset(snapshot=...) and step works.
+
+    Args:
+        env (Environment): The environment to replay in.
+        episode_directory (str): Directory of the recorded episode.
+
+    Returns:
+        dict: Number of replayed steps, max/mean ego position error in meters,
+            max reward difference and the step the replay first ended early (or None).
+    """
+    trajectory = load_trajectory(episode_directory)
+    steps = trajectory["steps"]
+    env.reset(snapshot=trajectory["snapshot"])
+    position_errors = []
+    reward_errors = []
+    ended_early = None
+    for i in range(len(steps["step"])):
+        _, reward, done, _ = env.step((float(steps["throttle"][i]), float(steps["steer"][i])))
+        location = env.vehicle.get_location()
+        position_errors.append(math.hypot(location.x - steps["x"][i], location.y - steps["y"][i]))
+        reward_errors.append(abs(reward - steps["reward"][i]))
+        if done and i < len(steps["step"]) - 1:
+            ended_early = i
+            break
+    return {
+        "steps": len(position_errors),
+        "max_position_error": float(np.max(position_errors)) if position_errors else 0.0,
+        "mean_position_error": float(np.mean(position_errors)) if position_errors else 0.0,
+        "max_reward_error": float(np.max(reward_errors)) if reward_errors else 0.0,
+        "ended_early": ended_early,
+    }
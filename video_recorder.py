@@ -0,0 +1,219 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from hud_display import HUDRenderer
+
+
+# Episode events that can flag an episode for recording, mapped to their env.step info key
+VIDEO_EVENTS = {"collision": "collision", "overtake": "overtake"}
+
+
+class EpisodeVideoRecorder:
+    """
+    Opt-in recorder of episode videos, encoded by a background thread.
+
+    Every Nth episode is recorded. When events are given, every episode is
+    encoded and only kept if one of the events (e.g. a collision) happened in
+    it, so flagged episodes are complete from their first frame. The training
+    thread only hands frame references to the encoder; at most queue_size
+    frames wait for encoding and further frames are dropped instead of slowing
+    the environment. Videos are written as videos/<run>/ep<episode>[_<event>].mp4
+    with cv2.VideoWriter, optionally with the HUD drawn onto the frames.
+
+    Args:
+        directory (str): Directory of the run's videos.
+        every (int): Record every Nth episode, 0 to only keep flagged episodes.
+        events (list): Events that flag an episode ("collision", "overtake").
+        fps (float): Frame rate of the videos, the simulation rate by default.
+        codec (str): FourCC of the codec.
+        queue_size (int): Maximum number of frames waiting for the encoder.
+        hud (bool): Draw the HUD onto the frames.
+        scale (float): Scale factor of the frames.
+
+    Attributes:
+        dropped (int): Frames dropped since the last episode report.
+        record_time (float): Seconds spent on the training thread recording the current episode.
+    """
+
+    def __init__(self, directory, every=1, events=(), fps=None, codec="mp4v", queue_size=64, hud=False, scale=1.0):
+        unknown = set(events) - set(VIDEO_EVENTS)
+        if unknown:
+            raise ValueError(f"Unknown video events {sorted(unknown)}, choose from {sorted(VIDEO_EVENTS)}")
+        self.directory = directory
+        self.every = every
+        self.events = list(events)
+        self.fps = fps
+        self.codec = codec
+        self.hud = hud
+        self.scale = scale
+        self.active = False
+        self.queued = 0
+        self.dropped = 0
+        self.record_time = 0.0
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._lags = []
+        self._written = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def start_episode(self, env, episode, title=""):
+        """
+        Start encoding an episode if it may be kept.
+
+        Args:
+            env (Environment): The environment, right after its reset.
+            episode (int): The episode.
+            title (str): Static first line of the HUD.
+        """
+        self.periodic = self.every > 0 and episode % self.every == 0
+        self.active = self.periodic or bool(self.events)
+        if not self.active:
+            return
+        self.episode = episode
+        self.flags = []
+        self.record_time = 0.0
+        fps = self.fps
+        if fps is None:
+            delta = env.world.get_settings().fixed_delta_seconds
+            fps = 1.0 / delta if delta else 20.0
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"ep{episode:05d}.partial.mp4")
+        self._queue.put(("start", path, (fps, title)))
+
+    def record(self, env, reward, info):
+        """
+        Hand the frame of the step that env.step just performed to the encoder.
+
+        Args:
+            env (Environment): The environment.
+            reward (float): The reward of the step.
+            info (dict): The info returned by env.step.
+        """
+        if not self.active:
+            return
+        record_start = time.perf_counter()
+        for event in self.events:
+            if info.get(VIDEO_EVENTS[event]) and event not in self.flags:
+                self.flags.append(event)
+        if env.image is not None:
+            if self._slots.acquire(blocking=False):
+                values = None
+                if self.hud:
+                    values = {
+                        "episode": self.episode,
+                        "step": env.steps,
+                        "reward": reward,
+                        "speed": info["speed"],
+                        "lane_deviation": info["lane_deviation"],
+                        "angle": info["angle"],
+                        "throttle": env.throttle,
+                        "steer": env.steer,
+                    }
+                # env.image is replaced, not modified, by every camera frame, so a reference is enough
+                self._queue.put(("frame", env.image, (values, time.perf_counter())))
+                self.queued += 1
+            else:
+                self.dropped += 1
+        self.record_time += time.perf_counter() - record_start
+
+    def end_episode(self, episode_time):
+        """
+        Finish the episode's video, keeping it if it was recorded periodically or flagged.
+
+        Args:
+            episode_time (float): Wall time of the episode in seconds, used for the overhead report.
+
+        Returns:
+            str or None: Report of the frames queued and dropped and the encoder lag,
+                None if the episode was not recorded.
+        """
+        if not self.active:
+            return None
+        self.active = False
+        keep = self.periodic or bool(self.flags)
+        suffix = "".join("_" + flag for flag in self.flags)
+        path = os.path.join(self.directory, f"ep{self.episode:05d}{suffix}.mp4") if keep else None
+        self._queue.put(("end", path, None))
+        with self._lock:
+            lags, self._lags = self._lags, []
+            written, self._written = self._written, []
+        total = max(self.queued + self.dropped, 1)
+        text = (
+            f"Video ep{self.episode:05d}: {'kept as ' + os.path.basename(path) if keep else 'discarded'}, "
+            f"{self.queued} frames queued, {self.dropped} dropped ({self.dropped / total * 100:.1f}%), "
+            f"{self.record_time / max(episode_time, 1e-9) * 100:.2f}% of episode time"
+        )
+        if lags:
+            text += f", encoder lag mean {np.mean(lags) * 1000:.0f} ms max {np.max(lags) * 1000:.0f} ms"
+        text += f", backlog {self._queue.qsize()} items"
+        if written:
+            text += "; written: " + ", ".join(written)
+        self.queued = self.dropped = 0
+        return text
+
+    def close(self):
+        """
+        Wait for all videos to be written and stop the encoder thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        for written in self._written:
+            print(f"Video written: {written}")
+
+    def _run(self):
+        writer = None
+        path = None
+        renderer = None
+        fps, title = 20.0, ""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            kind, value, payload = item
+            if kind == "start":
+                path = value
+                fps, title = payload
+                writer = None
+                renderer = None
+            elif kind == "frame":
+                frame = value
+                values, queued_time = payload
+                try:
+                    if self.hud and values is not None:
+                        if renderer is None:
+                            renderer = HUDRenderer(frame.shape[1], frame.shape[0], title)
+                        renderer.update(values)
+                        frame = renderer.compose(frame)
+                    if self.scale != 1.0:
+                        frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+                    frame = np.ascontiguousarray(frame)
+                    if writer is None:
+                        writer = cv2.VideoWriter(
+                            path, cv2.VideoWriter_fourcc(*self.codec), fps, (frame.shape[1], frame.shape[0])
+                        )
+                        if not writer.isOpened():
+                            print(f"Could not open a {self.codec} video writer for {path}")
+                    if writer.isOpened():
+                        writer.write(frame)
+                finally:
+                    self._slots.release()
+                with self._lock:
+                    self._lags.append(time.perf_counter() - queued_time)
+            else:
+                if writer is not None:
+                    writer.release()
+                    writer = None
+                    if value is not None and os.path.exists(path):
+                        os.replace(path, value)
+                        with self._lock:
+                            self._written.append(value)
+                if path is not None and os.path.exists(path):
+                    os.remove(path)  # discarded episode
+                path = None